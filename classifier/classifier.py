@@ -1,6 +1,13 @@
+from itertools import izip, tee
+
 import numpy as np
-from crawler.crawl import crawl_urls
-from crawler.text_extraction import extract_texts
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfVectorizer
+from crawler.batch_extraction import (extract_sites, extraction_params,
+                                      iter_extract_sites)
+from crawler.crawl import crawl_urls, iter_crawl
+from crawler.metrics import incr, timer
+from crawler.streaming import chunks
 
 
 class RestaurantClassifier(object):
@@ -34,39 +41,214 @@ class RestaurantClassifier(object):
         return crawl_urls(urls, max_depth=self.text_params['max_depth'],
                           max_links=self.text_params['max_links'])
 
-    def htmls2docs(self, htmls):
+    def htmls2docs(self, htmls, workers=None):
         """ Convert HTMLs to text documents using the params specified in
-            `text_params`.
+            `text_params`. Extraction runs in `workers` processes (see
+            `crawler.batch_extraction.extract_sites`).
+        """
+        return [' '.join(doc) for doc in extract_sites(
+            htmls, workers=workers,
+            **extraction_params(self.text_params))]
+
+    def htmls2counts(self, htmls, workers=None):
+        """ Convert HTMLs to a sparse matrix with the weighted term counts
+            of each site, as the vectorizer of the classifier would count
+            them in the documents of `htmls2docs`, but without building the
+            documents with repeated text (see
+            `crawler.text_extraction.extract_weighted_texts`).
+        """
+        return weighted_count_matrix(extract_sites(
+            htmls, workers=workers, weighted=True,
+            **extraction_params(self.text_params)), self._vectorizer())
+
+    def _vectorizer(self):
+        """ Return the vectorizer, i.e. the first step, of the classifier
+            pipeline. Weighted counts only get the term counts of the
+            vectorizer, so a tf-idf weighting has to be a separate
+            `TfidfTransformer` step after a `CountVectorizer`.
+        """
+        if not hasattr(self.classifier, 'steps'):
+            raise ValueError('Weighted counts need a classifier pipeline '
+                             'that starts with a vectorizer')
+        vectorizer = self.classifier.steps[0][1]
+        if isinstance(vectorizer, TfidfVectorizer):
+            raise ValueError('Weighted counts need a CountVectorizer '
+                             'followed by a TfidfTransformer step instead '
+                             'of a TfidfVectorizer')
+        return vectorizer
+
+    def _transform_counts(self, counts):
+        """ Apply the pipeline steps after the term counting to a count
+            matrix and return the input of the final estimator.
         """
-        docs = []
-        for i, html in enumerate(htmls):
-            doc = extract_texts(
-                html,
-                title_weight=self.text_params['title_weight'],
-                header_weights=self.text_params['header_weights'],
-                use_pdf=self.text_params['use_pdf'],
-                use_stemmer=self.text_params['use_stemmer'],
-                ukkonen_len=self.text_params['ukkonen_len'],
-                homepage_weight=self.text_params['homepage_weight'])
-            docs.append(' '.join(doc))
-        return docs
-
-    def predict(self, urls, proba=True):
+        vectorizer = self._vectorizer()
+        if getattr(vectorizer, 'binary', False):
+            counts.data[:] = 1
+        for name, step in self.classifier.steps[1:-1]:
+            counts = step.transform(counts)
+        return counts
+
+    def iter_docs(self, urls, crawl_workers=None, extract_workers=None):
+        """ Crawl the sites of an iterable of URLs and yield `(url, doc)`
+            for each of them, in input order, as soon as its document is
+            extracted. `doc` is None if the crawl of the site failed. Only a
+            bounded number of sites is in memory at any time (see
+            `crawler.crawl.iter_crawl`). If the text parameter
+            `weighted_counts` is set, `doc` is the list of `(text, weight)`
+            pairs of `crawler.text_extraction.extract_weighted_texts`.
+
+            :param crawl_workers: Number of sites crawled in parallel
+                threads.
+            :param extract_workers: Number of extraction processes.
+        """
+        crawled, sites = tee(iter_crawl(
+            urls, max_depth=self.text_params['max_depth'],
+            max_links=self.text_params['max_links'], workers=crawl_workers))
+        weighted = self.text_params.get('weighted_counts', False)
+        # The extraction processes are forked here, before `iter_crawl`
+        # starts its threads on the first site taken below
+        docs = iter_extract_sites(
+            (htmls or [] for url, htmls in sites), workers=extract_workers,
+            weighted=weighted, **extraction_params(self.text_params))
+        for (url, htmls), doc in izip(crawled, docs):
+            if htmls is None:
+                yield url, None
+            else:
+                yield url, doc if weighted else ' '.join(doc)
+
+    def _rank(self, docs, proba=True, k=3):
+        """ Classify a list of documents, some of which may be None, and
+            return `(idx, scores)` as returned by `top_k` (None if all
+            documents are None) if `proba` is True, else an array of labels.
+            Rows for documents that are None are left out.
+        """
+        n_docs = len(docs)
+        docs = [doc for doc in docs if doc is not None]
+        incr('predict.sites', len(docs))
+        incr('predict.failed_sites', n_docs - len(docs))
+        if not docs:
+            return None
+        with timer('predict.classify'):
+            if self.text_params.get('weighted_counts', False):
+                features = self._transform_counts(
+                    weighted_count_matrix(docs, self._vectorizer()))
+                estimator = self.classifier.steps[-1][1]
+            else:
+                features, estimator = docs, self.classifier
+            if proba:
+                return top_k(estimator.predict_proba(features), k)
+            return estimator.predict(features)
+
+    def _predictions(self, docs, proba=True, k=3):
+        """ Return one prediction per document as described in `predict`,
+            or None for documents that are None.
+        """
+        ranked = self._rank(docs, proba, k)
+        if ranked is None:
+            return [None] * len(docs)
+        # Convert NumPy scalars to Python objects
+        if proba:
+            labels = np.asarray(self.label_names)[ranked[0]].tolist()
+            rows = iter(zip(l, s) for l, s in izip(labels,
+                                                   ranked[1].tolist()))
+        else:
+            rows = iter(np.asarray(ranked).tolist())
+        return [next(rows) if doc is not None else None for doc in docs]
+
+    def predict_iter(self, urls, proba=True, k=3, batch_size=8,
+                     crawl_workers=None, extract_workers=None):
+        """ Streaming version of `predict`: yield `(url, prediction)` for
+            every URL of an iterable, in input order, as soon as the sites
+            of a batch of `batch_size` URLs are classified. The prediction
+            is as described in `predict`.
+        """
+        for batch in chunks(self.iter_docs(urls, crawl_workers,
+                                           extract_workers), batch_size):
+            predictions = self._predictions(
+                [doc for url, doc in batch], proba, k)
+            for (url, doc), prediction in izip(batch, predictions):
+                yield url, prediction
+
+    def predict(self, urls, proba=True, k=3, structured=False):
         """ Given a URL (or list of URLs), predict the restaurant cuisine.
-            If `proba` is True, the three most probable labels are return along
-            with their respective probability.
+
+            :param urls: A URL or a list of URLs.
+            :param proba: If True, the `k` most probable labels are returned
+                along with their respective probability as a list of
+                `(label, probability)` tuples. Else the most probable label
+                is returned.
+            :param k: Number of labels returned per URL if `proba` is True.
+            :param structured: If True (and `proba` is True), return a NumPy
+                structured array of shape `(len(urls), k)` with the fields
+                `label` and `score` instead of lists. Rows of sites that
+                could not be crawled have NaN scores.
+
+            :return: The prediction for a single URL, else a list with the
+                prediction of each URL (None for sites that could not be
+                crawled).
         """
-        if isinstance(urls, str):
+        single = isinstance(urls, basestring)
+        if single:
             urls = [urls]
-        htmls = self.get_htmls(urls)
-        docs = self.htmls2docs(htmls)
-        if proba:
-            scores = self.classifier.predict_proba(docs)
-            for i in xrange(scores.shape[0]):
-                sc = scores[i, :]
-                idx = np.argsort(sc)[::-1]
-                sorted_scores = sc[idx]
-            return [(self.label_names[idx[0]], sorted_scores[0]),
-                    (self.label_names[idx[1]], sorted_scores[1]),
-                    (self.label_names[idx[2]], sorted_scores[2])]
-        return self.classifier.predict(docs)
+        docs = [doc for url, doc in self.iter_docs(urls)]
+        if proba and structured:
+            ranked = self._rank(docs, proba, k)
+            labels = np.asarray(self.label_names)
+            k = min(k, len(labels))
+            result = np.zeros((len(docs), k), dtype=[
+                ('label', labels.dtype), ('score', np.float64)])
+            result['score'] = np.nan
+            if ranked is not None:
+                ok = np.array([doc is not None for doc in docs])
+                result['label'][ok] = labels[ranked[0]]
+                result['score'][ok] = ranked[1]
+            return result[0] if single else result
+        predictions = self._predictions(docs, proba, k)
+        return predictions[0] if single else predictions
+
+
+def weighted_count_matrix(sites, vectorizer):
+    """ Return a CSR matrix with one row of term counts per site, where
+        every site is a list of `(text, weight)` pairs. The terms of a text
+        are produced by the analyzer of the fitted `vectorizer` (e.g. a
+        `CountVectorizer`) and counted `weight` times. Terms outside its
+        vocabulary are ignored.
+    """
+    analyze = vectorizer.build_analyzer()
+    vocabulary = vectorizer.vocabulary_
+    indptr = [0]
+    indices = []
+    values = []
+    for site in sites:
+        counts = {}
+        for text, weight in site:
+            for term in analyze(text):
+                j = vocabulary.get(term)
+                if j is not None:
+                    counts[j] = counts.get(j, 0) + weight
+        indices.extend(counts.iterkeys())
+        values.extend(counts.itervalues())
+        indptr.append(len(indices))
+    matrix = sp.csr_matrix(
+        (np.asarray(values, dtype=np.int64), np.asarray(indices, dtype=int),
+         indptr), shape=(len(indptr) - 1, len(vocabulary)))
+    matrix.sort_indices()
+    return matrix
+
+
+def top_k(scores, k):
+    """ Return the column indices and values of the `k` largest entries of
+        every row of the matrix `scores`, sorted in descending order, as two
+        arrays of shape `(n_rows, k)`. `k` is clipped to the number of
+        columns.
+    """
+    scores = np.asarray(scores)
+    k = min(k, scores.shape[1])
+    if k < scores.shape[1]:
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        idx = np.tile(np.arange(scores.shape[1]), (scores.shape[0], 1))
+    rows = np.arange(scores.shape[0])[:, np.newaxis]
+    order = np.argsort(-scores[rows, idx], axis=1, kind='mergesort')
+    idx = idx[rows, order]
+    return idx, scores[rows, idx]
@@ -1,9 +1,11 @@
 """ Module with some util functions for restaurant classifier data
     processing.
 """
-import shelve
+import warnings
 
-from crawler import crawl, text_extraction
+from crawler import crawl
+from crawler.batch_extraction import extract_sites, extraction_params
+from crawler.doc_cache import SiteCache, params_key
 
 
 def map_labels(labels):
@@ -20,6 +22,17 @@ def map_labels(labels):
     return label_ids, id_to_label
 
 
+def cache_db(text_params, name, old_name, default):
+    """ Return the cache database file `text_params[name]`, falling back to
+        the deprecated key `old_name` and then to `default`.
+    """
+    if name not in text_params and old_name in text_params:
+        warnings.warn('The text parameter %s is deprecated, use %s' % (
+            old_name, name), DeprecationWarning, stacklevel=3)
+        return text_params[old_name]
+    return text_params.get(name, default)
+
+
 def urls_to_htmls(urls, text_params):
     """ Given a list of urls and a dictionary with the text preprocessing
         parameters, return a list of extracted html for each url.
@@ -30,35 +43,41 @@ def urls_to_htmls(urls, text_params):
         max_links=text_params['max_links'],
         cache_htmls=text_params['cache_htmls'],
         append_htmls=text_params['append_htmls'],
-        shelve_db=text_params['shelve_db'])
+        cache_db=cache_db(text_params, 'html_cache_db', 'shelve_db',
+                          'html_cache.sqlite'))
 
 
 def htmls_to_docs(urls, htmls, text_params):
     """ Given a list of urls and a dictionary with text preprocessing
         parameters, return a list of extracted text for each html using.
+        Extraction runs in `text_params['extract_workers']` processes if
+        given (see `crawler.batch_extraction.extract_sites`).
+
+        If `text_params['cache_docs']` is True, the extracted page texts are
+        cached in the `SiteCache` `text_params['docs_cache_db']`, keyed by
+        url and the extraction and crawl parameters.
 
     """
-    docs = []
-    if text_params['cache_docs']:
-        db = shelve.open(text_params['docs_shelve'])
-    for url, html in zip(urls, htmls):
-        if text_params['cache_docs']:
-            if str(url) in db:
-                docs.append(db[str(url)])
-            else:
-                doc = text_extraction.extract_texts(
-                    html,
-                    title_weight=text_params['title_weight'],
-                    header_weights=text_params['header_weights'],
-                    use_pdf=text_params['use_pdf'],
-                    use_stmmer=text_params['use_stemmer'],
-                    ukkonen_len=text_params['ukkonen_len'],
-                    homepage_weight=text_params['homepage_weight'])
-                doc = ' '.join(doc)
-                docs.append(doc)
-                db[str(url)] = doc
+    params = extraction_params(text_params)
+    cache = None
     if text_params['cache_docs']:
-        db.close()
+        cache = SiteCache(cache_db(text_params, 'docs_cache_db',
+                                   'docs_shelve', 'docs_cache.sqlite'))
+        key = params_key(dict(params, max_depth=text_params.get('max_depth'),
+                              max_links=text_params.get('max_links')))
+    cached = [cache is not None and cache.has(url, key) for url in urls]
+    extracted = iter(extract_sites(
+        [html for html, c in zip(htmls, cached) if not c],
+        workers=text_params.get('extract_workers'), **params))
+    docs = []
+    for url, c in zip(urls, cached):
+        if c:
+            texts = cache.get(url, key)
+        else:
+            texts = next(extracted)
+            if cache is not None and texts:
+                cache.put(url, key, texts)
+        docs.append(' '.join(texts))
     return docs
 
 
@@ -0,0 +1,189 @@
+import numpy as np
+from nose.tools import eq_, raises
+from sklearn.feature_extraction.text import (
+    CountVectorizer, TfidfTransformer, TfidfVectorizer)
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import Pipeline
+
+from classifier import classifier as classifier_module
+from classifier.classifier import (
+    RestaurantClassifier, top_k, weighted_count_matrix)
+
+WORDS = {'italian': 'pizza pasta risotto',
+         'german': 'schnitzel bratwurst sauerkraut',
+         'greek': 'gyros souvlaki tzatziki'}
+
+TEXT_PARAMS = {'use_stemmer': False, 'title_weight': 2, 'max_links': 99,
+               'header_weights': [3, 3, 2, 2, 1, 1], 'homepage_weight': 2,
+               'ukkonen_len': 0, 'use_pdf': True, 'max_depth': 4}
+
+
+def site(label):
+    return ['<html><head><title>%s</title></head><body><h1>Menu</h1>'
+            '<p>%s restaurant</p></body></html>' % (label, WORDS[label]),
+            '<html><body><p>%s wine</p></body></html>' % WORDS[label]]
+
+
+# Crawl results of the fake crawl: None for sites that fail
+SITES = dict(('http://%s/' % label, site(label)) for label in WORDS)
+SITES['http://fail/'] = None
+
+
+class _FakeCrawl(object):
+    """ Replace `iter_crawl` of the classifier module by a lookup in
+        `SITES`, recording the URLs in `crawled`.
+    """
+    def __enter__(self):
+        self.iter_crawl = classifier_module.iter_crawl
+        self.crawled = []
+
+        def iter_crawl(urls, **kwargs):
+            for url in urls:
+                self.crawled.append(url)
+                yield url, SITES[url]
+        classifier_module.iter_crawl = iter_crawl
+        return self
+
+    def __exit__(self, *args):
+        classifier_module.iter_crawl = self.iter_crawl
+
+
+def fitted(text_params=None, vectorizer=None, tfidf=False):
+    """ Return a `RestaurantClassifier` with a pipeline fitted on the
+        documents of the fake sites, with a `TfidfTransformer` step if
+        `tfidf` is set.
+    """
+    text_params = dict(text_params or TEXT_PARAMS)
+    steps = [('vectorizer', vectorizer or CountVectorizer())]
+    if tfidf:
+        steps.append(('tfidf', TfidfTransformer()))
+    pipeline = Pipeline(steps + [('classifier', MultinomialNB())])
+    clf = RestaurantClassifier(pipeline, text_params, label_names=[])
+    labels = sorted(WORDS)
+    pipeline.fit(clf.htmls2docs([site(label) for label in labels]), labels)
+    clf.label_names = pipeline.classes_
+    return clf
+
+
+def test_top_k():
+    scores = np.array([[0.1, 0.5, 0.2, 0.2], [0.4, 0.3, 0.2, 0.1]])
+    idx, values = top_k(scores, 2)
+    eq_(idx.tolist(), [[1, 2], [0, 1]])
+    eq_(values.tolist(), [[0.5, 0.2], [0.4, 0.3]])
+    idx, values = top_k(scores, 10)
+    eq_(idx.tolist(), [[1, 2, 3, 0], [0, 1, 2, 3]])
+
+
+def test_predict_per_url():
+    clf = fitted()
+    urls = ['http://greek/', 'http://fail/', 'http://italian/',
+            'http://german/']
+    with _FakeCrawl():
+        predictions = clf.predict(urls, k=2)
+    eq_([p[0][0] if p else None for p in predictions],
+        ['greek', None, 'italian', 'german'])
+    for p in predictions:
+        if p is not None:
+            eq_(len(p), 2)
+            assert type(p[0][0]) is str
+            assert type(p[0][1]) is float
+            assert p[0][1] >= p[1][1]
+    with _FakeCrawl():
+        eq_(clf.predict('http://german/', k=1)[0][0], 'german')
+        labels = clf.predict(urls, proba=False)
+    eq_(labels, ['greek', None, 'italian', 'german'])
+    assert type(labels[0]) is str
+
+
+def test_k_larger_than_classes():
+    clf = fitted()
+    with _FakeCrawl():
+        prediction = clf.predict('http://italian/', k=10)
+    eq_(len(prediction), 3)
+    eq_(sorted(label for label, score in prediction), sorted(WORDS))
+    assert abs(sum(score for label, score in prediction) - 1) < 1e-9
+
+
+def test_structured():
+    clf = fitted()
+    urls = ['http://italian/', 'http://german/', 'http://fail/']
+    with _FakeCrawl():
+        result = clf.predict(urls, k=5, structured=True)
+    eq_(result.shape, (3, 3))
+    eq_(result['label'][:2, 0].tolist(), ['italian', 'german'])
+    assert not np.isnan(result['score'][:2]).any()
+    assert np.isnan(result['score'][2]).all()
+    with _FakeCrawl():
+        eq_(clf.predict(['http://fail/'], structured=True)['score'].shape,
+            (1, 3))
+
+
+def test_iter_docs_order():
+    clf = fitted()
+    urls = ['http://german/', 'http://fail/', 'http://italian/']
+    with _FakeCrawl() as crawl:
+        docs = list(clf.iter_docs(urls))
+    eq_(crawl.crawled, urls)
+    eq_([url for url, doc in docs], urls)
+    eq_(docs[1][1], None)
+    eq_(docs[0][1], clf.htmls2docs([site('german')])[0])
+
+
+def test_predict_iter_matches_predict():
+    clf = fitted()
+    urls = ['http://greek/', 'http://fail/', 'http://italian/',
+            'http://german/', 'http://fail/']
+    with _FakeCrawl():
+        expected = clf.predict(urls)
+        streamed = list(clf.predict_iter(iter(urls), batch_size=2))
+    eq_(streamed, zip(urls, expected))
+
+
+def weighted_fitted(vectorizer, tfidf=False):
+    return fitted(dict(TEXT_PARAMS, weighted_counts=True), vectorizer, tfidf)
+
+
+def test_weighted_counts_match_repeated_documents():
+    for vectorizer, tfidf in ((CountVectorizer(), False),
+                              (CountVectorizer(binary=True), False),
+                              (CountVectorizer(), True)):
+        clf = weighted_fitted(vectorizer, tfidf)
+        htmls = [site(label) for label in sorted(WORDS)]
+        vec = clf._vectorizer()
+        docs = clf.htmls2docs(htmls)
+        counts = clf.htmls2counts(htmls)
+        expected = CountVectorizer(vocabulary=vec.vocabulary_).transform(docs)
+        eq_((counts != expected).nnz, 0)
+        transformed = vec.transform(docs)
+        if tfidf:
+            transformed = clf.classifier.steps[1][1].transform(transformed)
+        assert np.allclose(clf._transform_counts(counts).toarray(),
+                           transformed.toarray())
+
+
+@raises(ValueError)
+def test_weighted_counts_reject_tfidf_vectorizer():
+    weighted_fitted(TfidfVectorizer())._vectorizer()
+
+
+def test_weighted_predictions():
+    clf = weighted_fitted(CountVectorizer(), tfidf=True)
+    urls = ['http://greek/', 'http://fail/', 'http://german/']
+    with _FakeCrawl():
+        weighted = clf.predict(urls)
+        clf.text_params['weighted_counts'] = False
+        repeated = clf.predict(urls)
+    eq_([p and [l for l, s in p] for p in weighted],
+        [p and [l for l, s in p] for p in repeated])
+    for w, r in zip(weighted, repeated):
+        if w is not None:
+            assert np.allclose([s for l, s in w], [s for l, s in r])
+
+
+def test_weighted_count_matrix():
+    vec = CountVectorizer().fit(['pizza pasta vino'])
+    matrix = weighted_count_matrix(
+        [[('pizza pasta', 1), ('pizza', 3)], [], [('unknown vino', 2)]], vec)
+    eq_(matrix.toarray().tolist(),
+        vec.transform(['pizza pasta pizza pizza pizza', '',
+                       'vino vino']).toarray().tolist())
@@ -0,0 +1,18 @@
+import warnings
+
+from nose.tools import eq_
+
+from classifier.classifier_utils import cache_db
+
+
+def test_cache_db():
+    eq_(cache_db({}, 'html_cache_db', 'shelve_db', 'default.sqlite'),
+        'default.sqlite')
+    eq_(cache_db({'html_cache_db': 'new.sqlite', 'shelve_db': 'old'},
+                 'html_cache_db', 'shelve_db', 'default.sqlite'),
+        'new.sqlite')
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        eq_(cache_db({'shelve_db': 'old'}, 'html_cache_db', 'shelve_db',
+                     'default.sqlite'), 'old')
+    eq_([w.category for w in caught], [DeprecationWarning])
@@ -6,10 +6,101 @@ except ImportError:
     local_settings = object
 
 CRAWLER_VERBOSE = True
+# Crawler I/O backend: 'fs', 'segments', 'sqlite' or 'rethinkdb'. If None,
+# CRAWLER_USE_RETHINK and CRAWLER_USE_SEGMENTS pick one of them.
+CRAWLER_IO_BACKEND = None
 CRAWLER_USE_RETHINK = False
 CRAWLER_PATH = './.crawler'
+# Database file of the 'sqlite' backend (None for crawler.db in CRAWLER_PATH)
+# and seconds a write waits for a concurrent writer
+CRAWLER_SQLITE_PATH = None
+CRAWLER_SQLITE_TIMEOUT = 30.0
+# Store cached pages in compressed, deduplicated segment files instead of one
+# pickle per URL; compression is 'zlib' or 'zstd', segment size in bytes
+CRAWLER_USE_SEGMENTS = False
+CRAWLER_SEGMENT_COMPRESSION = 'zlib'
+CRAWLER_SEGMENT_SIZE = 256 * 1024 * 1024
+# Minimum seconds between two reads of the redirects and errors logs of the
+# 'fs' and 'segments' backends for entries added by other processes
+CRAWLER_LOG_REFRESH_INTERVAL = 1.0
+# Writes buffered by the RethinkDB backend before a batched insert, and number
+# of URLs whose prefetched rows are kept in memory
+CRAWLER_RETHINK_BATCH_SIZE = 100
+CRAWLER_RETHINK_CACHE_SIZE = 10000
+# Number of threads used to download the pages of a single site
+CRAWLER_SITE_WORKERS = 8
+# Number of sites crawled in parallel by `crawl_urls`
+CRAWLER_WORKERS = 1
+# Maximum number of concurrent requests per host (0 for no limit)
+CRAWLER_HOST_CONCURRENCY = 4
+# Minimum delay in seconds between two requests to the same host
+CRAWLER_HOST_DELAY = 0.0
+# Connect and read timeouts of HTTP requests in seconds
+CRAWLER_CONNECT_TIMEOUT = 10.0
+CRAWLER_READ_TIMEOUT = 30.0
+# Maximum size of a downloaded page in bytes
+CRAWLER_MAX_RESPONSE_SIZE = 20 * 1024 * 1024
+# Retries on connection errors and 5xx responses, with exponential backoff
+CRAWLER_RETRIES = 2
+CRAWLER_RETRY_BACKOFF = 0.5
+# Maximum number of kept-alive connections per host
+CRAWLER_POOL_SIZE = 16
+# Seconds after which a cached page is revalidated with a conditional
+# request (ETag / Last-Modified). None means cached pages never expire.
+CRAWLER_CACHE_MAX_AGE = None
+# Query parameters removed from URLs before crawling (comma-separated, a
+# trailing '*' matches any suffix) and whether URLs are lowercased
+CRAWLER_STRIP_QUERY_PARAMS = 'phpsessid,sid,sessionid,jsessionid,utm_*'
+CRAWLER_URL_CASE_FOLD = False
+# Pages whose SimHash differs in at most this many bits from an earlier page
+# of the same crawl are skipped as near-duplicates, e.g. 3 (None disables the
+# duplicate detection)
+CRAWLER_SIMHASH_DISTANCE = None
+# BeautifulSoup parser backend, e.g. 'lxml' (None picks the best installed)
+CRAWLER_HTML_PARSER = None
+# Number of processes extracting documents, sites sent to a process at once
+# and the maximum number of seconds spent on a single document
+EXTRACT_WORKERS = 1
+EXTRACT_CHUNKSIZE = 4
+EXTRACT_DOC_TIMEOUT = 60.0
+# Limits of the text extraction from PDFs: maximum number of pages (0 for
+# all), size in bytes above which PDFs are skipped, seconds after which the
+# text extracted so far is returned, and whether to run the layout analysis
+PDF_MAX_PAGES = 50
+PDF_MAX_BYTES = 10 * 1024 * 1024
+PDF_TIME_BUDGET = 20.0
+PDF_LAYOUT = True
+# Extract PDFs in a child process that is killed after PDF_ISOLATED_TIMEOUT
+# seconds (also stops code that the time budget cannot interrupt)
+PDF_ISOLATED = False
+PDF_ISOLATED_TIMEOUT = 30.0
+# Collect the counters and timers of `crawler.metrics`, and the file they are
+# written to at exit (None for none, Prometheus format if it ends in '.prom')
+METRICS_ENABLED = True
+METRICS_FILE = None
+# URLs of sites whose crawl is profiled with cProfile (comma-separated), and
+# the directory the profiles are written to
+PROFILE_SITES = None
+PROFILE_DIR = './.crawler/profiles'
+# Number of memoized word stems per language
+STEMMER_CACHE_SIZE = 100000
+# Number of characters sampled from a text for language detection (None for
+# the whole text) and the seed of the language detector
+LANGDETECT_SAMPLE_SIZE = 2000
+LANGDETECT_SEED = 0
+# Shingle size in words and minimum number of pages of the cross-page
+# template detection
+BOILERPLATE_SHINGLE_SIZE = 8
+BOILERPLATE_MIN_PAGES = 3
 
 
-def get_config(key):
-    return os.environ.get(key) if os.environ.get(key) is not None else getattr(
-        local_settings, key, globals().get(key))
+def get_config(key, cast=None):
+    """ Return the setting `key` from the environment, `local_settings` or
+        this module (in that order). If `cast` is given, it is applied to
+        values that are not None (environment values are always strings).
+    """
+    value = os.environ.get(key) if os.environ.get(key) is not None else \
+        getattr(local_settings, key, globals().get(key))
+    if cast is not None and value is not None:
+        return cast(value)
+    return value
@@ -0,0 +1,153 @@
+""" Extraction of documents for many sites at once, in parallel processes.
+
+    Usage example:
+
+        >>> docs = extract_sites(htmls, workers=8, doc_timeout=30,
+        ...                      **extraction_params(text_params))
+
+    `htmls` is a list with one list of HTML documents per site, as returned
+    by `crawl.crawl_urls`. The result holds one list of documents per site,
+    in the same order. `iter_extract_sites` yields the documents of each
+    site as soon as they are ready instead.
+"""
+from itertools import imap
+from multiprocessing import Pool
+
+from config import get_config
+from crawler import metrics
+from crawler.metrics import Metrics, get_metrics, incr, timer
+from crawler.streaming import bounded_imap, chunks
+from crawler.text_extraction import extract_texts, extract_weighted_texts
+
+
+def extraction_params(text_params):
+    """ Return the keyword arguments of `extract_texts` for a dictionary of
+        text parameters as used by the classifier.
+    """
+    return {'title_weight': text_params['title_weight'],
+            'header_weights': text_params['header_weights'],
+            'use_pdf': text_params['use_pdf'],
+            'use_stemmer': text_params['use_stemmer'],
+            'ukkonen_len': text_params['ukkonen_len'],
+            'hp_weight': text_params['homepage_weight'],
+            'site_lang': text_params.get('site_lang', False),
+            'template_fraction': text_params.get('template_fraction')}
+
+
+def _extract_site(args):
+    htmls, weighted, params = args
+    incr('extract.docs', len(htmls))
+    with timer('extract.site'):
+        if weighted:
+            return extract_weighted_texts(htmls, **params)
+        return extract_texts(htmls, **params)
+
+
+def _init_worker():
+    # Forget the metrics inherited from the parent process. They are
+    # replaced instead of reset, since their lock may have been held by
+    # another thread of the parent when it forked.
+    metrics.metrics = Metrics(get_config('METRICS_ENABLED'))
+
+
+def _extract_chunk(tasks):
+    """ Extract a chunk of sites in a worker process and return the
+        documents together with the metrics collected meanwhile.
+    """
+    return map(_extract_site, tasks), get_metrics().drain()
+
+
+def iter_extract_sites(html_lists, workers=None, chunksize=None,
+                       doc_timeout=None, max_pending=None, weighted=False,
+                       **params):
+    """ Apply `extract_texts` to the HTMLs of every site and yield the list
+        of documents of each site, in input order. Sites are taken from
+        `html_lists` only as fast as the results are consumed, so an
+        iterable over many sites is processed in bounded memory.
+
+        :param html_lists: An iterable with one list of HTMLs per site.
+        :param workers: Number of worker processes. Default is the
+            EXTRACT_WORKERS setting; 1 extracts in the current process.
+        :param chunksize: Number of sites sent to a worker at once. Default
+            is the EXTRACT_CHUNKSIZE setting.
+        :param doc_timeout: Maximum number of seconds spent on a single
+            document; documents that take longer yield an empty text.
+            Default is the EXTRACT_DOC_TIMEOUT setting.
+        :param max_pending: Maximum number of chunks being extracted ahead
+            of the consumer. Default is twice the number of workers.
+        :param weighted: If True, yield the `(text, weight)` pairs of
+            `extract_weighted_texts` for each site instead.
+        :param params: Further keyword arguments of `extract_texts`.
+
+        The worker processes are forked by this call, before the first
+        site is taken from `html_lists`, so that they do not inherit locks
+        held by threads the caller starts afterwards (e.g. the crawl threads
+        of `crawl.iter_crawl` producing `html_lists`). They are terminated
+        once the returned iterator is exhausted, closed with `close()` or
+        garbage collected, even if it was never started. The metrics (see
+        `crawler.metrics`) collected by the worker processes are added to
+        those of the calling process.
+    """
+    if workers is None:
+        workers = get_config('EXTRACT_WORKERS', int)
+    if chunksize is None:
+        chunksize = get_config('EXTRACT_CHUNKSIZE', int)
+    if doc_timeout is None:
+        doc_timeout = get_config('EXTRACT_DOC_TIMEOUT', float)
+    if max_pending is None:
+        max_pending = 2 * workers
+    params['doc_timeout'] = doc_timeout
+    tasks = ((htmls, weighted, params) for htmls in html_lists)
+    if workers <= 1:
+        return imap(_extract_site, tasks)
+    return _PoolResults(Pool(workers, _init_worker), tasks, chunksize,
+                        max_pending)
+
+
+class _PoolResults(object):
+    """ Iterator over the documents extracted by a worker pool, which
+        terminates the pool when it is exhausted, closed or deleted.
+    """
+    def __init__(self, pool, tasks, chunksize, max_pending):
+        self.pool = pool
+        self.results = _iter_pool(pool, tasks, chunksize, max_pending)
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        return next(self.results)
+
+    def close(self):
+        if self.pool is not None:
+            # Runs the cleanup of `_iter_pool` if it was started
+            self.results.close()
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+
+    def __del__(self):
+        self.close()
+
+
+def _iter_pool(pool, tasks, chunksize, max_pending):
+    try:
+        for docs_chunk, worker_metrics in bounded_imap(
+                pool, _extract_chunk, chunks(tasks, chunksize), max_pending):
+            get_metrics().merge(worker_metrics)
+            for docs in docs_chunk:
+                yield docs
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def extract_sites(html_lists, workers=None, chunksize=None, doc_timeout=None,
+                  weighted=False, **params):
+    """ Apply `extract_texts` to the HTMLs of every site. The arguments are
+        those of `iter_extract_sites`.
+
+        :return: A list with one list of documents per site, in input order.
+    """
+    return list(iter_extract_sites(html_lists, workers, chunksize,
+                                   doc_timeout, weighted=weighted, **params))
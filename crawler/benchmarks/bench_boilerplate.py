@@ -0,0 +1,59 @@
+""" Benchmark of the repeated boilerplate removal on synthetic documents with
+    many repeated blocks (menus, footers).
+
+    Usage:
+
+        python -m crawler.benchmarks.bench_boilerplate
+
+    The former Ukkonen-based implementation is only measured if the
+    `ukkonen` extension is installed.
+"""
+import random
+import time
+
+from crawler.text_extraction import (
+    remove_repeated_long_strings, remove_repeated_long_strings_ukkonen)
+
+
+def synthetic_document(n_pages, n_blocks=5, block_words=40, page_words=200,
+                       seed=0):
+    """ Return a document that concatenates `n_pages` pages, each made of
+        unique words and the same `n_blocks` boilerplate blocks.
+    """
+    rand = random.Random(seed)
+    vocabulary = ['word%d' % i for i in xrange(5000)]
+    blocks = [' '.join(rand.choice(vocabulary) for i in xrange(block_words))
+              for j in xrange(n_blocks)]
+    pages = []
+    for i in xrange(n_pages):
+        content = [rand.choice(vocabulary) for j in xrange(page_words)]
+        pages.append(' '.join(blocks[:n_blocks // 2] + content +
+                              blocks[n_blocks // 2:]))
+    return ' '.join(pages)
+
+
+def measure(func, doc, minlen):
+    start = time.time()
+    out = func(doc, minlen)
+    return time.time() - start, len(out)
+
+
+def main(minlen=100):
+    try:
+        import ukkonen  # noqa
+        functions = [remove_repeated_long_strings,
+                     remove_repeated_long_strings_ukkonen]
+    except ImportError:
+        functions = [remove_repeated_long_strings]
+    print '%8s %10s  %-38s %8s %10s' % (
+        'pages', 'chars', 'function', 'seconds', 'out chars')
+    for n_pages in [5, 20, 50, 100]:
+        doc = synthetic_document(n_pages)
+        for func in functions:
+            seconds, out_len = measure(func, doc, minlen)
+            print '%8d %10d  %-38s %8.3f %10d' % (
+                n_pages, len(doc), func.__name__, seconds, out_len)
+
+
+if __name__ == '__main__':
+    main()
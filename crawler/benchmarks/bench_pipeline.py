@@ -0,0 +1,311 @@
+""" End-to-end benchmark of crawling, text extraction and classification on
+    a corpus of restaurant sites served by local replay servers, so that no
+    live website is hit and every run sees the same pages.
+
+    Usage:
+
+        python -m crawler.benchmarks.bench_pipeline --output results.json
+        python -m crawler.benchmarks.bench_pipeline --baseline results.json
+
+    The corpus is generated deterministically from `--seed`, or read from a
+    recorded corpus directory (`--corpus`, see `load_corpus`). It contains
+    HTML pages and a PDF menu per site. The benchmark measures pages per
+    second of `crawl.crawl_urls`, documents per second of
+    `text_extraction.extract_texts`, predictions per second of
+    `RestaurantClassifier.predict` (including its crawl) and the peak memory
+    of the process. The results are printed and written as JSON, together
+    with the counters and timers of `crawler.metrics`; with `--baseline`,
+    the change of every rate against an earlier result file is printed as
+    well.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import tempfile
+import time
+
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.naive_bayes import MultinomialNB
+from sklearn.pipeline import Pipeline
+
+from classifier.classifier import RestaurantClassifier
+from crawler import crawl
+from crawler.batch_extraction import extraction_params
+from crawler.io_fs import IoFs
+from crawler.metrics import get_metrics
+from crawler.testing import SiteServer, make_pdf
+from crawler.text_extraction import extract_texts
+
+CUISINES = {
+    'italian': ['pizza', 'pasta', 'risotto', 'lasagne', 'antipasti',
+                'mozzarella', 'tiramisu', 'gnocchi', 'parmigiana', 'espresso',
+                'bruschetta', 'carpaccio', 'ravioli', 'panna', 'cotta'],
+    'german': ['schnitzel', 'bratwurst', 'sauerkraut', 'knoedel', 'spaetzle',
+               'brezel', 'schweinebraten', 'rotkohl', 'apfelstrudel', 'bier',
+               'kartoffelsalat', 'leberkaese', 'maultaschen', 'haxe', 'senf'],
+    'asian': ['sushi', 'ramen', 'curry', 'tofu', 'wok', 'dim', 'sum', 'pho',
+              'teriyaki', 'tempura', 'kimchi', 'bento', 'miso', 'satay',
+              'noodles'],
+    'greek': ['gyros', 'souvlaki', 'tzatziki', 'moussaka', 'feta', 'ouzo',
+              'calamari', 'dolmades', 'pita', 'halloumi', 'baklava',
+              'stifado', 'bifteki', 'oliven', 'retsina'],
+}
+
+COMMON_WORDS = ['restaurant', 'menu', 'reservation', 'opening', 'hours',
+                'table', 'welcome', 'kitchen', 'dinner', 'lunch', 'fresh',
+                'chef', 'wine', 'dessert', 'contact', 'address', 'phone',
+                'guests', 'evening', 'family', 'tradition', 'seasonal']
+
+PAGES = ['menu', 'about', 'contact', 'events', 'gallery', 'drinks', 'lunch',
+         'catering', 'team', 'news', 'offers', 'location']
+
+
+def _text(rand, vocabulary, n_words):
+    return ' '.join(rand.choice(vocabulary) for i in xrange(n_words))
+
+
+def restaurant_site(rand, label, n_pages=6, page_words=150):
+    """ Return a dictionary mapping paths to the pages of a synthetic
+        restaurant site of the cuisine `label`: a homepage linking to
+        `n_pages` HTML pages and a PDF menu.
+    """
+    vocabulary = CUISINES[label] + COMMON_WORDS * 2
+    name = _text(rand, CUISINES[label], 2).title()
+    paths = ['/%s.html' % page for page in PAGES[:n_pages]] + ['/menu.pdf']
+    nav = '<ul>%s</ul>' % ''.join(
+        '<li><a href="%s">%s</a></li>' % (path, path[1:].split('.')[0])
+        for path in paths)
+    footer = '<p>Restaurant %s, Hauptstrasse %d, 10115 Berlin</p>' % (
+        name, rand.randint(1, 200))
+
+    def page(title):
+        paragraphs = ''.join('<p>%s</p>' % _text(rand, vocabulary,
+                                                 page_words // 3)
+                             for i in xrange(3))
+        return ('<html><head><title>%s - %s</title></head><body>%s'
+                '<h1>%s</h1><h2>%s</h2>%s%s</body></html>' % (
+                    name, title, nav, title.title(),
+                    _text(rand, vocabulary, 4), paragraphs, footer))
+
+    pages = {'/': page('home')}
+    for path in paths[:-1]:
+        pages[path] = page(path[1:].split('.')[0])
+    pages['/menu.pdf'] = make_pdf([_text(rand, CUISINES[label], 12)
+                                   for i in xrange(3)])
+    return pages
+
+
+def synthetic_corpus(n_sites, n_pages=6, page_words=150, seed=0):
+    """ Return a list of `(label, pages)` pairs of `n_sites` synthetic
+        restaurant sites (see `restaurant_site`), cycling through the
+        cuisines.
+    """
+    rand = random.Random(seed)
+    labels = sorted(CUISINES)
+    return [(labels[i % len(labels)],
+             restaurant_site(rand, labels[i % len(labels)], n_pages,
+                             page_words))
+            for i in xrange(n_sites)]
+
+
+def _site_file(dirname, path):
+    return os.path.join(dirname, 'index.html' if path == '/' else path[1:])
+
+
+def save_corpus(corpus, dirname):
+    """ Write a corpus as a directory tree `dirname/<label>/<site>/<path>`,
+        e.g. to keep a recorded corpus. The homepage is stored as
+        `index.html`.
+    """
+    for i, (label, pages) in enumerate(corpus):
+        site_dir = os.path.join(dirname, label, 'site%04d' % i)
+        for path, body in pages.iteritems():
+            filename = _site_file(site_dir, path)
+            if not os.path.exists(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            with open(filename, 'wb') as f:
+                f.write(body)
+
+
+def load_corpus(dirname):
+    """ Read a corpus written by `save_corpus`, sorted by label and site
+        directory.
+    """
+    corpus = []
+    for label in sorted(os.listdir(dirname)):
+        for site in sorted(os.listdir(os.path.join(dirname, label))):
+            site_dir = os.path.join(dirname, label, site)
+            pages = {}
+            for root, dirs, files in os.walk(site_dir):
+                for filename in files:
+                    path = os.path.join(root, filename)
+                    url_path = '/' + os.path.relpath(path, site_dir)
+                    if url_path == '/index.html':
+                        url_path = '/'
+                    with open(path, 'rb') as f:
+                        pages[url_path] = f.read()
+            corpus.append((label, pages))
+    return corpus
+
+
+def peak_memory_kb():
+    """ Return the peak resident set size of this process and of its
+        terminated children (extraction workers) in kilobytes.
+    """
+    scale = 1024 if platform.system() == 'Darwin' else 1
+    return {
+        'self': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale,
+        'children':
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale}
+
+
+def measure(func, *args, **kwargs):
+    """ Return the result of calling `func` and the seconds it took. """
+    start = time.time()
+    result = func(*args, **kwargs)
+    return result, time.time() - start
+
+
+def _stage(count, seconds, unit):
+    return {'count': count, 'seconds': round(seconds, 4),
+            unit: round(count / seconds, 3) if seconds > 0 else None,
+            'peak_memory_kb': peak_memory_kb()}
+
+
+def _train(docs, labels):
+    classifier = Pipeline([('vectorizer', CountVectorizer()),
+                           ('classifier', MultinomialNB())])
+    classifier.fit(docs, labels)
+    return classifier
+
+
+def run(corpus, text_params=None, crawl_workers=4):
+    """ Serve `corpus` with one `SiteServer` per site, run the stages and
+        return their results. Every crawl starts with an empty crawler
+        cache.
+    """
+    labels = [label for label, pages in corpus]
+    servers = [SiteServer(pages) for label, pages in corpus]
+    tmpdir = tempfile.mkdtemp()
+    saved_io = crawl.crawler_io
+    try:
+        for server in servers:
+            server.start()
+        urls = [server.url('/') for server in servers]
+        clf = RestaurantClassifier(None, text_params, sorted(CUISINES))
+        crawl.crawler_io = IoFs(os.path.join(tmpdir, 'crawl'))
+        htmls, seconds = measure(
+            crawl.crawl_urls, urls, max_depth=clf.text_params['max_depth'],
+            max_links=clf.text_params['max_links'], workers=crawl_workers)
+        results = {'crawl': _stage(sum(len(h) for h in htmls), seconds,
+                                   'pages_per_second')}
+
+        params = extraction_params(clf.text_params)
+        start = time.time()
+        texts = [extract_texts(h, **params) for h in htmls]
+        results['extract'] = _stage(sum(len(h) for h in htmls),
+                                    time.time() - start, 'docs_per_second')
+
+        clf.classifier, seconds = measure(
+            _train, [' '.join(t) for t in texts], labels)
+        results['train'] = _stage(len(texts), seconds, 'sites_per_second')
+
+        crawl.crawler_io = IoFs(os.path.join(tmpdir, 'predict'))
+        predictions, seconds = measure(clf.predict, urls, proba=False)
+        results['predict'] = _stage(len(urls), seconds,
+                                    'predictions_per_second')
+        results['predict']['accuracy'] = round(sum(
+            p == l for p, l in zip(predictions, labels)) / float(len(urls)),
+            4)
+        return results
+    finally:
+        crawl.crawler_io = saved_io
+        # Close the kept-alive connections before the servers go away
+        if crawl.http_client is not None:
+            crawl.http_client.session.close()
+        for server in servers:
+            if server.thread is not None:
+                server.stop()
+        shutil.rmtree(tmpdir)
+
+
+RATES = [('crawl', 'pages_per_second'), ('extract', 'docs_per_second'),
+         ('predict', 'predictions_per_second')]
+
+
+def compare(results, baseline):
+    """ Return `(stage, rate, baseline rate, relative change)` for the
+        rates of two result dictionaries.
+    """
+    rows = []
+    for stage, rate in RATES:
+        old = baseline['stages'].get(stage, {}).get(rate)
+        new = results['stages'][stage][rate]
+        change = (new - old) / old if old and new is not None else None
+        rows.append((stage, new, old, change))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sites', type=int, default=20,
+                        help='number of synthetic sites')
+    parser.add_argument('--pages', type=int, default=6,
+                        help='HTML pages per synthetic site (at most %d)' %
+                        len(PAGES))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--corpus', help='recorded corpus directory')
+    parser.add_argument('--save-corpus', help='write the corpus to this '
+                        'directory and exit')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='sites crawled in parallel')
+    parser.add_argument('--output', help='JSON result file')
+    parser.add_argument('--baseline', help='JSON result file of an earlier '
+                        'run to compare with')
+    args = parser.parse_args()
+
+    if args.corpus:
+        corpus = load_corpus(args.corpus)
+    else:
+        corpus = synthetic_corpus(args.sites, args.pages, seed=args.seed)
+    if args.save_corpus:
+        save_corpus(corpus, args.save_corpus)
+        return
+    results = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'corpus': {'source': args.corpus or 'synthetic', 'seed': args.seed,
+                   'sites': len(corpus),
+                   'pages': sum(len(pages) for label, pages in corpus)},
+        'stages': run(corpus, crawl_workers=args.workers),
+        'metrics': get_metrics().snapshot()}
+
+    print '%-10s %8s %10s %14s %12s' % (
+        'stage', 'count', 'seconds', 'per second', 'peak RSS kB')
+    for stage in ['crawl', 'extract', 'train', 'predict']:
+        r = results['stages'][stage]
+        rate = [v for k, v in r.items() if k.endswith('_per_second')][0]
+        print '%-10s %8d %10.3f %14.2f %12d' % (
+            stage, r['count'], r['seconds'], rate or 0,
+            r['peak_memory_kb']['self'])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print
+        print '%-10s %14s %14s %8s' % ('stage', 'per second', 'baseline',
+                                       'change')
+        for stage, new, old, change in compare(results, baseline):
+            print '%-10s %14.2f %14s %8s' % (
+                stage, new or 0, '%.2f' % old if old else '-',
+                '%+.1f%%' % (100 * change) if change is not None else '-')
+
+
+if __name__ == '__main__':
+    main()
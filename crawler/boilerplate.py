@@ -0,0 +1,67 @@
+""" Detection of template text (navigation, headers, footers) that repeats
+    across the pages of a site.
+
+    Usage example:
+
+        >>> docs = remove_site_boilerplate(docs, min_fraction=0.6)
+
+"""
+import math
+from collections import defaultdict
+
+from config import get_config
+
+
+def shingle_hashes(words, size):
+    """ Return the hashes of all runs of `size` consecutive words. Texts with
+        fewer words yield a single hash of all words.
+    """
+    if len(words) <= size:
+        return [hash(tuple(words))] if words else []
+    return [hash(tuple(words[i:i + size]))
+            for i in xrange(len(words) - size + 1)]
+
+
+def remove_site_boilerplate(docs, min_fraction=0.6, shingle_size=None,
+                            min_pages=None):
+    """ Remove the text blocks that appear on most pages of a site.
+
+        Every document is cut into shingles of `shingle_size` words. A
+        shingle is template text if it occurs in at least `min_fraction` of
+        the non-empty documents (and in at least two). Words covered by a
+        template shingle are dropped from every document.
+
+        :param docs: List of extracted documents of one site.
+        :param min_fraction: Fraction of pages a shingle must appear on.
+        :param shingle_size: Number of words per shingle. Default is the
+            BOILERPLATE_SHINGLE_SIZE setting.
+        :param min_pages: Sites with fewer non-empty documents are returned
+            unchanged. Default is the BOILERPLATE_MIN_PAGES setting.
+    """
+    if shingle_size is None:
+        shingle_size = get_config('BOILERPLATE_SHINGLE_SIZE', int)
+    if min_pages is None:
+        min_pages = get_config('BOILERPLATE_MIN_PAGES', int)
+    words = [doc.split() for doc in docs]
+    hashes = [shingle_hashes(w, shingle_size) for w in words]
+    n_pages = sum(1 for h in hashes if h)
+    if n_pages < max(min_pages, 2):
+        return docs
+    df = defaultdict(int)
+    for h in hashes:
+        for shingle in set(h):
+            df[shingle] += 1
+    threshold = max(2, int(math.ceil(min_fraction * n_pages)))
+    result = []
+    for doc, w, h in zip(docs, words, hashes):
+        template = [df[shingle] >= threshold for shingle in h]
+        if not any(template):
+            result.append(doc)
+            continue
+        span = min(shingle_size, len(w))
+        keep = [True] * len(w)
+        for i, is_template in enumerate(template):
+            if is_template:
+                keep[i:i + span] = [False] * span
+        result.append(' '.join(x for x, k in zip(w, keep) if k))
+    return result
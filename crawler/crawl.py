@@ -4,42 +4,172 @@
 
         >>> htmls = crawl.crawl_urls(urls)
         >>> htmls = crawl.crawl_urls(urls, max_depth=1) # no link recursion
+        >>> htmls = crawl.crawl_urls(urls, site_workers=8) # parallel fetching
+        >>> htmls = crawl.crawl_urls(urls, workers=16) # parallel sites
 
  """
-from bs4 import BeautifulSoup
-import requests
-import shelve
+from itertools import imap
+from multiprocessing.pool import ThreadPool
+import hashlib
+import threading
+import time
+import traceback
+import warnings
 from urllib import unquote
-from urlparse import urljoin, urlparse
+from urlparse import urljoin, urlparse, urlunparse
 
 from config import get_config
 from crawler import text_extraction, text_utils
-from crawler.io_fs import IoFs
-from crawler.io_rethinkdb import IoRethinkdb
+from crawler.doc_cache import SiteCache, params_key
+from crawler.html_parse import parse_html
+from crawler.http_client import http_client_from_config
+from crawler.io_base import make_crawler_io
+from crawler.metrics import incr, observe, site_profile, timer
+from crawler.scheduler import HostThrottle
+from crawler.simhash import SimHashIndex, simhash, tokenize
+from crawler.streaming import bounded_imap
 
-# Global variable to keep track of already visited urls
-visited = []
 # Global variable to store the crawler i/o instance
 crawler_io = None
+# Global variable to store the per-host politeness throttle
+host_throttle = None
+# Global variable to store the pooled HTTP client
+http_client = None
+# Lock guarding the lazy creation of the global instances above
+_globals_lock = threading.Lock()
+
+
+def crawler_io_backend():
+    """ Return the name of the configured crawler I/O backend. It is the
+        CRAWLER_IO_BACKEND setting or, if that is unset, derived from the
+        older CRAWLER_USE_RETHINK and CRAWLER_USE_SEGMENTS flags.
+    """
+    name = get_config('CRAWLER_IO_BACKEND')
+    if name:
+        return name
+    if get_config('CRAWLER_USE_RETHINK'):
+        return 'rethinkdb'
+    if get_config('CRAWLER_USE_SEGMENTS'):
+        return 'segments'
+    return 'fs'
 
 
 def get_crawler_io():
     """ Return the instance that handles crawler I/O functionality for
         caching and keeping track of redirect and error URLs.
 
-        Is a `IoRethinkdb` instance if CRAWLER_USE_RETHINK is True else `IoFs`.
+        Is an instance of the backend named by `crawler_io_backend`. Further
+        backends can be added with `crawler.io_base.register_backend`.
 
     """
     global crawler_io
-    if crawler_io is None:
-        if get_config('CRAWLER_USE_RETHINK'):
-            crawler_io = IoRethinkdb(
-                get_config('DB_HOST'), get_config('DB_PORT'))
-        else:
-            crawler_io = IoFs(get_config('CRAWLER_PATH'))
+    with _globals_lock:
+        if crawler_io is None:
+            crawler_io = make_crawler_io(crawler_io_backend())
     return crawler_io
 
 
+def get_host_throttle():
+    """ Return the `HostThrottle` shared by all downloads, configured by
+        CRAWLER_HOST_CONCURRENCY and CRAWLER_HOST_DELAY.
+    """
+    global host_throttle
+    with _globals_lock:
+        if host_throttle is None:
+            host_throttle = HostThrottle(
+                get_config('CRAWLER_HOST_CONCURRENCY', int),
+                get_config('CRAWLER_HOST_DELAY', float))
+    return host_throttle
+
+
+def get_http_client():
+    """ Return the `HttpClient` shared by all downloads, so that
+        connections to the same host are kept alive and reused.
+    """
+    global http_client
+    with _globals_lock:
+        if http_client is None:
+            http_client = http_client_from_config()
+    return http_client
+
+
+class CrawlSession(object):
+    """ State of the crawl of a single site: the start URL, the set of
+        already visited URLs, the fingerprints of the downloaded pages and
+        the crawler I/O instance. Sessions are independent of each other, so
+        several sites can be crawled concurrently in one process. A session
+        may be shared by the threads crawling its site.
+    """
+    def __init__(self, start_url, crawler_io=None):
+        """ :param start_url: URL of the webpage that initiated the crawl.
+            :param crawler_io: Crawler I/O instance used for caching. Default
+                is the global instance returned by `get_crawler_io`.
+        """
+        self.start_url = start_url
+        self._io = crawler_io
+        self.visited = set()
+        self.lock = threading.Lock()
+        distance = get_config('CRAWLER_SIMHASH_DISTANCE', int)
+        self.fingerprints = (SimHashIndex(distance) if distance is not None
+                             else None)
+        self.digests = set()
+
+    @property
+    def io(self):
+        if self._io is None:
+            self._io = get_crawler_io()
+        return self._io
+
+    def is_visited(self, url):
+        return url in self.visited
+
+    def visit(self, url):
+        """ Mark `url` as visited. Return False if it was already visited.
+        """
+        with self.lock:
+            if url in self.visited:
+                return False
+            self.visited.add(url)
+            return True
+
+    def num_visited(self):
+        return len(self.visited)
+
+    def is_duplicate(self, html, page=None):
+        """ Check if a downloaded page is a duplicate of a page seen earlier
+            in this session, and remember it otherwise. HTML pages are
+            compared by the SimHash of their visible text, other documents
+            by their exact content. Always False if
+            CRAWLER_SIMHASH_DISTANCE is None.
+
+            :param html: Contents of the page.
+            :param page: `ParsedPage` of `html`, if it is already parsed.
+
+        """
+        if self.fingerprints is None:
+            return False
+        if text_extraction.is_pdf(html):
+            digest = hashlib.md5(html).digest()
+            with self.lock:
+                if digest in self.digests:
+                    incr('crawl.duplicates')
+                    return True
+                self.digests.add(digest)
+                return False
+        if page is None:
+            page = parse_html(text_utils.str2unicode(html))
+        tokens = tokenize(page.text)
+        if not tokens:
+            return False
+        fingerprint = simhash(tokens)
+        with self.lock:
+            if self.fingerprints.find(fingerprint) is not None:
+                incr('crawl.duplicates')
+                return True
+            self.fingerprints.add(fingerprint)
+            return False
+
+
 def get_top_domain(url):
     """ Extract the domain name from a url.
 
@@ -57,15 +187,16 @@ def add_scheme(url):
     return url
 
 
-def filter_url(start_url, url):
+def filter_url(session, url):
     """ Filter out URLs that do not match certain criteria such as non-html,
         already visited, or external URLs.
 
-        :param start_url: URL of the webpage that initiated the process.
-                          Useful to check if a URL is external or not.
+        :param session: `CrawlSession` of the current crawl. Its start URL is
+                        used to check if a URL is external or not.
         :param url: URL of the webpage to be filtered.
 
     """
+    start_url = session.start_url
     if (urlparse(start_url).scheme != 'http' and
             urlparse(start_url).scheme != 'https'):
         return True
@@ -75,7 +206,7 @@ def filter_url(start_url, url):
         return True
     if url.startswith('mailto:'):
         return True
-    if url in visited:
+    if session.is_visited(url):
         return True
     if get_top_domain(start_url) != get_top_domain(url):
         return True
@@ -93,10 +224,33 @@ def filter_url(start_url, url):
     return True
 
 
+def canonicalize_url(url):
+    """ Apply the configurable URL canonicalization rules: remove the query
+        parameters listed in CRAWLER_STRIP_QUERY_PARAMS and lowercase the URL
+        if CRAWLER_URL_CASE_FOLD is set.
+    """
+    strip = get_config('CRAWLER_STRIP_QUERY_PARAMS')
+    o = urlparse(url)
+    if strip and o.query:
+        names = [name.strip().lower() for name in strip.split(',')]
+        exact = set(name for name in names if not name.endswith('*'))
+        prefixes = tuple(name[:-1] for name in names if name.endswith('*'))
+        params = o.query.split('&')
+        kept = [param for param in params
+                if param.split('=', 1)[0].lower() not in exact and
+                not (prefixes and
+                     param.split('=', 1)[0].lower().startswith(prefixes))]
+        if len(kept) != len(params):
+            url = urlunparse(o._replace(query='&'.join(kept)))
+    if get_config('CRAWLER_URL_CASE_FOLD'):
+        url = url.lower()
+    return url
+
+
 def clean_url(url):
     """ Clean URL in order to avoid redundancy, e.g. two URLs linking to the
-        same page. Currently just gets rid of fragments and slash character
-        at the end.
+        same page. Gets rid of fragments and slash character at the end, and
+        applies `canonicalize_url`.
 
     """
     # Remove fragment
@@ -109,113 +263,257 @@ def clean_url(url):
         url = unquote(url.encode('utf8')).decode('utf8')
     except Exception:
         url = unquote(url.encode('latin-1')).decode('latin-1')
-    return url
-
+    return canonicalize_url(url)
 
-def extract_content_url(s):
-    """ Extract the url from the content element in the meta html tag. """
-    for elem in s.split(';'):
-        keyvalue = elem.split('=')
-        if keyvalue[0] == 'url' and len(keyvalue) > 1:
-            return keyvalue[1]
-    return ''
 
-
-def extract_links(url, html=None):
+def extract_links(session, url, html=None, page=None):
     """ Get all hyperlinks from a webpage.
 
+        :param session: `CrawlSession` of the current crawl.
         :param url: URL of the webpage.
         :param html: Contents of the already downloaded url.
+        :param page: `ParsedPage` of the already downloaded url. Takes
+                     precedence over `html`.
 
     """
-    if html is None:
-        html = download(url)
-    soup = BeautifulSoup(html)
-    return set([urljoin(url, tag['href'].strip())
-               for tag in soup.findAll('a', href=True)]
-               + [urljoin(url, tag['src'].strip())
-                  for tag in soup.findAll('frame', src=True)]
-               + [urljoin(url, tag['val0'].strip())
-                  for tag in soup.findAll('csaction', val0=True)]
-               + [urljoin(url, extract_content_url(tag['content']).strip())
-                  for tag in soup.findAll('meta', content=True)]
-               )
-
-
-def download(url):
-    """ Return the contents of the URL in the argument. The `crawler_io`
-        object will be used to cache the requests and keep track of redirect
-        and error URLs.
+    if page is None:
+        if html is None:
+            html = download(session, url)
+        page = parse_html(html)
+    return set(urljoin(url, link) for link in page.links)
+
+
+def response_meta(response):
+    """ Return the cache metadata of a response: its validators and the
+        time it was fetched.
+    """
+    return {'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched': time.time()}
+
 
+def is_fresh(meta, max_age):
+    """ Check if a cached page with the metadata `meta` can be used without
+        revalidation. Pages never expire if `max_age` is None.
+    """
+    if max_age is None:
+        return True
+    if not meta or meta.get('fetched') is None:
+        return False
+    return time.time() - meta['fetched'] < max_age
+
+
+def conditional_headers(meta):
+    """ Return the headers of a conditional request for a cached page, or
+        None if the page has no validators.
+    """
+    headers = {}
+    if meta and meta.get('etag'):
+        headers['If-None-Match'] = meta['etag']
+    if meta and meta.get('last_modified'):
+        headers['If-Modified-Since'] = meta['last_modified']
+    return headers or None
+
+
+def download(session, url):
+    """ Return the contents of the URL in the argument. The crawler I/O
+        object of the session will be used to cache the requests and keep
+        track of redirect and error URLs.
+
+        Cached pages older than CRAWLER_CACHE_MAX_AGE seconds are
+        revalidated with a conditional request if the server sent an ETag or
+        Last-Modified header, and the cached body is kept on a 304 response.
+        If the request of a cached page fails or returns an error status,
+        the stale cached body is returned and the URL is not marked as an
+        error.
+
+        :param session: `CrawlSession` of the current crawl.
         :param url: URL to download.
 
     """
-    crawler_io = get_crawler_io()
+    crawler_io = session.io
     if crawler_io.is_error_url(url):
+        incr('crawl.known_error_urls')
         return None
     text = crawler_io.load_str(url)
+    headers = None
     if text:
-        if get_config('CRAWLER_VERBOSE'):
-            print 'cached', url
-    else:
-        if get_config('CRAWLER_VERBOSE'):
-            print 'downloading', url
-        try:
-            response = requests.get(url)
-        except Exception:
-            crawler_io.add_error_url(url)
-            return None
-        if response.status_code >= 400:
-            crawler_io.add_error_url(url)
-            return None
-        crawler_io.add_redirect(url, response.url)
-        text = response.content
-        crawler_io.save_str(url, text)
-    return text
+        meta = crawler_io.load_meta(url)
+        if is_fresh(meta, get_config('CRAWLER_CACHE_MAX_AGE', float)):
+            if get_config('CRAWLER_VERBOSE'):
+                print 'cached', url
+            incr('crawl.cache_hits')
+            return text
+        headers = conditional_headers(meta)
+    if get_config('CRAWLER_VERBOSE'):
+        print 'revalidating' if headers else 'downloading', url
+    incr('crawl.cache_misses')
+    try:
+        with get_host_throttle().slot(url):
+            with timer('crawl.download'):
+                response, body = get_http_client().get(url,
+                                                       headers=headers)
+    except Exception:
+        return _download_failed(crawler_io, url, text)
+    # Time until the response headers arrived, including DNS lookup and
+    # connect
+    observe('crawl.response_wait', response.elapsed.total_seconds())
+    if headers and response.status_code == 304:
+        incr('crawl.cache_revalidated')
+        meta['fetched'] = time.time()
+        crawler_io.save_meta(url, meta)
+        return text
+    if response.status_code >= 400:
+        return _download_failed(crawler_io, url, text)
+    crawler_io.add_redirect(url, response.url)
+    incr('crawl.bytes_fetched', len(body))
+    crawler_io.save_str(url, body)
+    crawler_io.save_meta(url, response_meta(response))
+    return body
+
+
+def _download_failed(crawler_io, url, text):
+    """ Return the stale cached `text` of a failed download, or record
+        the URL as an error URL if nothing was cached.
+    """
+    if text:
+        incr('crawl.cache_stale')
+        return text
+    incr('crawl.error_urls')
+    crawler_io.add_error_url(url)
+    return None
 
 
-def extract_html_rec(start_url, max_depth=99, url=None, max_links=None):
+def extract_html_rec(start_url, max_depth=99, url=None, max_links=None,
+                     session=None):
     """ Recursively extract all HTMLs from a start URL.
 
         :param start_url: URL of the initial webpage.
-        :param url: URL of the webpage. Used internaly for the recursive calls.
-                    Always use None when calling this function from another
-                    function.
         :param max_depth: Depth of crawling.
+        :param url: URL of the webpage to start the crawl at, if it is not
+                    `start_url`. Links are filtered relative to `start_url`.
+        :param max_links: Sets an upper bound on the number of links to crawl.
+        :param session: `CrawlSession` to use. A new one is created if None.
 
     """
-    global visited
     if url is None:
         url = start_url
-        visited = []
+    if session is None:
+        session = CrawlSession(start_url)
+    try:
+        return _extract_html_rec(session, url, max_depth, max_links)
+    finally:
+        session.io.flush()
+
+
+def _extract_html_rec(session, url, max_depth, max_links):
     if max_depth == 0:
         return []
-    if max_links is not None and (len(visited) >= max_links):
+    if max_links is not None and session.num_visited() >= max_links:
         return []
     url = clean_url(url)
-    visited.append(url)
-    html = download(url)
+    session.visit(url)
+    html = download(session, url)
     if html is None:
         return []
-    text = [html]
+    page = None
     if not text_extraction.is_pdf(html):
+        page = parse_html(text_utils.str2unicode(html))
+    if session.is_duplicate(html, page):
+        return []
+    incr('crawl.pages')
+    text = [html]
+    if page is not None:
         for link in extract_links(
-                get_crawler_io().get_redirect(url),
-                text_utils.str2unicode(html)):
+                session, session.io.get_redirect(url), page=page):
             link = clean_url(link)
-            if not filter_url(start_url, link):
-                text = text + extract_html_rec(
-                    start_url, max_depth-1, link, max_links)
+            if filter_url(session, link):
+                incr('crawl.filtered_links')
+            else:
+                text = text + _extract_html_rec(
+                    session, link, max_depth-1, max_links)
     return text
 
 
+def extract_html_bfs(start_url, max_depth=99, max_links=None, workers=None,
+                     session=None):
+    """ Extract all HTMLs from a start URL like `extract_html_rec`, but
+        breadth-first: the pages of each depth level are downloaded
+        concurrently by a pool of `workers` threads.
+
+        The `max_depth`, `max_links` and `filter_url` semantics are the same
+        as in `extract_html_rec`. The HTMLs are returned in breadth-first
+        order (the start URL always comes first).
+
+        Every page is reached through its shortest link path, while
+        `extract_html_rec` follows the first path it finds. If the link graph
+        is not a tree, that path can be longer, and `extract_html_rec` then
+        misses pages within `max_depth` that this function returns. On a tree
+        both return the same documents unless `max_links` truncates the
+        crawl.
+
+        :param start_url: URL of the initial webpage.
+        :param max_depth: Depth of crawling.
+        :param max_links: Sets an upper bound on the number of links to crawl.
+        :param workers: Number of download threads. Default is the
+                        CRAWLER_SITE_WORKERS setting.
+        :param session: `CrawlSession` to use. A new one is created if None.
+
+    """
+    if workers is None:
+        workers = get_config('CRAWLER_SITE_WORKERS', int)
+    if session is None:
+        session = CrawlSession(start_url)
+    htmls = []
+    frontier = [clean_url(start_url)]
+    pool = ThreadPool(max(1, workers))
+    try:
+        while frontier and max_depth > 0:
+            batch = []
+            for url in frontier:
+                if (max_links is not None and
+                        session.num_visited() >= max_links):
+                    break
+                if session.visit(url):
+                    batch.append(url)
+            frontier = []
+            session.io.prefetch(batch)
+            pages = pool.map(lambda url: download(session, url), batch)
+            for url, html in zip(batch, pages):
+                if html is None:
+                    continue
+                page = None
+                if max_depth > 1 and not text_extraction.is_pdf(html):
+                    page = parse_html(text_utils.str2unicode(html))
+                if session.is_duplicate(html, page):
+                    continue
+                incr('crawl.pages')
+                htmls.append(html)
+                if page is None:
+                    continue
+                for link in extract_links(
+                        session, session.io.get_redirect(url), page=page):
+                    link = clean_url(link)
+                    if filter_url(session, link):
+                        incr('crawl.filtered_links')
+                    else:
+                        frontier.append(link)
+            max_depth -= 1
+    finally:
+        pool.close()
+        pool.join()
+        session.io.flush()
+    return htmls
+
+
 def crawl_url(url, max_depth=1, max_links=None):
     """ Call `crawl_urls` with a single URL. """
     return crawl_urls([url], max_depth=max_depth, max_links=max_links)
 
 
 def crawl_urls(urls, max_depth=1, max_links=None, cache_htmls=False,
-               shelve_db='html_cache.db', append_htmls=True):
+               cache_db='html_cache.sqlite', append_htmls=True,
+               site_workers=1, workers=None, shelve_db=None):
     """ Crawl a list of URLs specified in the input argument and return a
         list that contains one list of HTML documents for each URL in the input
         argument.
@@ -225,43 +523,122 @@ def crawl_urls(urls, max_depth=1, max_links=None, cache_htmls=False,
         :param max_links: Sets an upper bound on the number of links to crawl.
                           Default is None (no limit).
         :param cache_htmls: If True, the list of crawled HTMLs for each URL
-                            is stored using the shelve module.
-        :param shelve_db: Filename of the shelve db used for caching.
+                            is stored in a `SiteCache`.
+        :param cache_db: Filename of the `SiteCache` database.
         :param append_htmls: If True, HTMLs are appended and returned as
             a list of lists (one for each URL in the input argument). Else,
             HTMLs are just stored in the database. Set this to False if the
             input URL list is large and one can run out of memory.
-
-        :return: A list of lists containing raw HTMLs for each URL.
-
-        Note: If `cache_htmls` is True, the cached HTMLs retrieved during an
-              earlier crawl are loaded from the shelve-db, and hence params
-              like `max_depth` will have no effect in the current crawl.
+        :param site_workers: Number of threads used to download the pages of
+            a site. If larger than 1, `extract_html_bfs` is used instead of
+            `extract_html_rec`.
+        :param workers: Number of sites crawled in parallel threads. Default
+            is the CRAWLER_WORKERS setting. Requests to the same host are
+            limited by the shared `HostThrottle` (see `get_host_throttle`).
+        :param shelve_db: Deprecated name of `cache_db`.
+
+        :return: A list of lists containing raw HTMLs for each URL, in the
+                 order of the input URLs. Sites whose crawl raised an
+                 exception are left out.
+
+        Note: If `cache_htmls` is True, the HTMLs retrieved during an
+              earlier crawl with the same `max_depth` and `max_links` are
+              loaded from the cache. Sites without any HTML are not cached.
 
     """
-    if cache_htmls:
-        db = shelve.open(shelve_db)
+    if shelve_db is not None:
+        warnings.warn('shelve_db is deprecated, use cache_db',
+                      DeprecationWarning, stacklevel=2)
+        cache_db = shelve_db
+    urls = [add_scheme(url) for url in urls]
+    cache = SiteCache(cache_db) if cache_htmls else None
+    key = params_key({'max_depth': max_depth, 'max_links': max_links})
+    cached = [cache is not None and cache.has(url, key) for url in urls]
+    crawled = iter_crawl([url for url, c in zip(urls, cached) if not c],
+                         max_depth=max_depth, max_links=max_links,
+                         site_workers=site_workers, workers=workers)
     htmls = []
-    for i, url in enumerate(urls):
-        url = add_scheme(url)
-        try:
-            print 'Crawling webpage', i+1, len(urls), url
-            if cache_htmls:
-                if str(url) in db:
-                    html = db[str(url)]
-                else:
-                    html = extract_html_rec(
-                        url, max_depth=max_depth, max_links=max_links)
-                    db[str(url)] = html
+    try:
+        for i, url in enumerate(urls):
+            if cached[i]:
+                if not append_htmls:
+                    continue
+                html = list(cache.get(url, key))
             else:
-                html = extract_html_rec(
-                    url, max_depth=max_depth, max_links=max_links)
+                url, html = next(crawled)
+                if html is None:
+                    continue
+                if cache is not None and html:
+                    cache.put(url, key, html)
             if append_htmls:
                 htmls.append(html)
+    finally:
+        crawled.close()
+    return htmls
+
+
+def iter_crawl(urls, max_depth=1, max_links=None, site_workers=1,
+               workers=None, max_pending=None):
+    """ Crawl the sites of an iterable of URLs and yield `(url, htmls)` for
+        each of them as soon as its crawl (and those of the sites before it)
+        finished. `htmls` is the list of HTMLs of the site, or None if its
+        crawl raised an exception. URLs are taken from `urls` only as fast as
+        the results are consumed, so memory stays bounded for any number of
+        URLs.
+
+        :param urls: An iterable of URLs.
+        :param max_depth: Maximum depth of crawling.
+        :param max_links: Sets an upper bound on the number of links to crawl.
+        :param site_workers: Number of threads used to download the pages of
+            a site (see `crawl_urls`).
+        :param workers: Number of sites crawled in parallel threads. Default
+            is the CRAWLER_WORKERS setting.
+        :param max_pending: Maximum number of sites crawled ahead of the
+            consumer. Default is twice the number of workers.
+
+        The crawl of a site listed in the PROFILE_SITES setting is profiled
+        (see `crawler.metrics.site_profile`).
+
+    """
+    if workers is None:
+        workers = get_config('CRAWLER_WORKERS', int)
+    if max_pending is None:
+        max_pending = 2 * workers
+    total = len(urls) if hasattr(urls, '__len__') else None
+    if site_workers > 1:
+        def extract(url):
+            return extract_html_bfs(url, max_depth=max_depth,
+                                    max_links=max_links, workers=site_workers)
+    else:
+        def extract(url):
+            return extract_html_rec(url, max_depth=max_depth,
+                                    max_links=max_links)
+
+    def crawl_site(args):
+        i, url = args
+        try:
+            if total is not None:
+                print 'Crawling webpage', i+1, total, url
+            else:
+                print 'Crawling webpage', i+1, url
+            with site_profile(url, 'crawl'):
+                with timer('crawl.site'):
+                    return url, extract(url)
         except Exception, err:
-            import traceback
+            incr('crawl.failed_sites')
             traceback.print_exc()
             print 'Exception', err
-    if cache_htmls:
-        db.close()
-    return htmls
+            return url, None
+
+    todo = enumerate(add_scheme(url) for url in urls)
+    if workers <= 1:
+        for result in imap(crawl_site, todo):
+            yield result
+        return
+    pool = ThreadPool(workers)
+    try:
+        for result in bounded_imap(pool, crawl_site, todo, max_pending):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
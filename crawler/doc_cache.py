@@ -0,0 +1,120 @@
+""" Cache of per-site results (crawled HTMLs, extracted documents) in an
+    SQLite database.
+
+    Entries are keyed by the site URL and a hash of the parameters the result
+    depends on, so that results computed with other parameters are not
+    reused. Every page of a site is stored as its own compressed row and is
+    only loaded when accessed. The database runs in WAL mode, so several
+    processes can read while one writes.
+
+    Usage example:
+
+        >>> cache = SiteCache('html_cache.sqlite')
+        >>> key = params_key({'max_depth': 4, 'max_links': 99})
+        >>> if not cache.has(url, key):
+        ...     cache.put(url, key, crawl.extract_html_rec(url))
+        >>> htmls = cache.get(url, key)
+
+"""
+from collections import Sequence
+from cPickle import dumps, loads, HIGHEST_PROTOCOL
+import hashlib
+import sqlite3
+import zlib
+
+from crawler.io_sqlite import SqliteDb, sqlite_text
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sites (
+    site TEXT, params TEXT, n_items INTEGER, PRIMARY KEY (site, params));
+CREATE TABLE IF NOT EXISTS items (
+    site TEXT, params TEXT, idx INTEGER, value BLOB,
+    PRIMARY KEY (site, params, idx));
+"""
+
+
+def params_key(params):
+    """ Return a hash identifying the dictionary `params`. """
+    return hashlib.sha1(repr(sorted(params.items()))).hexdigest()
+
+
+class CachedSite(Sequence):
+    """ Read-only list of the cached items of a site, loaded on access.
+        Pickling it loads all items into a plain list.
+    """
+    def __init__(self, cache, site, key, n_items):
+        self.cache = cache
+        self.site = site
+        self.key = key
+        self.n_items = n_items
+
+    def __len__(self):
+        return self.n_items
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in xrange(*i.indices(self.n_items))]
+        if i < 0:
+            i += self.n_items
+        if not 0 <= i < self.n_items:
+            raise IndexError(i)
+        return self.cache.get_item(self.site, self.key, i)
+
+    def __iter__(self):
+        for i in xrange(self.n_items):
+            yield self.cache.get_item(self.site, self.key, i)
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+class SiteCache(SqliteDb):
+    """ SQLite cache of per-site item lists. """
+    def __init__(self, filename, timeout=30.0):
+        """ :param filename: Path of the database file.
+            :param timeout: Seconds a write waits for a concurrent writer.
+        """
+        SqliteDb.__init__(self, filename, SCHEMA, timeout)
+
+    def _n_items(self, site, key):
+        row = self._one('SELECT n_items FROM sites WHERE site = ? AND '
+                        'params = ?', (sqlite_text(site), key))
+        return row[0] if row is not None else None
+
+    def has(self, site, key):
+        return self._n_items(site, key) is not None
+
+    def get(self, site, key):
+        """ Return the cached items of `site` as a `CachedSite`, or None. """
+        n_items = self._n_items(site, key)
+        if n_items is None:
+            return None
+        return CachedSite(self, site, key, n_items)
+
+    def get_item(self, site, key, i):
+        row = self._one('SELECT value FROM items WHERE site = ? AND '
+                        'params = ? AND idx = ?', (sqlite_text(site), key, i))
+        if row is None:
+            raise KeyError((site, key, i))
+        return loads(zlib.decompress(str(row[0])))
+
+    def put(self, site, key, items):
+        """ Store the list `items` for `site`, replacing an earlier entry.
+            Readers see either the old or the new entry.
+        """
+        site = sqlite_text(site)
+        rows = [(site, key, i, sqlite3.Binary(zlib.compress(
+                 dumps(item, HIGHEST_PROTOCOL))))
+                for i, item in enumerate(items)]
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM items WHERE site = ? AND params = ?',
+                         (site, key))
+            conn.executemany('INSERT INTO items VALUES (?, ?, ?, ?)', rows)
+            conn.execute('INSERT OR REPLACE INTO sites VALUES (?, ?, ?)',
+                         (site, key, len(rows)))
+        except:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
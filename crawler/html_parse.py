@@ -0,0 +1,88 @@
+""" Single-pass HTML parsing shared by link extraction and text extraction.
+
+    A page is parsed once and walked once; the result holds everything the
+    crawler (outgoing links) and the text extraction (visible text, title and
+    headers) need. Callers that need several of them for the same page
+    parse it once and share the `ParsedPage`.
+
+    Usage example:
+
+        >>> page = parse_html(html)
+        >>> page.links, page.text, page.title, page.headers
+
+"""
+from collections import namedtuple
+import re
+
+from bs4 import BeautifulSoup, NavigableString
+
+from config import get_config
+from crawler.metrics import timer
+
+# The result of parsing an HTML page. `links` holds the raw link targets
+# (not yet joined with the page URL), `text` the visible text, `title` the
+# title string (or None) and `headers` one list of header texts per level.
+ParsedPage = namedtuple('ParsedPage', ['links', 'text', 'title', 'headers'])
+
+HEADER_LEVELS = dict(('h%d' % (i + 1), i) for i in xrange(6))
+
+
+def extract_content_url(s):
+    """ Extract the url from the content element in the meta html tag. """
+    for elem in s.split(';'):
+        keyvalue = elem.split('=')
+        if keyvalue[0] == 'url' and len(keyvalue) > 1:
+            return keyvalue[1]
+    return ''
+
+
+def is_visible_elem(elem):
+    """ Return True, if the input html text is visible on the website. """
+    if elem.parent.name in ['style', 'script', '[document]', 'head']:
+        return False
+    elif re.match('<!--.*-->', str(elem.encode('utf-8'))):
+        return False
+    return True
+
+
+def _parse(html):
+    soup = BeautifulSoup(html, get_config('CRAWLER_HTML_PARSER'))
+    links = []
+    texts = []
+    title = None
+    headers = tuple([] for i in xrange(6))
+    for elem in soup.descendants:
+        if isinstance(elem, NavigableString):
+            if is_visible_elem(elem):
+                texts.append(elem)
+            continue
+        name = elem.name
+        if name == 'a':
+            link = elem.get('href')
+        elif name == 'frame':
+            link = elem.get('src')
+        elif name == 'csaction':
+            link = elem.get('val0')
+        elif name == 'meta':
+            link = elem.get('content')
+            if link is not None:
+                link = extract_content_url(link)
+        else:
+            link = None
+            if name in HEADER_LEVELS:
+                headers[HEADER_LEVELS[name]].append(elem.getText())
+            elif name == 'title' and title is None:
+                title = elem
+        if link is not None:
+            links.append(link.strip())
+    if title is not None:
+        title = title.string
+        if title is not None:
+            title = unicode(title)
+    return ParsedPage(links, u' '.join(texts), title, headers)
+
+
+def parse_html(html):
+    """ Parse an HTML page (str or unicode) and return a `ParsedPage`. """
+    with timer('html.parse'):
+        return _parse(html)
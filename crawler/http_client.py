@@ -0,0 +1,90 @@
+""" HTTP layer of the crawler: a shared session with pooled keep-alive
+    connections per host, timeouts, a response size limit and retries.
+    Cookies are never stored, so that no state is carried from one site or
+    crawl to another.
+
+    Usage example:
+
+        >>> client = HttpClient(connect_timeout=5, read_timeout=30)
+        >>> response, body = client.get('http://www.resmio.com/')
+
+"""
+from cookielib import DefaultCookiePolicy
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from config import get_config
+
+
+class ResponseTooLarge(Exception):
+    """ Raised if a response body exceeds the maximum response size. """
+    pass
+
+
+class HttpClient(object):
+    """ Thin wrapper around a `requests.Session` that reuses connections to
+        the same host and applies the crawler limits to every request. The
+        instance can be shared by several threads.
+    """
+    chunk_size = 64 * 1024
+
+    def __init__(self, connect_timeout=None, read_timeout=None,
+                 max_size=None, retries=0, backoff=0, pool_size=10):
+        """ :param connect_timeout: Seconds to wait for a connection.
+            :param read_timeout: Seconds to wait between bytes received.
+            :param max_size: Maximum number of bytes of a response body, None
+                for no limit.
+            :param retries: Number of retries on connection errors and 5xx
+                responses.
+            :param backoff: Backoff factor for the sleep between retries
+                (backoff * 2^(retry-1) seconds).
+            :param pool_size: Maximum number of kept-alive connections per
+                host.
+        """
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_size = max_size
+        retry = Retry(total=retries, backoff_factor=backoff,
+                      status_forcelist=[500, 502, 503, 504],
+                      raise_on_redirect=False)
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.cookies.set_policy(DefaultCookiePolicy(
+            allowed_domains=[]))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, headers=None):
+        """ Send a GET request and return the `requests.Response`, whose
+            body has been consumed, and the body as a string. Raise
+            `ResponseTooLarge` if the body exceeds `max_size`.
+        """
+        response = self.session.get(url, headers=headers,
+                                    timeout=self.timeout, stream=True)
+        chunks = []
+        size = 0
+        for chunk in response.iter_content(self.chunk_size):
+            size += len(chunk)
+            if self.max_size is not None and size > self.max_size:
+                response.close()
+                raise ResponseTooLarge(url)
+            chunks.append(chunk)
+        # Return the connection to the pool so that it is kept alive
+        response.raw.release_conn()
+        return response, ''.join(chunks)
+
+
+def http_client_from_config():
+    """ Create a `HttpClient` configured by the CRAWLER_CONNECT_TIMEOUT,
+        CRAWLER_READ_TIMEOUT, CRAWLER_MAX_RESPONSE_SIZE, CRAWLER_RETRIES,
+        CRAWLER_RETRY_BACKOFF and CRAWLER_POOL_SIZE settings.
+    """
+    return HttpClient(
+        connect_timeout=get_config('CRAWLER_CONNECT_TIMEOUT', float),
+        read_timeout=get_config('CRAWLER_READ_TIMEOUT', float),
+        max_size=get_config('CRAWLER_MAX_RESPONSE_SIZE', int),
+        retries=get_config('CRAWLER_RETRIES', int),
+        backoff=get_config('CRAWLER_RETRY_BACKOFF', float),
+        pool_size=get_config('CRAWLER_POOL_SIZE', int))
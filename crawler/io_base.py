@@ -0,0 +1,143 @@
+""" Interface of the crawler I/O backends and the registry used to select
+    one by name.
+
+    Usage example:
+
+        >>> @register_backend('memory')
+        ... def memory_backend():
+        ...     return IoMemory()
+        >>> crawler_io = make_crawler_io('memory')
+
+    The backends `fs`, `segments`, `sqlite` and `rethinkdb` are registered
+    here and configured from the settings. Their modules are imported when
+    a backend is created, so that e.g. the rethinkdb driver is only needed
+    by the `rethinkdb` backend.
+
+"""
+from abc import ABCMeta, abstractmethod
+import os.path as osp
+
+from config import get_config
+
+# Factories of the registered backends by name
+backends = {}
+
+
+class CrawlerIo(object):
+    """ Base class of the crawler I/O backends, which cache downloaded pages
+        with their response metadata and keep track of redirect and error
+        URLs. Keys and URLs are unicode strings.
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def save_str(self, key, s):
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_str(self, key):
+        """ Return the value saved for `key`, or None. """
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_meta(self, key, meta):
+        """ Store the response metadata (validators, fetch time) of the
+            cached value of `key`.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_meta(self, key):
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_redirect(self, url1, url2):
+        """ Record that `url1` redirects to `url2`. """
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_redirect(self, url):
+        """ Return the URL `url` redirects to, or `url` itself. """
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_error_url(self, url):
+        raise NotImplementedError
+
+    @abstractmethod
+    def is_error_url(self, url):
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_keys(self):
+        """ Iterate over the keys that have a saved value. """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_redirects(self):
+        """ Iterate over the recorded redirects as `(url1, url2)` pairs. """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_error_urls(self):
+        raise NotImplementedError
+
+    def prefetch(self, urls):
+        """ Load the cached state of `urls` ahead of their lookups. Backends
+            with expensive lookups load them in one batch.
+        """
+        pass
+
+    def flush(self):
+        """ Write buffered changes. """
+        pass
+
+
+def register_backend(name):
+    """ Decorator registering a factory function, called without arguments,
+        that returns a `CrawlerIo` instance for the backend `name`.
+    """
+    def register(factory):
+        backends[name] = factory
+        return factory
+    return register
+
+
+def make_crawler_io(name):
+    """ Return a new instance of the registered backend `name`. """
+    if name not in backends:
+        raise ValueError('Unknown crawler I/O backend %r (available: %s)' %
+                         (name, ', '.join(sorted(backends))))
+    return backends[name]()
+
+
+@register_backend('fs')
+def _fs_backend():
+    from crawler.io_fs import IoFs
+    return IoFs(get_config('CRAWLER_PATH'),
+                get_config('CRAWLER_LOG_REFRESH_INTERVAL', float))
+
+
+@register_backend('segments')
+def _segments_backend():
+    from crawler.io_segments import IoSegmentFs
+    return IoSegmentFs(get_config('CRAWLER_PATH'),
+                       get_config('CRAWLER_SEGMENT_COMPRESSION'),
+                       get_config('CRAWLER_SEGMENT_SIZE', int),
+                       get_config('CRAWLER_LOG_REFRESH_INTERVAL', float))
+
+
+@register_backend('rethinkdb')
+def _rethinkdb_backend():
+    from crawler.io_rethinkdb import IoRethinkdb
+    return IoRethinkdb(get_config('DB_HOST'), get_config('DB_PORT'),
+                       get_config('CRAWLER_RETHINK_BATCH_SIZE', int),
+                       get_config('CRAWLER_RETHINK_CACHE_SIZE', int))
+
+
+@register_backend('sqlite')
+def _sqlite_backend():
+    from crawler.io_sqlite import IoSqlite
+    return IoSqlite(get_config('CRAWLER_SQLITE_PATH') or
+                    osp.join(get_config('CRAWLER_PATH'), 'crawler.db'),
+                    get_config('CRAWLER_SQLITE_TIMEOUT', float))
@@ -3,6 +3,10 @@ import csv
 import hashlib
 import os
 import os.path as osp
+import tempfile
+
+from crawler.io_base import CrawlerIo
+from crawler.url_log import UrlLog
 
 
 def unicode_csv_reader(utf8_data, dialect=csv.excel, **kwargs):
@@ -19,14 +23,39 @@ def get_md5(s):
     return m.hexdigest()
 
 
-class IoFs:
-    """ Persistence class that uses the filesystem. """
-    def __init__(self, basepath):
+def dump_atomic(obj, filename):
+    """ Pickle `obj` into `filename` by renaming a temporary file, so that
+        concurrent readers never see a partially written file.
+    """
+    fd, tmpname = tempfile.mkstemp(dir=osp.dirname(filename))
+    with os.fdopen(fd, 'w') as f:
+        dump(obj, f)
+    os.rename(tmpname, filename)
+
+
+class IoFs(CrawlerIo):
+    """ Persistence class that uses the filesystem. Cached values are stored
+        in files named by the MD5 of their key, and the keys are recorded in
+        the log `keys.log` so that they can be listed. Keys saved before the
+        log existed are not listed by `iter_keys`; since only their MD5 is
+        stored, they cannot be recovered (see `count_unlisted`).
+    """
+    def __init__(self, basepath, refresh_interval=1.0):
+        """ :param basepath: Directory of the cache.
+            :param refresh_interval: Minimum number of seconds between two
+                checks for redirects and error URLs added by other
+                processes when a URL is not found in memory.
+        """
         self.basepath = osp.expanduser(basepath)
         self.cachepath = osp.join(self.basepath, 'cache')
         self.redirects = None
         self.errorurls = None
         self._setup_path()
+        self.redirects_log = UrlLog(osp.join(self.basepath, 'redirects.log'),
+                                    refresh_interval=refresh_interval)
+        self.errorurls_log = UrlLog(osp.join(self.basepath, 'errors.log'),
+                                    refresh_interval=refresh_interval)
+        self.keys_log = UrlLog(osp.join(self.basepath, 'keys.log'))
 
     def _setup_path(self):
         if not os.path.exists(self.basepath):
@@ -35,7 +64,11 @@ class IoFs:
             os.makedirs(self.cachepath)
 
     def save_str(self, key, s):
-        dump(s, open(osp.join(self.cachepath, get_md5(key)), 'w'))
+        filename = osp.join(self.cachepath, get_md5(key))
+        new = not os.path.exists(filename)
+        dump_atomic(s, filename)
+        if new:
+            self.keys_log.append((key,))
 
     def load_str(self, key):
         filename = osp.join(self.cachepath, get_md5(key))
@@ -43,61 +76,107 @@ class IoFs:
             return load(open(filename))
         return None
 
-    def _load_redirects(self):
-        """ If the variable redirects is unset, load the dictionary from a
-            csv-file.
+    def save_meta(self, key, meta):
+        """ Store the response metadata (validators, fetch time) of the
+            cached value of `key`.
+        """
+        dump_atomic(meta, osp.join(self.cachepath, get_md5(key) + '.meta'))
+
+    def load_meta(self, key):
+        filename = osp.join(self.cachepath, get_md5(key) + '.meta')
+        if os.path.exists(filename):
+            return load(open(filename))
+        return None
+
+    def iter_keys(self):
+        self.keys_log.flush()
+        seen = set()
+        for key, in self.keys_log.read_all():
+            if key not in seen:
+                seen.add(key)
+                yield key
+
+    def count_unlisted(self):
+        """ Return the number of cached values whose keys are not listed by
+            `iter_keys`, i.e. that were saved before `keys.log` existed.
+        """
+        listed = set(get_md5(key) for key in self.iter_keys())
+        return sum(1 for name in os.listdir(self.cachepath)
+                   if len(name) == 32 and name not in listed)
+
+    def _load_redirects(self, force=False):
+        """ If the variable redirects is unset, load the dictionary from the
+            redirects log, converting an older csv-file on first use. Later
+            calls read the records appended by other processes since, at
+            most once per refresh interval unless `force` is True.
         """
         if self.redirects is None:
             self.redirects = dict()
             redirectsfile = osp.join(self.basepath, 'redirects.csv')
             if os.path.exists(redirectsfile):
-                reader = unicode_csv_reader(open(redirectsfile))
-                self.redirects = dict((rows[0], rows[1]) for rows in reader)
+                self.redirects_log.migrate(
+                    (rows[0], rows[1])
+                    for rows in unicode_csv_reader(open(redirectsfile)))
+        self.redirects.update(self.redirects_log.read_new(force))
 
     def add_redirect(self, url1, url2):
         """ Keep track of the http redirects so that we can properly update
             the base url needed to construct new urls with relative paths.
         """
-        self._load_redirects()
-        if (url1 != url2):
+        if self.redirects is None:
+            self._load_redirects()
+        if (url1 != url2) and self.redirects.get(url1) != url2:
             self.redirects[url1] = url2
-            redirectsfile = osp.join(self.basepath, 'redirects.csv')
-            f = open(redirectsfile, 'a')
-            csvout = csv.writer(f, delimiter=',', quotechar='"')
-            csvout.writerow([url1.encode('UTF-8'), url2.encode('UTF-8')])
-            f.close()
+            self.redirects_log.append((url1, url2))
 
     def get_redirect(self, url):
         """ Return the redirect from a url stored by a previous call to
             `add_redirect`.
         """
-        self._load_redirects()
-        if url not in self.redirects:
-            return url
-        return self.redirects[url]
+        if self.redirects is None or url not in self.redirects:
+            self._load_redirects()
+        return self.redirects.get(url, url)
 
-    def _load_error_urls(self):
-        """ If the variable 'redirects' is unset, load the set from a csv-file.
+    def _load_error_urls(self, force=False):
+        """ If the variable 'errorurls' is unset, load the set from the errors
+            log, converting an older csv-file on first use. Later calls read
+            the records appended by other processes since, at most once per
+            refresh interval unless `force` is True.
         """
         if self.errorurls is None:
             self.errorurls = set()
             errorurlsfile = osp.join(self.basepath, 'errors.csv')
             if os.path.exists(errorurlsfile):
-                reader = unicode_csv_reader(open(errorurlsfile))
-                self.errorurls = set(rows[0] for rows in reader)
+                self.errorurls_log.migrate(
+                    (rows[0],)
+                    for rows in unicode_csv_reader(open(errorurlsfile)))
+        self.errorurls.update(rows[0] for rows in
+                              self.errorurls_log.read_new(force))
 
     def add_error_url(self, url):
         """ Keep track of the urls that return an error. """
-        self._load_error_urls()
+        if self.errorurls is None:
+            self._load_error_urls()
         if url not in self.errorurls:
             self.errorurls.add(url)
-            errorurlsfile = osp.join(self.basepath, 'errors.csv')
-            f = open(errorurlsfile, 'a')
-            csvout = csv.writer(f, delimiter=',', quotechar='"')
-            csvout.writerow([url.encode('UTF-8')])
-            f.close()
+            self.errorurls_log.append((url,))
 
     def is_error_url(self, url):
         """ Check if a url has returned some kind of error in the past. """
-        self._load_error_urls()
+        if self.errorurls is None or url not in self.errorurls:
+            self._load_error_urls()
         return url in self.errorurls
+
+    def iter_redirects(self):
+        self._load_redirects(force=True)
+        return iter(self.redirects.items())
+
+    def iter_error_urls(self):
+        self._load_error_urls(force=True)
+        return iter(list(self.errorurls))
+
+    def flush(self):
+        """ Write the buffered redirects, error urls and keys. """
+        self.redirects_log.flush()
+        self.errorurls_log.flush()
+        self.keys_log.flush()
@@ -1,45 +1,234 @@
+import atexit
+import hashlib
+import os
+import threading
+
 import rethinkdb as r
 
+from crawler.io_base import CrawlerIo
+from crawler.lru import LRUCache
+
+
+def doc_id(key):
+    """ Return the primary key of the row of `key`. URLs may be longer than
+        the primary keys RethinkDB accepts, so they are hashed.
+    """
+    if isinstance(key, unicode):
+        key = key.encode('utf8')
+    return hashlib.sha1(key).hexdigest()
+
+
+class IoRethinkdb(CrawlerIo):
+    """ Persistence class that uses RethinkDB.
+
+        Rows are keyed by `doc_id` and written with `conflict='replace'`, so
+        saving a key again replaces its row. Lookups go through the secondary
+        indexes `key` (binary) and `url1` (redirects, errors). Writes are
+        buffered and sent in batches of `batch_size` rows (or by `flush`),
+        and `prefetch` loads the rows of many URLs in one query per table.
+        Every thread and process opens its own connection.
+    """
+    def __init__(self, host, port, batch_size=100, cache_size=10000):
+        """ :param host: Host of the RethinkDB server.
+            :param port: Port of the RethinkDB server.
+            :param batch_size: Number of buffered writes that triggers a
+                flush. 1 writes every row immediately.
+            :param cache_size: Number of prefetched URLs kept in memory.
+                The page bodies of prefetched rows are dropped once they
+                have been loaded.
+        """
+        self.host = host
+        self.port = port
+        self.local = threading.local()
+        conn = r.connect(host, port)
+        if 'resmio' not in r.db_list().run(conn):
+            r.db_create('resmio').run(conn)
+            conn.use('resmio')
+            r.table_create('binary').run(conn)
+            r.table_create('redirects').run(conn)
+            r.table_create('errors').run(conn)
+        conn.use('resmio')
+        for table, index in (('binary', 'key'), ('redirects', 'url1'),
+                             ('errors', 'url1')):
+            if index not in r.table(table).index_list().run(conn):
+                r.table(table).index_create(index).run(conn)
+                r.table(table).index_wait(index).run(conn)
+        self.local.conn = conn
+        self.local.pid = os.getpid()
+        self.batch_size = batch_size
+        self.buffers = {'binary': {}, 'redirects': {}, 'errors': {}}
+        self.lock = threading.RLock()
+        self.prefetched = LRUCache(cache_size)
+        atexit.register(self.flush)
+
+    def _conn(self):
+        """ Return the connection of the calling thread. Connections are
+            not thread-safe, and a forked process opens a new connection
+            instead of using the inherited one.
+        """
+        if getattr(self.local, 'pid', None) != os.getpid():
+            conn = r.connect(self.host, self.port)
+            conn.use('resmio')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return self.local.conn
+
+    def _write(self, table, doc):
+        """ Buffer the row `doc` and flush if the buffer is full. """
+        with self.lock:
+            self.buffers[table][doc['id']] = doc
+            if sum(len(b) for b in self.buffers.values()) >= \
+                    self.batch_size:
+                self.flush()
+
+    def _buffered(self, table, key):
+        with self.lock:
+            return self.buffers[table].get(doc_id(key))
 
-class IoRethinkdb:
-    """ Persistence class that uses RethinkDB. """
-    def __init__(self, host, port):
-        self.conn = r.connect(host, port).repl()
-        if 'resmio' not in r.db_list().run(self.conn):
-            r.db_create('resmio').run(self.conn)
-            self.conn.use('resmio')
-            r.table_create('binary').run(self.conn)
-            r.table_create('redirects').run(self.conn)
-            r.table_create('errors').run(self.conn)
-            r.table('binary').index_create('key').run(self.conn)
-        self.conn.use('resmio')
+    def flush(self):
+        """ Write all buffered rows, one insert per table. """
+        with self.lock:
+            for table, buf in self.buffers.items():
+                if not buf:
+                    continue
+                docs = buf.values()
+                if table == 'binary':
+                    docs = [dict(doc, value=r.binary(doc['value']))
+                            for doc in docs]
+                r.table(table).insert(
+                    docs, conflict='replace').run(self._conn())
+                buf.clear()
+
+    def prefetch(self, urls):
+        """ Load the cached values, metadata, redirects and error state of
+            `urls` with one query per table, so that the following lookups
+            of these URLs do not hit the database.
+        """
+        urls = list(urls)
+        if not urls:
+            return
+        found = dict((url, {'binary': None, 'redirect': url, 'error': False})
+                     for url in urls)
+        for row in r.table('binary').get_all(
+                *urls, index='key').run(self._conn()):
+            entry = found[row['key']]
+            if entry['binary'] is None or row['id'] == doc_id(row['key']):
+                entry['binary'] = row
+        for row in r.table('redirects').get_all(
+                *urls, index='url1').pluck('url1', 'url2').run(self._conn()):
+            found[row['url1']]['redirect'] = row['url2']
+        for row in r.table('errors').get_all(
+                *urls, index='url1').pluck('url1').run(self._conn()):
+            found[row['url1']]['error'] = True
+        for url, entry in found.iteritems():
+            self.prefetched.put(url, entry)
+
+    def _load_binary(self, key, body=True):
+        """ Return the binary row of `key`. Rows written before keys were
+            hashed into the primary key may occur several times; the row
+            with the hashed primary key wins. The row may lack its `value`
+            if `body` is False.
+        """
+        row = self._buffered('binary', key)
+        if row is not None:
+            return row
+        entry = self.prefetched.get(key)
+        if entry is not None:
+            row = entry['binary']
+            # The body of a prefetched row is kept until its first load
+            if row is None or 'value' in row or not body:
+                if body and row is not None:
+                    entry['binary'] = dict((k, v) for k, v in row.iteritems()
+                                           if k != 'value')
+                return row
+            row = None
+        for v in r.table('binary').get_all(key, index='key').run(self._conn()):
+            if row is None or v['id'] == doc_id(key):
+                row = v
+        return row
 
     def save_str(self, key, value):
-        r.table('binary').insert(
-            {'key': key, 'value': r.binary(value)}).run(self.conn)
+        self.prefetched.put(key, None)
+        self._write('binary', {'id': doc_id(key), 'key': key,
+                               'value': value})
 
     def load_str(self, key):
-        for v in r.table('binary').get_all(
-                key, index='key').pluck('value').run(self.conn):
-            return v['value']
-        return None
+        row = self._load_binary(key)
+        return row['value'] if row is not None else None
+
+    def save_meta(self, key, meta):
+        """ Store the response metadata (validators, fetch time) of the
+            cached value of `key`.
+        """
+        with self.lock:
+            row = self._buffered('binary', key)
+            if row is not None:
+                row['meta'] = meta
+                return
+            self.prefetched.put(key, None)
+        r.table('binary').get_all(key, index='key').update(
+            {'meta': r.literal(meta)}).run(self._conn())
+
+    def load_meta(self, key):
+        row = self._load_binary(key, body=False)
+        return row.get('meta') if row is not None else None
+
+    def iter_keys(self):
+        """ Iterate over the saved keys. Keys of legacy rows that occur
+            several times are returned once.
+        """
+        self.flush()
+        seen = set()
+        for row in r.table('binary').pluck('key').run(self._conn()):
+            if row['key'] not in seen:
+                seen.add(row['key'])
+                yield row['key']
 
     def add_redirect(self, url1, url2):
-        r.table('redirects').insert(
-            {'url1': url1, 'url2': url2}).run(self.conn)
+        if url1 == url2:
+            return
+        self.prefetched.put(url1, None)
+        self._write('redirects', {'id': doc_id(url1), 'url1': url1,
+                                  'url2': url2})
 
     def get_redirect(self, url1):
-        for v in r.table('redirects').filter(
-                {'url1': url1}).pluck('url2').run(self.conn):
+        row = self._buffered('redirects', url1)
+        if row is not None:
+            return row['url2']
+        entry = self.prefetched.get(url1)
+        if entry is not None:
+            return entry['redirect']
+        for v in r.table('redirects').get_all(
+                url1, index='url1').pluck('url2').run(self._conn()):
             return v['url2']
         return url1
 
     def add_error_url(self, url1):
         """ Keeps track of the URLs that return an error. """
-        r.table('errors').insert({'url1': url1}).run(self.conn)
+        self.prefetched.put(url1, None)
+        self._write('errors', {'id': doc_id(url1), 'url1': url1})
 
     def is_error_url(self, url1):
         """ Check if a URL has returned some an error in the past. """
-        for v in r.table('errors').filter({'url1': url1}).run(self.conn):
+        if self._buffered('errors', url1) is not None:
+            return True
+        entry = self.prefetched.get(url1)
+        if entry is not None:
+            return entry['error']
+        for v in r.table('errors').get_all(
+                url1, index='url1').run(self._conn()):
             return True
         return False
+
+    def iter_redirects(self):
+        self.flush()
+        for row in r.table('redirects').pluck('url1', 'url2').run(self._conn()):
+            yield row['url1'], row['url2']
+
+    def iter_error_urls(self):
+        self.flush()
+        seen = set()
+        for row in r.table('errors').pluck('url1').run(self._conn()):
+            if row['url1'] not in seen:
+                seen.add(row['url1'])
+                yield row['url1']
@@ -0,0 +1,194 @@
+""" Crawler cache that stores pages in a few large append-only segment files
+    instead of one pickle per URL.
+
+    Values are pickled, compressed and appended to the current segment file
+    `segments/data-NNNNN.seg`. A new segment is started once the current one
+    exceeds `segment_size` bytes. Identical values are stored once: every
+    value is addressed by the SHA-1 of its pickle. The mapping from keys to
+    value locations is kept in the append-only log `segments/index.log`,
+    which is loaded into memory and refreshed incrementally from its tail,
+    so that several processes can share one store. Writers serialize on an
+    exclusive lock of `segments/lock`; readers never lock and read the
+    segments through memory maps.
+
+    Usage example:
+
+        >>> io = IoSegmentFs('~/.crawler')
+        >>> io.save_str(url, html)
+        >>> io.load_str(url)
+
+"""
+from cPickle import dumps, loads, HIGHEST_PROTOCOL
+import fcntl
+import hashlib
+import mmap
+import os
+import os.path as osp
+import struct
+import threading
+import zlib
+
+from crawler.io_fs import IoFs
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Index log record: kind ('s' value, 'm' meta), segment number, offset,
+# length, SHA-1 of the value, length of the UTF-8 key (followed by the key)
+INDEX_RECORD = struct.Struct('>cIQI20sH')
+
+
+class IoSegmentFs(IoFs):
+    """ Persistence class that uses compressed, content-addressed segment
+        files. Redirects and error URLs are handled like in `IoFs`.
+    """
+    def __init__(self, basepath, compression='zlib',
+                 segment_size=256 * 1024 * 1024, refresh_interval=1.0):
+        """ :param basepath: Directory of the store.
+            :param compression: 'zlib' or 'zstd' (needs the `zstandard`
+                package). Values written with either codec can be read
+                back regardless of this setting.
+            :param segment_size: Size in bytes after which a new segment
+                file is started.
+            :param refresh_interval: See `IoFs`.
+        """
+        if compression not in ('zlib', 'zstd'):
+            raise ValueError('Unknown compression %r' % compression)
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError('zstd compression needs the zstandard package')
+        self.compression = compression
+        self.segment_size = segment_size
+        IoFs.__init__(self, basepath, refresh_interval)
+        self.segmentpath = osp.join(self.basepath, 'segments')
+        if not osp.exists(self.segmentpath):
+            os.makedirs(self.segmentpath)
+        self.indexfile = osp.join(self.segmentpath, 'index.log')
+        self.lockfile = osp.join(self.segmentpath, 'lock')
+        self.keys = {}
+        self.blobs = {}
+        self.index_pos = 0
+        self.maps = {}
+        self.lock = threading.RLock()
+
+    def _segment_file(self, segment):
+        return osp.join(self.segmentpath, 'data-%05d.seg' % segment)
+
+    def _refresh_index(self):
+        """ Read the records appended to the index log since the last call.
+            A partially written record at the end is left for the next call.
+        """
+        try:
+            if osp.getsize(self.indexfile) <= self.index_pos:
+                return
+        except OSError:
+            return
+        with open(self.indexfile, 'rb') as f:
+            f.seek(self.index_pos)
+            data = f.read()
+        pos = 0
+        while pos + INDEX_RECORD.size <= len(data):
+            kind, segment, offset, length, digest, keylen = \
+                INDEX_RECORD.unpack_from(data, pos)
+            end = pos + INDEX_RECORD.size + keylen
+            if end > len(data):
+                break
+            key = data[pos + INDEX_RECORD.size:end].decode('utf8')
+            location = (segment, offset, length)
+            self.keys[(kind, key)] = digest
+            self.blobs[digest] = location
+            pos = end
+        self.index_pos += pos
+
+    def _compress(self, data):
+        if self.compression == 'zstd':
+            return 'S' + zstandard.ZstdCompressor().compress(data)
+        return 'Z' + zlib.compress(data)
+
+    def _decompress(self, data):
+        if data[0] == 'S':
+            return zstandard.ZstdDecompressor().decompress(data[1:])
+        return zlib.decompress(data[1:])
+
+    def _read(self, location):
+        segment, offset, length = location
+        m = self.maps.get(segment)
+        if m is None or offset + length > len(m):
+            with open(self._segment_file(segment), 'rb') as f:
+                m = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.maps[segment] = m
+        return self._decompress(m[offset:offset + length])
+
+    def _append_blob(self, data):
+        """ Append compressed `data` to the current segment and return its
+            location. Must be called with the writer lock held.
+        """
+        segments = sorted(int(name[5:10]) for name in
+                          os.listdir(self.segmentpath)
+                          if name.startswith('data-'))
+        segment = segments[-1] if segments else 0
+        filename = self._segment_file(segment)
+        if osp.exists(filename) and \
+                osp.getsize(filename) >= self.segment_size:
+            segment += 1
+            filename = self._segment_file(segment)
+        blob = self._compress(data)
+        with open(filename, 'ab') as f:
+            offset = f.tell()
+            f.write(blob)
+        return segment, offset, len(blob)
+
+    def _save(self, kind, key, value):
+        data = dumps(value, HIGHEST_PROTOCOL)
+        digest = hashlib.sha1(data).digest()
+        keybytes = key.encode('utf8')
+        with self.lock:
+            with open(self.lockfile, 'a') as lock:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+                try:
+                    self._refresh_index()
+                    location = self.blobs.get(digest)
+                    if location is None:
+                        location = self._append_blob(data)
+                    record = INDEX_RECORD.pack(
+                        kind, location[0], location[1], location[2], digest,
+                        len(keybytes)) + keybytes
+                    with open(self.indexfile, 'ab') as f:
+                        # Cut off a record torn by a writer that died while
+                        # appending it, so that the new one stays aligned
+                        f.seek(0, os.SEEK_END)
+                        if f.tell() > self.index_pos:
+                            f.truncate(self.index_pos)
+                        f.write(record)
+                    self._refresh_index()
+                finally:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _load(self, kind, key):
+        with self.lock:
+            # Also picks up newer values of known keys saved by other
+            # processes
+            self._refresh_index()
+            digest = self.keys.get((kind, key))
+            if digest is None:
+                return None
+            return loads(self._read(self.blobs[digest]))
+
+    def save_str(self, key, s):
+        self._save('s', key, s)
+
+    def load_str(self, key):
+        return self._load('s', key)
+
+    def iter_keys(self):
+        with self.lock:
+            self._refresh_index()
+            keys = sorted(key for kind, key in self.keys if kind == 's')
+        return iter(keys)
+
+    def save_meta(self, key, meta):
+        self._save('m', key, meta)
+
+    def load_meta(self, key):
+        return self._load('m', key)
@@ -0,0 +1,148 @@
+""" Crawler I/O backend that keeps the page cache, redirects and error URLs
+    in a single SQLite database file.
+
+    The database runs in WAL mode, so readers never block the writer, and
+    every thread and process opens its own connection. Concurrent writers
+    wait for each other for up to `timeout` seconds.
+
+    Usage example:
+
+        >>> io = IoSqlite('~/.crawler/crawler.db')
+        >>> io.save_str(url, html)
+        >>> io.load_str(url)
+
+"""
+from cPickle import dumps, loads, HIGHEST_PROTOCOL
+import os
+import os.path as osp
+import sqlite3
+import threading
+
+from crawler.io_base import CrawlerIo
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT PRIMARY KEY, value BLOB, meta BLOB);
+CREATE TABLE IF NOT EXISTS redirects (
+    url1 TEXT PRIMARY KEY, url2 TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS errors (
+    url TEXT PRIMARY KEY);
+"""
+
+SQLITE_MAGIC = 'SQLite format 3\x00'
+
+
+def sqlite_text(s):
+    """ SQLite only accepts ASCII byte strings as text. """
+    return s.decode('utf8') if isinstance(s, str) else s
+
+
+class SqliteDb(object):
+    """ SQLite database file in WAL mode with one connection per thread and
+        process.
+    """
+    def __init__(self, filename, schema, timeout=30.0):
+        """ :param filename: Path of the database file.
+            :param schema: SQL script creating the tables if missing.
+            :param timeout: Seconds a write waits for a concurrent writer.
+        """
+        self.filename = osp.expanduser(filename)
+        dirname = osp.dirname(self.filename)
+        if dirname and not osp.exists(dirname):
+            os.makedirs(dirname)
+        if osp.exists(self.filename) and osp.getsize(self.filename):
+            with open(self.filename, 'rb') as f:
+                if f.read(len(SQLITE_MAGIC)) != SQLITE_MAGIC:
+                    # E.g. a cache written with `shelve` by older versions
+                    raise ValueError(
+                        '%s is not an SQLite database. Remove it or choose '
+                        'another file.' % self.filename)
+        self.timeout = timeout
+        self.local = threading.local()
+        conn = self._conn()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(schema)
+
+    def _conn(self):
+        """ Return the connection of the calling thread. A forked process
+            opens a new connection instead of using the inherited one.
+        """
+        if getattr(self.local, 'pid', None) != os.getpid():
+            conn = sqlite3.connect(self.filename, timeout=self.timeout,
+                                   isolation_level=None)
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self.local.conn = conn
+            self.local.pid = os.getpid()
+        return self.local.conn
+
+    def _one(self, query, args):
+        for row in self._conn().execute(query, args):
+            return row
+        return None
+
+
+class IoSqlite(SqliteDb, CrawlerIo):
+    """ Persistence class that uses an SQLite database. """
+    def __init__(self, filename, timeout=30.0):
+        """ :param filename: Path of the database file.
+            :param timeout: Seconds a write waits for a concurrent writer.
+        """
+        SqliteDb.__init__(self, filename, SCHEMA, timeout)
+
+    def save_str(self, key, s):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO pages (key, value) VALUES (?, ?)',
+            (sqlite_text(key), sqlite3.Binary(dumps(s, HIGHEST_PROTOCOL))))
+
+    def load_str(self, key):
+        row = self._one('SELECT value FROM pages WHERE key = ?',
+                        (sqlite_text(key),))
+        return loads(str(row[0])) if row is not None else None
+
+    def save_meta(self, key, meta):
+        """ Store the response metadata (validators, fetch time) of the
+            cached value of `key`.
+        """
+        self._conn().execute(
+            'UPDATE pages SET meta = ? WHERE key = ?',
+            (sqlite3.Binary(dumps(meta, HIGHEST_PROTOCOL)), sqlite_text(key)))
+
+    def load_meta(self, key):
+        row = self._one('SELECT meta FROM pages WHERE key = ?',
+                        (sqlite_text(key),))
+        if row is None or row[0] is None:
+            return None
+        return loads(str(row[0]))
+
+    def add_redirect(self, url1, url2):
+        if url1 != url2:
+            self._conn().execute(
+                'INSERT OR REPLACE INTO redirects VALUES (?, ?)',
+                (sqlite_text(url1), sqlite_text(url2)))
+
+    def get_redirect(self, url):
+        row = self._one('SELECT url2 FROM redirects WHERE url1 = ?',
+                        (sqlite_text(url),))
+        return row[0] if row is not None else url
+
+    def add_error_url(self, url):
+        """ Keep track of the urls that return an error. """
+        self._conn().execute('INSERT OR IGNORE INTO errors VALUES (?)',
+                             (sqlite_text(url),))
+
+    def is_error_url(self, url):
+        """ Check if a url has returned some kind of error in the past. """
+        return self._one('SELECT 1 FROM errors WHERE url = ?',
+                         (sqlite_text(url),)) is not None
+
+    def iter_keys(self):
+        for row in self._conn().execute('SELECT key FROM pages'):
+            yield row[0]
+
+    def iter_redirects(self):
+        for row in self._conn().execute('SELECT url1, url2 FROM redirects'):
+            yield row[0], row[1]
+
+    def iter_error_urls(self):
+        for row in self._conn().execute('SELECT url FROM errors'):
+            yield row[0]
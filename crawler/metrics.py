@@ -0,0 +1,269 @@
+""" Counters and timers of the crawl, extraction and prediction stages.
+
+    Counters and timers are identified by dotted names such as
+    `crawl.cache_hits` or `extract.pdf`. A timer records the number of
+    observations, their total and their maximum duration in seconds.
+    Updates take a lock and a dictionary lookup, so the metrics can stay
+    enabled in production; set METRICS_ENABLED to False to turn them into
+    no-ops. Snapshots can be dumped as JSON or in the Prometheus text format.
+    If METRICS_FILE is set, a snapshot is written to that file when the
+    process exits.
+
+    Usage example:
+
+        >>> with timer('crawl.download'):
+        ...     response, body = http_client.get(url)
+        >>> incr('crawl.bytes_fetched', len(body))
+        >>> print get_metrics().to_prometheus()
+
+    The crawl of single sites can be profiled with cProfile by listing their
+    URLs in PROFILE_SITES (see `site_profile`), and any block of code with
+    `profiled`.
+"""
+import atexit
+import cProfile
+import hashlib
+import json
+import os
+import os.path as osp
+import re
+import threading
+import time
+
+from config import get_config
+
+# Global variable to store the metrics of this process
+metrics = None
+_metrics_lock = threading.Lock()
+
+
+class _Timer(object):
+    """ Context manager adding the duration of its block to a timer. """
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.observe(self.name, time.time() - self.start)
+
+
+class _NullContext(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+NULL_CONTEXT = _NullContext()
+
+
+class Metrics(object):
+    """ Thread-safe registry of counters and timers. """
+    def __init__(self, enabled=True):
+        """ :param enabled: If False, updates are ignored. """
+        self.enabled = enabled
+        self.lock = threading.Lock()
+        self.counters = {}
+        # name -> [count, total seconds, max seconds]
+        self.timers = {}
+
+    def incr(self, name, n=1):
+        """ Add `n` to the counter `name`. """
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name, seconds):
+        """ Add a duration in seconds to the timer `name`. """
+        if not self.enabled:
+            return
+        with self.lock:
+            timer = self.timers.get(name)
+            if timer is None:
+                self.timers[name] = [1, seconds, seconds]
+            else:
+                timer[0] += 1
+                timer[1] += seconds
+                if seconds > timer[2]:
+                    timer[2] = seconds
+
+    def timer(self, name):
+        """ Return a context manager that times its block into the timer
+            `name`.
+        """
+        if not self.enabled:
+            return NULL_CONTEXT
+        return _Timer(self, name)
+
+    def snapshot(self):
+        """ Return the current values as a dictionary with the keys
+            `counters` (name -> value) and `timers` (name -> dictionary with
+            `count`, `seconds` and `max_seconds`).
+        """
+        with self.lock:
+            return _snapshot(self.counters, self.timers)
+
+    def reset(self):
+        with self.lock:
+            self.counters = {}
+            self.timers = {}
+
+    def drain(self):
+        """ Return a snapshot and reset all values, e.g. to send the metrics
+            of a worker process to its parent.
+        """
+        with self.lock:
+            counters, timers = self.counters, self.timers
+            self.counters = {}
+            self.timers = {}
+        return _snapshot(counters, timers)
+
+    def merge(self, snapshot):
+        """ Add the values of a snapshot (of another process) to these. """
+        if not self.enabled:
+            return
+        with self.lock:
+            for name, value in snapshot['counters'].iteritems():
+                self.counters[name] = self.counters.get(name, 0) + value
+            for name, t in snapshot['timers'].iteritems():
+                timer = self.timers.setdefault(name, [0, 0.0, 0.0])
+                timer[0] += t['count']
+                timer[1] += t['seconds']
+                timer[2] = max(timer[2], t['max_seconds'])
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), indent=2, sort_keys=True)
+
+    def to_prometheus(self, prefix='crawler'):
+        """ Return the metrics in the Prometheus text exposition format.
+            Counters become `<prefix>_<name>_total`, timers summaries
+            `<prefix>_<name>_seconds` (count and sum) with a gauge
+            `<prefix>_<name>_seconds_max`.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot['counters'].iteritems()):
+            metric = '%s_%s_total' % (prefix, _metric_name(name))
+            lines.append('# TYPE %s counter' % metric)
+            lines.append('%s %s' % (metric, value))
+        for name, t in sorted(snapshot['timers'].iteritems()):
+            metric = '%s_%s_seconds' % (prefix, _metric_name(name))
+            lines.append('# TYPE %s summary' % metric)
+            lines.append('%s_count %d' % (metric, t['count']))
+            lines.append('%s_sum %r' % (metric, t['seconds']))
+            lines.append('# TYPE %s_max gauge' % metric)
+            lines.append('%s_max %r' % (metric, t['max_seconds']))
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, filename):
+        """ Write the metrics to `filename`, in the Prometheus text format if
+            it ends with `.prom`, else as JSON.
+        """
+        with open(filename, 'w') as f:
+            f.write(self.to_prometheus() if filename.endswith('.prom')
+                    else self.to_json())
+
+
+def _snapshot(counters, timers):
+    return {'counters': dict(counters),
+            'timers': dict((name, {'count': t[0], 'seconds': t[1],
+                                   'max_seconds': t[2]})
+                           for name, t in timers.iteritems())}
+
+
+def _metric_name(name):
+    return re.sub('[^a-zA-Z0-9_]', '_', name)
+
+
+def get_metrics():
+    """ Return the `Metrics` of this process, enabled by METRICS_ENABLED and
+        dumped to METRICS_FILE on exit if that is set.
+    """
+    global metrics
+    if metrics is None:
+        with _metrics_lock:
+            if metrics is None:
+                m = Metrics(get_config('METRICS_ENABLED'))
+                filename = get_config('METRICS_FILE')
+                if filename:
+                    pid = os.getpid()
+                    # Only the process that created the metrics dumps them,
+                    # not forked worker processes
+                    atexit.register(
+                        lambda: os.getpid() == pid and m.dump(filename))
+                metrics = m
+    return metrics
+
+
+def incr(name, n=1):
+    """ Add `n` to the counter `name` of the process metrics. """
+    get_metrics().incr(name, n)
+
+
+def observe(name, seconds):
+    get_metrics().observe(name, seconds)
+
+
+def timer(name):
+    """ Return a context manager timing its block into the timer `name` of
+        the process metrics.
+    """
+    return get_metrics().timer(name)
+
+
+def timed(name):
+    """ Decorator timing every call of a function into the timer `name`. """
+    def decorate(func):
+        def wrapper(*args, **kwargs):
+            with get_metrics().timer(name):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorate
+
+
+class profiled(object):
+    """ Context manager profiling its block (in the current thread) with
+        cProfile and writing the statistics to `filename`, which can be
+        read with `pstats`.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.profile = None
+
+    def __enter__(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *args):
+        self.profile.disable()
+        dirname = osp.dirname(self.filename)
+        if dirname and not osp.exists(dirname):
+            os.makedirs(dirname)
+        self.profile.dump_stats(self.filename)
+
+
+def site_profile(url, stage):
+    """ Return a `profiled` context manager if `url` is listed in the
+        PROFILE_SITES setting (comma-separated URLs), else a context manager
+        that does nothing. The statistics are written to
+        `<PROFILE_DIR>/<stage>-<md5 of url>.prof`.
+    """
+    sites = get_config('PROFILE_SITES')
+    if not sites or url not in [s.strip() for s in sites.split(',')]:
+        return NULL_CONTEXT
+    if isinstance(url, unicode):
+        url = url.encode('utf8')
+    return profiled(osp.join(
+        osp.expanduser(get_config('PROFILE_DIR')),
+        '%s-%s.prof' % (stage, hashlib.md5(url).hexdigest())))
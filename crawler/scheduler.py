@@ -0,0 +1,71 @@
+""" Politeness scheduling for crawling many sites at once.
+
+    Usage example:
+
+        >>> throttle = HostThrottle(max_concurrency=2, delay=0.5)
+        >>> with throttle.slot(url):
+        ...     response = requests.get(url)
+
+"""
+import threading
+import time
+from urlparse import urlparse
+
+
+class HostThrottle(object):
+    """ Limit the number of concurrent requests to a host and enforce a
+        minimum delay between the starts of two requests to the same host.
+        Can be shared by any number of threads.
+    """
+    def __init__(self, max_concurrency=4, delay=0.0):
+        """ :param max_concurrency: Maximum number of requests in flight per
+                host. None or 0 means no limit.
+            :param delay: Minimum number of seconds between two requests to
+                the same host.
+        """
+        self.max_concurrency = max_concurrency
+        self.delay = delay
+        self.lock = threading.Lock()
+        self.semaphores = {}
+        self.next_start = {}
+
+    def _semaphore(self, host):
+        with self.lock:
+            if host not in self.semaphores:
+                self.semaphores[host] = threading.Semaphore(
+                    self.max_concurrency)
+            return self.semaphores[host]
+
+    def _wait_turn(self, host):
+        with self.lock:
+            now = time.time()
+            start = max(now, self.next_start.get(host, now))
+            self.next_start[host] = start + self.delay
+        if start > now:
+            time.sleep(start - now)
+
+    def slot(self, url):
+        """ Return a context manager that blocks until a request to the host
+            of `url` is allowed.
+        """
+        return _HostSlot(self, urlparse(url).netloc.lower())
+
+
+class _HostSlot(object):
+    def __init__(self, throttle, host):
+        self.throttle = throttle
+        self.host = host
+        self.semaphore = None
+
+    def __enter__(self):
+        if self.throttle.max_concurrency:
+            self.semaphore = self.throttle._semaphore(self.host)
+            self.semaphore.acquire()
+        if self.throttle.delay:
+            self.throttle._wait_turn(self.host)
+        return self
+
+    def __exit__(self, *args):
+        if self.semaphore is not None:
+            self.semaphore.release()
+        return False
@@ -0,0 +1,84 @@
+""" SimHash content fingerprints and an index for near-duplicate lookups.
+
+    Usage example:
+
+        >>> index = SimHashIndex(distance=3)
+        >>> index.add(simhash(tokenize(text)))
+        >>> index.find(simhash(tokenize(other_text)))
+
+"""
+from collections import Counter
+import hashlib
+import re
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """ Return the lowercased word bigrams of a text. """
+    words = TOKEN_RE.findall(text.lower())
+    if len(words) < 2:
+        return words
+    return [a + ' ' + b for a, b in zip(words, words[1:])]
+
+
+def _hash64(token):
+    if isinstance(token, unicode):
+        token = token.encode('utf-8')
+    return int(hashlib.md5(token).hexdigest()[:16], 16)
+
+
+def simhash(tokens, bits=64):
+    """ Return the SimHash of a list of tokens: texts that share most of
+        their tokens get fingerprints that differ in few bits.
+    """
+    v = [0] * bits
+    for token, weight in Counter(tokens).iteritems():
+        h = _hash64(token)
+        for i in xrange(bits):
+            if h & (1 << i):
+                v[i] += weight
+            else:
+                v[i] -= weight
+    fingerprint = 0
+    for i in xrange(bits):
+        if v[i] > 0:
+            fingerprint |= 1 << i
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class SimHashIndex(object):
+    """ Index of fingerprints that finds a stored fingerprint within
+        `distance` bits of a query. The fingerprint is split into
+        `distance + 1` bands; two fingerprints within `distance` bits agree
+        on at least one band, so only the entries sharing a band with the
+        query are compared.
+    """
+    def __init__(self, distance=3, bits=64):
+        self.distance = distance
+        self.bits = bits
+        n_bands = distance + 1
+        width = bits // n_bands
+        self.bands = [(i * width, bits if i == n_bands - 1 else
+                       (i + 1) * width) for i in xrange(n_bands)]
+        self.buckets = [{} for band in self.bands]
+
+    def _keys(self, fingerprint):
+        return [(fingerprint >> start) & ((1 << (end - start)) - 1)
+                for start, end in self.bands]
+
+    def find(self, fingerprint):
+        """ Return a stored fingerprint within `distance` bits, or None. """
+        for bucket, key in zip(self.buckets, self._keys(fingerprint)):
+            for other in bucket.get(key, ()):
+                if hamming_distance(fingerprint, other) <= self.distance:
+                    return other
+        return None
+
+    def add(self, fingerprint):
+        for bucket, key in zip(self.buckets, self._keys(fingerprint)):
+            bucket.setdefault(key, []).append(fingerprint)
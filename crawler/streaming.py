@@ -0,0 +1,38 @@
+""" Helpers for streaming pipelines that process an unbounded sequence of
+    items in a pool with bounded memory.
+
+    Usage example:
+
+        >>> pool = ThreadPool(8)
+        >>> for result in bounded_imap(pool, crawl_site, urls, 16):
+        ...     print result
+
+"""
+from collections import deque
+from itertools import islice
+
+
+def bounded_imap(pool, func, iterable, max_pending):
+    """ Like `pool.imap(func, iterable)`, but at most `max_pending` items are
+        taken from `iterable` and processed ahead of the consumer. The next
+        item is only submitted after the consumer took a result, so slow
+        consumers throttle the producer. Results are yielded in input order.
+    """
+    items = iter(iterable)
+    pending = deque(pool.apply_async(func, (item,))
+                    for item in islice(items, max(1, max_pending)))
+    while pending:
+        result = pending.popleft().get()
+        for item in islice(items, 1):
+            pending.append(pool.apply_async(func, (item,)))
+        yield result
+
+
+def chunks(iterable, size):
+    """ Yield lists of `size` consecutive items of `iterable`. """
+    items = iter(iterable)
+    while True:
+        chunk = list(islice(items, max(1, size)))
+        if not chunk:
+            return
+        yield chunk
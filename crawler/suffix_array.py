@@ -0,0 +1,164 @@
+""" Suffix array tools for finding repeated substrings in linear passes.
+
+    Sequences can be strings or lists of integers (e.g. word ids).
+
+    Usage example:
+
+        >>> sa = suffix_array(seq)
+        >>> lcp = lcp_array(seq, sa)
+        >>> lpf, src = longest_previous_factor(sa, lcp)
+
+"""
+
+
+def suffix_array(seq):
+    """ Return the suffix array of `seq`: the start positions of all
+        suffixes in lexicographic order. Uses SA-IS, i.e. O(n) time after
+        sorting the distinct symbols of `seq`.
+    """
+    if isinstance(seq, basestring):
+        seq = [ord(c) for c in seq]
+    symbols = sorted(set(seq))
+    ids = dict((symbol, i) for i, symbol in enumerate(symbols))
+    return _sa_is([ids[symbol] for symbol in seq], max(len(symbols) - 1, 0))
+
+
+def _sa_is(s, upper):
+    """ Return the suffix array of the list `s` of integers in
+        `[0, upper]` with SA-IS (induced sorting).
+    """
+    n = len(s)
+    if n == 0:
+        return []
+    if n == 1:
+        return [0]
+    if n == 2:
+        return [0, 1] if s[0] < s[1] else [1, 0]
+    sa = [0] * n
+    # ls[i]: the suffix at i is smaller than the one at i + 1 (S-type)
+    ls = [False] * n
+    for i in xrange(n - 2, -1, -1):
+        ls[i] = ls[i + 1] if s[i] == s[i + 1] else s[i] < s[i + 1]
+    sum_l = [0] * (upper + 1)
+    sum_s = [0] * (upper + 1)
+    for i in xrange(n):
+        if not ls[i]:
+            sum_s[s[i]] += 1
+        else:
+            sum_l[s[i] + 1] += 1
+    for i in xrange(upper + 1):
+        sum_s[i] += sum_l[i]
+        if i < upper:
+            sum_l[i + 1] += sum_s[i]
+
+    def induce(lms):
+        """ Place the LMS suffixes in the given order at the ends of their
+            buckets and induce the order of the L- and S-type suffixes.
+        """
+        sa[:] = [-1] * n
+        buf = sum_s[:]
+        for d in lms:
+            if d == n:
+                continue
+            sa[buf[s[d]]] = d
+            buf[s[d]] += 1
+        buf = sum_l[:]
+        sa[buf[s[n - 1]]] = n - 1
+        buf[s[n - 1]] += 1
+        for i in xrange(n):
+            v = sa[i]
+            if v >= 1 and not ls[v - 1]:
+                sa[buf[s[v - 1]]] = v - 1
+                buf[s[v - 1]] += 1
+        buf = sum_l[:]
+        for i in xrange(n - 1, -1, -1):
+            v = sa[i]
+            if v >= 1 and ls[v - 1]:
+                buf[s[v - 1] + 1] -= 1
+                sa[buf[s[v - 1] + 1]] = v - 1
+
+    # Leftmost S-type positions (LMS) and their numbers
+    lms_map = [-1] * (n + 1)
+    lms = []
+    for i in xrange(1, n):
+        if not ls[i - 1] and ls[i]:
+            lms_map[i] = len(lms)
+            lms.append(i)
+    m = len(lms)
+    induce(lms)
+    if m:
+        # Name the LMS substrings by their order and sort the LMS suffixes
+        # by recursing on the sequence of names
+        sorted_lms = [v for v in sa if lms_map[v] != -1]
+        rec_s = [0] * m
+        rec_upper = 0
+        for i in xrange(1, m):
+            l, r = sorted_lms[i - 1], sorted_lms[i]
+            end_l = lms[lms_map[l] + 1] if lms_map[l] + 1 < m else n
+            end_r = lms[lms_map[r] + 1] if lms_map[r] + 1 < m else n
+            same = end_l - l == end_r - r
+            if same:
+                while l < end_l and s[l] == s[r]:
+                    l += 1
+                    r += 1
+                same = l < n and r < n and s[l] == s[r]
+            if not same:
+                rec_upper += 1
+            rec_s[lms_map[sorted_lms[i]]] = rec_upper
+        rec_sa = _sa_is(rec_s, rec_upper)
+        induce([lms[i] for i in rec_sa])
+    return sa
+
+
+def lcp_array(seq, sa):
+    """ Return the LCP array of `seq` (Kasai's algorithm, O(n)): `lcp[i]` is
+        the length of the longest common prefix of the suffixes `sa[i - 1]`
+        and `sa[i]`, and `lcp[0]` is 0.
+    """
+    n = len(seq)
+    rank = [0] * n
+    for i, p in enumerate(sa):
+        rank[p] = i
+    lcp = [0] * n
+    h = 0
+    for p in xrange(n):
+        i = rank[p]
+        if i == 0:
+            h = 0
+            continue
+        q = sa[i - 1]
+        while p + h < n and q + h < n and seq[p + h] == seq[q + h]:
+            h += 1
+        lcp[i] = h
+        if h:
+            h -= 1
+    return lcp
+
+
+def longest_previous_factor(sa, lcp):
+    """ Return the longest previous factor arrays `(lpf, src)` in O(n):
+        `lpf[p]` is the length of the longest prefix of the suffix at `p`
+        that also starts at an earlier position, and `src[p]` is such an
+        earlier position (-1 if `lpf[p]` is 0).
+    """
+    n = len(sa)
+    lpf = [0] * n
+    src = [-1] * n
+    # Stack of (suffix array index, lcp with the entry below), with
+    # increasing suffix positions from bottom to top
+    stack = []
+    for i in xrange(n + 1):
+        pos = sa[i] if i < n else -1
+        l = lcp[i] if i < n else 0
+        while stack and pos < sa[stack[-1][0]]:
+            top, top_lcp = stack.pop()
+            # The entry below is the nearest earlier suffix before `top` in
+            # suffix array order, `i` the nearest one after it
+            if top_lcp >= l and stack:
+                lpf[sa[top]], src[sa[top]] = top_lcp, sa[stack[-1][0]]
+            elif l > 0:
+                lpf[sa[top]], src[sa[top]] = l, pos
+            l = min(l, top_lcp)
+        if i < n:
+            stack.append((i, l))
+    return lpf, src
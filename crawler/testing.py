@@ -0,0 +1,152 @@
+""" Helpers for tests and benchmarks: a local HTTP server replaying a
+    synthetic or recorded site, so that crawling can be exercised without
+    hitting live websites, and generation of small PDF documents.
+
+    Usage example:
+
+        >>> server = SiteServer(site_graph(20, fanout=3))
+        >>> server.start()
+        >>> htmls = crawl.extract_html_bfs(server.url('/'))
+        >>> server.stop()
+        >>> pdf = make_pdf(['Speisekarte', 'Pizza Margherita 8,50'])
+        >>> text_extraction.extract_text_pdf(pdf)
+
+"""
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+import hashlib
+import threading
+import time
+
+
+def site_graph(n_pages, fanout=3):
+    """ Return a dictionary mapping paths to HTML pages of a synthetic site
+        with `n_pages` pages. Page `i` links to the pages `i*fanout+1` to
+        `i*fanout+fanout` (a tree) and back to the homepage.
+    """
+    pages = {}
+    for i in xrange(n_pages):
+        links = ['/page%d.html' % j
+                 for j in xrange(i * fanout + 1, i * fanout + fanout + 1)
+                 if j < n_pages]
+        links.append('/')
+        pages['/' if i == 0 else '/page%d.html' % i] = (
+            '<html><head><title>Page %d</title></head><body>'
+            '<h1>Header %d</h1><p>Content of page %d</p>%s</body></html>' % (
+                i, i, i, ''.join('<a href="%s">link</a>' % l for l in links)))
+    return pages
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class SiteServer(object):
+    """ Serve a dictionary of `{path: body}` on a random local port. Unknown
+        paths return a 404. Every response carries an ETag, and conditional
+        requests with a matching If-None-Match get a 304. Requested paths are
+        recorded in `requests`, response status codes in `statuses` and the
+        number of accepted TCP connections in `connections`. Responses are
+        delayed by `delay` seconds, and 200 responses carry the additional
+        `headers`.
+    """
+    def __init__(self, pages, delay=0, headers=None):
+        self.pages = pages
+        self.delay = delay
+        self.headers = headers or {}
+        self.requests = []
+        self.statuses = []
+        self.connections = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            wbufsize = -1
+
+            def setup(self):
+                server.connections += 1
+                BaseHTTPRequestHandler.setup(self)
+
+            def do_GET(self):
+                server.requests.append(self.path)
+                if server.delay:
+                    time.sleep(server.delay)
+                body = server.pages.get(self.path)
+                if body is None:
+                    server.statuses.append(404)
+                    self.send_error(404)
+                    return
+                etag = '"%s"' % hashlib.md5(body).hexdigest()
+                if self.headers.get('If-None-Match') == etag:
+                    server.statuses.append(304)
+                    self.send_response(304)
+                    self.send_header('ETag', etag)
+                    self.end_headers()
+                    return
+                server.statuses.append(200)
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html')
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in server.headers.iteritems():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = _ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = None
+
+    def url(self, path='/'):
+        return 'http://127.0.0.1:%d%s' % (self.httpd.server_port, path)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever,
+                                       args=(0.05,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+
+
+def _escape(text):
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def make_pdf(pages):
+    """ Return a PDF with one page per string in `pages`, each showing its
+        string (ASCII) as one line of Helvetica text.
+    """
+    n = len(pages)
+    # Objects: 1 catalog, 2 page tree, 3 font, then a page and a content
+    # stream per page
+    page_ids = [4 + 2 * i for i in xrange(n)]
+    objects = [
+        '<< /Type /Catalog /Pages 2 0 R >>',
+        '<< /Type /Pages /Kids [%s] /Count %d >>' % (
+            ' '.join('%d 0 R' % i for i in page_ids), n),
+        '<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>']
+    for i, text in enumerate(pages):
+        stream = 'BT /F1 12 Tf 72 720 Td (%s) Tj ET' % _escape(text)
+        objects.append(
+            '<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] '
+            '/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>' %
+            (page_ids[i] + 1))
+        objects.append('<< /Length %d >>\nstream\n%s\nendstream' % (
+            len(stream), stream))
+    out = ['%PDF-1.4\n']
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(sum(len(part) for part in out))
+        out.append('%d 0 obj\n%s\nendobj\n' % (i + 1, obj))
+    xref = sum(len(part) for part in out)
+    out.append('xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1))
+    out.extend('%010d 00000 n \n' % offset for offset in offsets)
+    out.append('trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+               % (len(objects) + 1, xref))
+    return ''.join(out)
@@ -0,0 +1,147 @@
+""" In-process stand-in for the subset of the `rethinkdb` client used by
+    `IoRethinkdb`, so that it can be tested without a database server.
+    Every executed query is recorded in `FakeConnection.queries`. Like real
+    connections, a `FakeConnection` must not be used by two threads at once;
+    this raises a `RuntimeError`.
+
+    Usage example:
+
+        >>> from crawler import io_rethinkdb
+        >>> io_rethinkdb.r = fake_rethinkdb
+        >>> io = io_rethinkdb.IoRethinkdb('localhost', 28015)
+
+"""
+import copy
+import threading
+import time
+import uuid
+
+databases = {}
+
+
+def reset():
+    databases.clear()
+
+
+class FakeConnection(object):
+    def __init__(self):
+        self.db = None
+        self.queries = []
+        self.lock = threading.Lock()
+
+    def repl(self):
+        return self
+
+    def use(self, db):
+        self.db = db
+
+
+def connect(host, port):
+    return FakeConnection()
+
+
+class Query(object):
+    def __init__(self, name, func):
+        self.name = name
+        self.func = func
+
+    def run(self, conn):
+        if not conn.lock.acquire(False):
+            raise RuntimeError('Connection used by two threads at once')
+        try:
+            conn.queries.append(self.name)
+            # Widen the window in which concurrent use is detected
+            time.sleep(0.001)
+            return self.func(conn)
+        finally:
+            conn.lock.release()
+
+
+class Selection(Query):
+    """ Query returning rows, which can be plucked or updated. """
+    def pluck(self, *fields):
+        return Selection(self.name, lambda conn: [
+            dict((f, row[f]) for f in fields if f in row)
+            for row in self.func(conn)])
+
+    def update(self, changes):
+        def run(conn):
+            for row in self.func(conn):
+                row.update(changes)
+        return Query(self.name + '.update', run)
+
+
+def literal(value):
+    return value
+
+
+def binary(value):
+    return str(value)
+
+
+def db_list():
+    return Query('db_list', lambda conn: list(databases))
+
+
+def db_create(name):
+    return Query('db_create',
+                 lambda conn: databases.setdefault(name, {}))
+
+
+def table_create(name):
+    def run(conn):
+        databases[conn.db][name] = {'rows': {}, 'indexes': set()}
+    return Query('table_create', run)
+
+
+class table(object):
+    def __init__(self, name):
+        self.table_name = name
+
+    def _table(self, conn):
+        return databases[conn.db][self.table_name]
+
+    def pluck(self, *fields):
+        return Selection('table', lambda conn: list(
+            self._table(conn)['rows'].values())).pluck(*fields)
+
+    def index_list(self):
+        return Query('index_list',
+                     lambda conn: sorted(self._table(conn)['indexes']))
+
+    def index_create(self, index):
+        return Query('index_create',
+                     lambda conn: self._table(conn)['indexes'].add(index))
+
+    def index_wait(self, index):
+        return Query('index_wait', lambda conn: None)
+
+    def insert(self, docs, conflict='error'):
+        if isinstance(docs, dict):
+            docs = [docs]
+
+        def run(conn):
+            rows = self._table(conn)['rows']
+            for doc in docs:
+                doc = copy.deepcopy(doc)
+                doc.setdefault('id', str(uuid.uuid4()))
+                if doc['id'] in rows and conflict != 'replace':
+                    raise ValueError('Duplicate primary key')
+                rows[doc['id']] = doc
+        return Query('insert', run)
+
+    def get_all(self, *keys, **kwargs):
+        index = kwargs.get('index', 'id')
+
+        def run(conn):
+            t = self._table(conn)
+            if index != 'id' and index not in t['indexes']:
+                raise ValueError('Index %s does not exist' % index)
+            return [row for key in keys for row in t['rows'].values()
+                    if row.get(index) == key]
+        return Selection('get_all', run)
+
+    def filter(self, fields):
+        return Selection('filter', lambda conn: [
+            row for row in self._table(conn)['rows'].values()
+            if all(row.get(k) == v for k, v in fields.items())])
@@ -0,0 +1,72 @@
+import multiprocessing
+import time
+from nose.tools import eq_, raises
+
+from crawler.batch_extraction import extract_sites, iter_extract_sites
+from crawler.testing import site_graph
+from crawler.text_extraction import extract_texts
+from crawler.timeouts import TimeLimitExceeded, time_limit
+
+PARAMS = {'title_weight': 2, 'header_weights': [3, 3, 2, 2, 1, 1],
+          'hp_weight': 2}
+
+
+def sites(n):
+    return [sorted(site_graph(i + 1).values()) for i in xrange(n)]
+
+
+def test_parallel_same_as_serial():
+    htmls = sites(12)
+    serial = [extract_texts(h, **PARAMS) for h in htmls]
+    eq_(extract_sites(htmls, workers=1, **PARAMS), serial)
+    eq_(extract_sites(htmls, workers=3, chunksize=2, **PARAMS), serial)
+
+
+def test_doc_timeout():
+    html = '<p>' + ' '.join(['SpeisekarteOnline'] * 200000) + '</p>'
+    eq_(extract_texts(['<p>Pizza Pasta</p>', html, '<p>Vino</p>'],
+                      doc_timeout=0.01), ['pizza pasta', '', 'vino'])
+
+
+@raises(TimeLimitExceeded)
+def test_time_limit():
+    with time_limit(0.05):
+        while True:
+            pass
+
+
+def test_nested_time_limits():
+    start = time.time()
+    try:
+        with time_limit(0.1):
+            try:
+                with time_limit(1):
+                    while True:
+                        pass
+            except TimeLimitExceeded:
+                pass
+    except TimeLimitExceeded:
+        pass
+    assert time.time() - start < 0.5
+
+
+def test_workers_start_before_sites_are_taken():
+    taken = []
+
+    def html_lists():
+        taken.append(len(multiprocessing.active_children()))
+        yield ['<p>Pizza</p>']
+    docs = iter_extract_sites(html_lists(), workers=2)
+    eq_(len(multiprocessing.active_children()), 2)
+    eq_(list(docs), [['pizza']])
+    eq_(taken, [2])
+
+
+def test_unstarted_workers_are_terminated():
+    docs = iter_extract_sites([['<p>Pizza</p>']], workers=2)
+    eq_(len(multiprocessing.active_children()), 2)
+    docs.close()
+    eq_(multiprocessing.active_children(), [])
+    docs = iter_extract_sites([['<p>Pizza</p>']], workers=2)
+    del docs
+    eq_(multiprocessing.active_children(), [])
@@ -0,0 +1,20 @@
+import shutil
+import tempfile
+
+from nose.tools import eq_
+
+from crawler.benchmarks.bench_pipeline import (
+    load_corpus, save_corpus, synthetic_corpus)
+
+
+def test_corpus_round_trip():
+    corpus = synthetic_corpus(6, n_pages=2, page_words=30)
+    tmpdir = tempfile.mkdtemp()
+    try:
+        save_corpus(corpus, tmpdir)
+        loaded = load_corpus(tmpdir)
+    finally:
+        shutil.rmtree(tmpdir)
+    # Sites are loaded grouped by label, in their original order
+    eq_(loaded, sorted(corpus, key=lambda site: site[0]))
+    eq_(sorted(loaded[0][1]), ['/', '/about.html', '/menu.html', '/menu.pdf'])
@@ -0,0 +1,35 @@
+from nose.tools import eq_
+
+from crawler.boilerplate import remove_site_boilerplate
+from crawler.text_extraction import extract_texts
+
+NAV = ('home speisekarte mittagstisch reservierung galerie gutscheine '
+       'veranstaltungen kontakt anfahrt')
+FOOTER = 'copyright trattoria roma berlin impressum datenschutz agb newsletter'
+
+
+def test_remove_site_boilerplate():
+    contents = ['pizza margherita pizza salami pizza funghi',
+                'spaghetti carbonara penne arrabbiata lasagne',
+                'tiramisu panna cotta',
+                'geoeffnet montag bis sonntag']
+    docs = [' '.join([NAV, c, FOOTER]) for c in contents]
+    eq_(remove_site_boilerplate(docs, shingle_size=4, min_pages=3), contents)
+
+
+def test_keeps_text_of_few_pages():
+    docs = [NAV + ' pizza', NAV + ' pasta', 'wein und bier am abend']
+    eq_(remove_site_boilerplate(docs, 0.9, shingle_size=4, min_pages=3),
+        docs)
+    eq_(remove_site_boilerplate(docs, 0.6, shingle_size=4, min_pages=3),
+        ['pizza', 'pasta', 'wein und bier am abend'])
+    eq_(remove_site_boilerplate(docs[:2], shingle_size=4, min_pages=3),
+        docs[:2])
+
+
+def test_extract_texts_template_fraction():
+    htmls = ['<div>%s</div><p>%s</p><div>%s</div>' % (NAV, c, FOOTER)
+             for c in ['Pizza Margherita', 'Spaghetti Carbonara',
+                       'Tiramisu Panna Cotta']]
+    eq_(extract_texts(htmls, template_fraction=0.6),
+        ['pizza margherita', 'spaghetti carbonara', 'tiramisu panna cotta'])
@@ -1,60 +1,385 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+import warnings
+from multiprocessing.pool import ThreadPool
+from nose.tools import eq_
+
 from crawler import crawl
+from crawler.doc_cache import SiteCache, params_key
+from crawler.io_fs import IoFs
+from crawler.scheduler import HostThrottle
+from crawler.testing import SiteServer, site_graph
+
+
+def filtered(start_url, url):
+    return crawl.filter_url(crawl.CrawlSession(start_url), url)
 
 
 def test_filter_url():
     # filter out
-    assert crawl.filter_url(
+    assert filtered(
         'http://host/', 'http://host2/index.html')
-    assert crawl.filter_url(
+    assert filtered(
         'http://host/', 'http://host/a.jpg')
-    assert crawl.filter_url(
+    assert filtered(
         'http://host/', 'http://host/a.jpeg')
-    assert crawl.filter_url(
+    assert filtered(
         'http://host/', 'http://host/a.JPEG')
-    assert crawl.filter_url(
+    assert filtered(
         'http://host/', 'http://host/a.JPEG?a=1')
-    assert crawl.filter_url(
+    assert filtered(
         'http://host/', 'http://host/a.png')
-    assert crawl.filter_url(
+    assert filtered(
         'http://host/', 'http://host/a.gif')
-    assert crawl.filter_url(
+    assert filtered(
         'http://host/', 'http://host/a.otherextension')
-    assert crawl.filter_url(
+    assert filtered(
         'http://host/', 'mailto:a@a.es')
-    assert crawl.filter_url(
+    assert filtered(
         'calendar://host/', 'calendar://host/')
-    assert crawl.filter_url(
+    assert filtered(
         'http://host/', '')
-    assert crawl.filter_url(
+    assert filtered(
         'http://host/', '#anchor')
-    assert crawl.filter_url(
+    assert filtered(
         'http://host/', 'http://host/index.php?img=a.jpg')
-    assert crawl.filter_url(
+    assert filtered(
         'noschema', 'noschema')
     # filter in
-    assert not crawl.filter_url(
+    assert not filtered(
         'http://host/slkddskljee', 'http://host/slkddskljee')
-    assert not crawl.filter_url(
+    assert not filtered(
         'http://host/', 'http://host/index.php')
-    assert not crawl.filter_url(
+    assert not filtered(
         'http://host/', 'http://host/index.php?a=1&b=2')
-    assert not crawl.filter_url(
+    assert not filtered(
         'http://host/', 'http://host/index.html')
-    assert not crawl.filter_url(
+    assert not filtered(
         'http://host/', 'http://host/index.htm')
-    assert not crawl.filter_url(
+    assert not filtered(
         'http://host/', 'http://host/index.shtm')
-    assert not crawl.filter_url(
+    assert not filtered(
         'http://host/', 'http://host/index.shtml')
-    assert not crawl.filter_url(
+    assert not filtered(
         'http://host/', 'http://host/index.php')
-    assert not crawl.filter_url(
+    assert not filtered(
         'http://host/', 'http://host/index.jsp')
-    assert not crawl.filter_url(
+    assert not filtered(
         'http://host/', 'http://host/index.aspx')
-    assert not crawl.filter_url(
+    assert not filtered(
         'http://host/', 'http://host/index.asp')
-    assert not crawl.filter_url(
+    assert not filtered(
         'http://host/', 'http://host/folder')
-    assert not crawl.filter_url(
+    assert not filtered(
         'http://host/', 'http://host/folder/another-folder')
+
+
+def test_filter_url_visited():
+    session = crawl.CrawlSession('http://host/')
+    assert not crawl.filter_url(session, 'http://host/index.html')
+    assert session.visit('http://host/index.html')
+    assert not session.visit('http://host/index.html')
+    assert crawl.filter_url(session, 'http://host/index.html')
+    assert not crawl.filter_url(
+        crawl.CrawlSession('http://host/'), 'http://host/index.html')
+
+
+class _LocalSite(object):
+    """ Serve a synthetic site and use an empty crawler cache. """
+    def __init__(self, pages):
+        self.server = SiteServer(pages)
+
+    def __enter__(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.crawler_io = crawl.crawler_io
+        crawl.crawler_io = IoFs(self.tmpdir)
+        self.server.start()
+        return self.server
+
+    def __exit__(self, *args):
+        self.server.stop()
+        crawl.crawler_io = self.crawler_io
+        shutil.rmtree(self.tmpdir)
+
+
+def test_extract_html_bfs_same_documents_as_rec():
+    with _LocalSite(site_graph(40, fanout=3)) as server:
+        rec = crawl.extract_html_rec(server.url('/'), max_depth=4)
+        bfs = crawl.extract_html_bfs(server.url('/'), max_depth=4, workers=4)
+    eq_(len(bfs), 40)
+    eq_(sorted(rec), sorted(bfs))
+    eq_(rec[0], bfs[0])
+
+
+def test_extract_html_bfs_follows_shortest_paths():
+    # '/a' and '/b' are linked from the homepage and from each other. The
+    # depth-first crawl reaches one of them through the other first and
+    # cannot follow its link to the page below it.
+    pages = {'/': '<a href="/a">a</a><a href="/b">b</a>',
+             '/a': '<p>a</p><a href="/b">b</a><a href="/a1">a1</a>',
+             '/b': '<p>b</p><a href="/a">a</a><a href="/b1">b1</a>',
+             '/a1': '<p>a1</p>',
+             '/b1': '<p>b1</p>'}
+    with _LocalSite(pages) as server:
+        rec = crawl.extract_html_rec(server.url('/'), max_depth=3)
+        bfs = crawl.extract_html_bfs(server.url('/'), max_depth=3)
+    eq_(len(rec), 4)
+    assert pages['/a1'] not in rec or pages['/b1'] not in rec
+    eq_(sorted(bfs), sorted(pages.values()))
+
+
+def test_extract_html_rec_positional_arguments():
+    # The old order (start_url, max_depth, url, max_links) still works
+    pages = site_graph(10, fanout=3)
+    with _LocalSite(pages) as server:
+        eq_(len(crawl.extract_html_rec(server.url('/'), 99, None, 4)), 4)
+        eq_(crawl.extract_html_rec(
+            server.url('/'), 1, server.url('/page1.html')),
+            [pages['/page1.html']])
+
+
+def test_concurrent_sessions_are_independent():
+    with _LocalSite(site_graph(30, fanout=3)) as server:
+        url = server.url('/')
+        pool = ThreadPool(4)
+        results = pool.map(
+            lambda i: crawl.extract_html_rec(url, max_depth=99), xrange(4))
+        pool.close()
+        pool.join()
+    eq_([len(htmls) for htmls in results], [30] * 4)
+
+
+def test_extract_html_bfs_max_depth():
+    with _LocalSite(site_graph(40, fanout=3)) as server:
+        eq_(len(crawl.extract_html_bfs(server.url('/'), max_depth=1)), 1)
+        eq_(len(crawl.extract_html_bfs(server.url('/'), max_depth=2)), 4)
+        eq_(len(crawl.extract_html_bfs(server.url('/'), max_depth=3)), 13)
+
+
+def test_extract_html_bfs_max_links():
+    with _LocalSite(site_graph(40, fanout=3)) as server:
+        htmls = crawl.extract_html_bfs(
+            server.url('/'), max_depth=99, max_links=10, workers=4)
+        eq_(len(htmls), 10)
+        eq_(len(server.requests), 10)
+
+
+def test_extract_html_bfs_skips_errors():
+    pages = site_graph(4, fanout=3)
+    del pages['/page2.html']
+    with _LocalSite(pages) as server:
+        eq_(len(crawl.extract_html_bfs(server.url('/'), max_depth=2)), 3)
+
+
+def test_crawl_urls_parallel_keeps_order():
+    sites = [SiteServer(site_graph(5 + i, fanout=2)) for i in xrange(4)]
+    for site in sites:
+        site.start()
+    try:
+        with _LocalSite({}) as down:
+            urls = [sites[0].url('/'), down.url('/'), sites[1].url('/'),
+                    sites[2].url('/'), sites[3].url('/')]
+            htmls = crawl.crawl_urls(urls, max_depth=99, workers=3)
+    finally:
+        for site in sites:
+            site.stop()
+    eq_([len(h) for h in htmls], [5, 0, 6, 7, 8])
+
+
+def test_host_throttle_limits_concurrency():
+    throttle = HostThrottle(max_concurrency=2)
+    lock = threading.Lock()
+    active = {'now': 0, 'max': 0}
+
+    def request(url):
+        with throttle.slot(url):
+            with lock:
+                active['now'] += 1
+                active['max'] = max(active['max'], active['now'])
+            time.sleep(0.02)
+            with lock:
+                active['now'] -= 1
+
+    threads = [threading.Thread(target=request, args=('http://host/%d' % i,))
+               for i in xrange(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    eq_(active['max'], 2)
+
+
+def test_host_throttle_delay():
+    throttle = HostThrottle(max_concurrency=0, delay=0.05)
+    start = time.time()
+    for i in xrange(3):
+        with throttle.slot('http://host/%d' % i):
+            pass
+    with throttle.slot('http://otherhost/'):
+        pass
+    assert time.time() - start >= 0.1
+
+
+def test_download_revalidates_stale_pages():
+    pages = {'/': 'version 1'}
+    with _LocalSite(pages) as server:
+        session = crawl.CrawlSession(server.url('/'))
+        eq_(crawl.download(session, server.url('/')), 'version 1')
+        eq_(crawl.download(session, server.url('/')), 'version 1')
+        eq_(server.statuses, [200])
+        os.environ['CRAWLER_CACHE_MAX_AGE'] = '0'
+        try:
+            eq_(crawl.download(session, server.url('/')), 'version 1')
+            eq_(server.statuses, [200, 304])
+            pages['/'] = 'version 2'
+            eq_(crawl.download(session, server.url('/')), 'version 2')
+            eq_(server.statuses, [200, 304, 200])
+        finally:
+            del os.environ['CRAWLER_CACHE_MAX_AGE']
+        eq_(crawl.download(session, server.url('/')), 'version 2')
+        eq_(len(server.statuses), 3)
+
+
+def test_download_keeps_stale_page_on_failure():
+    pages = {'/': 'version 1'}
+    with _LocalSite(pages) as server:
+        session = crawl.CrawlSession(server.url('/'))
+        url = server.url('/')
+        eq_(crawl.download(session, url), 'version 1')
+        os.environ['CRAWLER_CACHE_MAX_AGE'] = '0'
+        try:
+            del pages['/']
+            eq_(crawl.download(session, url), 'version 1')
+            eq_(server.statuses, [200, 404])
+            # A cached page of a server that is down
+            closed = SiteServer({})
+            closed.start()
+            closed.stop()
+            session.io.save_str(closed.url('/'), 'cached')
+            eq_(crawl.download(session, closed.url('/')), 'cached')
+        finally:
+            del os.environ['CRAWLER_CACHE_MAX_AGE']
+        assert not session.io.is_error_url(url)
+        assert not session.io.is_error_url(closed.url('/'))
+        eq_(crawl.download(session, server.url('/missing')), None)
+        assert session.io.is_error_url(server.url('/missing'))
+
+
+def test_clean_url_strips_session_parameters():
+    eq_(crawl.clean_url('http://host/a.php?PHPSESSID=1234&id=5'),
+        'http://host/a.php?id=5')
+    eq_(crawl.clean_url('http://host/?utm_source=x&utm_medium=y'),
+        'http://host/')
+    eq_(crawl.clean_url('http://host/a?b=1&sidebar=2#top'),
+        'http://host/a?b=1&sidebar=2')
+    os.environ['CRAWLER_URL_CASE_FOLD'] = 'True'
+    try:
+        eq_(crawl.clean_url('http://Host/Index.html'),
+            'http://host/index.html')
+    finally:
+        del os.environ['CRAWLER_URL_CASE_FOLD']
+
+
+def test_crawl_skips_duplicate_pages():
+    pages = site_graph(4, fanout=3)
+    body = '<p>%s</p>' % ' '.join('word%d' % i for i in xrange(200))
+    pages['/'] = pages['/'].replace('</body>', body + '</body>')
+    pages['/page1.html'] = pages['/'].replace(
+        'Page 0', 'Page 0 (printable)').replace(
+        '/page2.html', '/page4.html')
+    pages['/page4.html'] = 'a page only linked from the duplicate'
+    with _LocalSite(pages) as server:
+        eq_(len(crawl.extract_html_rec(server.url('/'))), 5)
+    os.environ['CRAWLER_SIMHASH_DISTANCE'] = '3'
+    try:
+        with _LocalSite(pages) as server:
+            rec = crawl.extract_html_rec(server.url('/'))
+            bfs = crawl.extract_html_bfs(server.url('/'), workers=2)
+    finally:
+        del os.environ['CRAWLER_SIMHASH_DISTANCE']
+    eq_(len(rec), 3)
+    eq_(sorted(rec), sorted(bfs))
+    assert '/page4.html' not in server.requests
+
+
+def test_crawl_parses_pages_once():
+    parsed = []
+    parse_html = crawl.parse_html
+
+    def counting_parse_html(html):
+        parsed.append(html)
+        return parse_html(html)
+    pages = site_graph(7, fanout=2)
+    os.environ['CRAWLER_SIMHASH_DISTANCE'] = '3'
+    crawl.parse_html = counting_parse_html
+    try:
+        for extract in (crawl.extract_html_rec, crawl.extract_html_bfs):
+            del parsed[:]
+            with _LocalSite(pages) as server:
+                htmls = extract(server.url('/'), max_depth=2)
+            eq_(len(parsed), len(htmls))
+            eq_(len(set(parsed)), len(parsed))
+    finally:
+        crawl.parse_html = parse_html
+        del os.environ['CRAWLER_SIMHASH_DISTANCE']
+
+
+def test_crawl_urls_caches_sites():
+    tmpdir = tempfile.mkdtemp()
+    cache_db = os.path.join(tmpdir, 'sites.sqlite')
+    try:
+        with _LocalSite(site_graph(10, fanout=3)) as server:
+            first = crawl.crawl_urls([server.url('/')], max_depth=2,
+                                     cache_htmls=True, cache_db=cache_db)
+            # Without the site cache, pages would be downloaded again
+            crawl.crawler_io = IoFs(os.path.join(tmpdir, 'io'))
+            del server.requests[:]
+            second = crawl.crawl_urls([server.url('/')], max_depth=2,
+                                      cache_htmls=True, cache_db=cache_db)
+            eq_(server.requests, [])
+            deeper = crawl.crawl_urls([server.url('/')], max_depth=3,
+                                      cache_htmls=True, cache_db=cache_db)
+    finally:
+        shutil.rmtree(tmpdir)
+    eq_(len(first[0]), 4)
+    eq_(type(second[0]), list)
+    eq_(second[0], first[0])
+    eq_(len(deeper[0]), 10)
+
+
+def test_crawl_urls_does_not_cache_empty_sites():
+    tmpdir = tempfile.mkdtemp()
+    cache_db = os.path.join(tmpdir, 'sites.sqlite')
+    try:
+        with _LocalSite({}) as server:
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter('always')
+                eq_(crawl.crawl_urls([server.url('/')], cache_htmls=True,
+                                     shelve_db=cache_db), [[]])
+            eq_([w.category for w in caught], [DeprecationWarning])
+            assert not SiteCache(cache_db).has(
+                server.url('/'),
+                params_key({'max_depth': 1, 'max_links': None}))
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+def test_iter_crawl_streams_in_order():
+    sites = [SiteServer(site_graph(2 + i, fanout=2)) for i in xrange(6)]
+    for site in sites:
+        site.start()
+    try:
+        with _LocalSite({}):
+            crawled = crawl.iter_crawl(
+                (site.url('/') for site in sites), max_depth=99, workers=2,
+                max_pending=2)
+            url, htmls = next(crawled)
+            eq_((url, len(htmls)), (sites[0].url('/'), 2))
+            assert sum(1 for site in sites if site.requests) <= 3
+            eq_([len(htmls) for url, htmls in crawled], [3, 4, 5, 6, 7])
+    finally:
+        for site in sites:
+            site.stop()
@@ -0,0 +1,63 @@
+import os
+import pickle
+import shutil
+import tempfile
+
+from nose.tools import eq_, raises
+
+from crawler.doc_cache import SiteCache, params_key
+
+
+class _TempDir(object):
+    def __enter__(self):
+        self.path = tempfile.mkdtemp()
+        return self.path
+
+    def __exit__(self, *args):
+        shutil.rmtree(self.path)
+
+
+def test_params_key():
+    eq_(params_key({'a': 1, 'b': [1, 2]}), params_key({'b': [1, 2], 'a': 1}))
+    assert params_key({'a': 1}) != params_key({'a': 2})
+
+
+def test_put_and_get():
+    with _TempDir() as path:
+        cache = SiteCache(os.path.join(path, 'cache.sqlite'))
+        key = params_key({'title_weight': 2})
+        assert not cache.has(u'http://host/', key)
+        eq_(cache.get(u'http://host/', key), None)
+        cache.put(u'http://host/', key, ['<html>1</html>', u'page \xfc'])
+        site = cache.get(u'http://host/', key)
+        eq_(len(site), 2)
+        eq_(site[1], u'page \xfc')
+        eq_(site[-2], '<html>1</html>')
+        eq_(list(site), ['<html>1</html>', u'page \xfc'])
+        eq_(site[:1], ['<html>1</html>'])
+        eq_(pickle.loads(pickle.dumps(site)), ['<html>1</html>', u'page \xfc'])
+        assert not cache.has(u'http://host/', params_key({'title_weight': 3}))
+        cache.put(u'http://host/', key, [])
+        eq_(list(SiteCache(cache.filename).get(u'http://host/', key)), [])
+
+
+@raises(IndexError)
+def test_index_out_of_range():
+    with _TempDir() as path:
+        cache = SiteCache(os.path.join(path, 'cache.sqlite'))
+        cache.put(u'http://host/', 'key', ['page'])
+        cache.get(u'http://host/', 'key')[1]
+
+
+def test_refuses_other_files():
+    with _TempDir() as path:
+        # E.g. a Berkeley DB file written by `shelve`
+        filename = os.path.join(path, 'html_cache.shelve')
+        with open(filename, 'wb') as f:
+            f.write('\x00\x06\x15\x61' + '\x00' * 100)
+        try:
+            SiteCache(filename)
+        except ValueError as e:
+            assert 'not an SQLite database' in str(e)
+        else:
+            assert False, 'SiteCache opened a shelve file'
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from bs4 import BeautifulSoup
+from nose.tools import eq_
+
+from crawler import html_parse
+from crawler.html_parse import extract_content_url, is_visible_elem
+from crawler.text_extraction import extract_text_html
+
+HTML = u"""<!DOCTYPE html>
+<html><head><title>Trattoria Süd</title>
+<meta http-equiv="refresh" content="0;url=/refresh.html">
+<meta name="description" content="Pizza und Pasta">
+<style>body { color: red; }</style><script>var a = 1;</script></head>
+<body><!-- navigation -->
+<h1>Willkommen</h1><p>Unsere <b>Speisekarte</b> &amp; Weine</p>
+<h2>Pizza</h2><h2>Pasta <i>fresca</i></h2><h3>Dolci</h3>
+<a href=" /menu.html ">Menu</a><a name="top">no link</a>
+<a href="mailto:info@example.com">Mail</a>
+<frameset><frame src="frame.html"></frameset>
+<csaction val0="action.html"></csaction>
+<h6>Impressum</h6><title>Second title</title>
+</body></html>"""
+
+
+def legacy_extract_text_html(html, title_weight=None, header_weights=None):
+    soup = BeautifulSoup(html)
+    texts = soup.findAll(text=True)
+    text = ' '.join(filter(is_visible_elem, texts))
+    if title_weight:
+        if soup.title is not None and soup.title.string is not None:
+            text = text + ' ' + ' '.join(
+                [soup.title.string] * (title_weight-1))
+    if header_weights:
+        for i in xrange(6):
+            text = text + ' ' + ' '.join(
+                [' '.join([elem.getText() for elem in soup.findAll(
+                    'h' + str(i+1))])] * header_weights[i])
+    return text
+
+
+def legacy_links(html):
+    soup = BeautifulSoup(html)
+    return ([tag['href'].strip() for tag in soup.findAll('a', href=True)] +
+            [tag['src'].strip() for tag in soup.findAll('frame', src=True)] +
+            [tag['val0'].strip()
+             for tag in soup.findAll('csaction', val0=True)] +
+            [extract_content_url(tag['content']).strip()
+             for tag in soup.findAll('meta', content=True)])
+
+
+def test_text_same_as_separate_parses():
+    for html in [HTML, u'', u'<p>plain</p>', u'<title></title><h1>a</h1>']:
+        eq_(extract_text_html(html), legacy_extract_text_html(html))
+        eq_(extract_text_html(html, 2, [3, 3, 2, 2, 1, 1]),
+            legacy_extract_text_html(html, 2, [3, 3, 2, 2, 1, 1]))
+
+
+def test_links_same_as_separate_parses():
+    eq_(sorted(html_parse.parse_html(HTML).links), sorted(legacy_links(HTML)))
+
+
+def test_parsed_page():
+    page = html_parse.parse_html(HTML)
+    eq_(page.title, u'Trattoria Süd')
+    eq_(page.headers[1], [u'Pizza', u'Pasta fresca'])
+    eq_(page.headers[3], [])
+    assert u'Speisekarte  & Weine' in page.text
+    assert u'color' not in page.text
@@ -0,0 +1,52 @@
+from nose.tools import eq_, raises
+import requests
+
+from crawler.http_client import HttpClient, ResponseTooLarge
+from crawler.testing import SiteServer, site_graph
+
+
+def test_connections_are_reused():
+    server = SiteServer(site_graph(10))
+    server.start()
+    try:
+        client = HttpClient()
+        for i in xrange(1, 10):
+            response, body = client.get(server.url('/page%d.html' % i))
+            eq_(response.status_code, 200)
+            assert 'Content of page %d' % i in body
+    finally:
+        server.stop()
+    eq_(server.connections, 1)
+
+
+@raises(ResponseTooLarge)
+def test_max_size():
+    server = SiteServer({'/': 'x' * 1000})
+    server.start()
+    try:
+        HttpClient(max_size=999).get(server.url('/'))
+    finally:
+        server.stop()
+
+
+@raises(requests.exceptions.RequestException)
+def test_read_timeout():
+    server = SiteServer({'/': 'slow'}, delay=0.5)
+    server.start()
+    try:
+        HttpClient(read_timeout=0.1).get(server.url('/'))
+    finally:
+        server.stop()
+
+
+def test_cookies_are_not_kept():
+    server = SiteServer({'/': 'page'},
+                        headers={'Set-Cookie': 'session=1; Path=/'})
+    server.start()
+    try:
+        client = HttpClient()
+        response, body = client.get(server.url('/'))
+        eq_(body, 'page')
+        eq_(len(client.session.cookies), 0)
+    finally:
+        server.stop()
@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+from multiprocessing import Pool
+
+from nose.tools import eq_, raises
+
+from crawler import crawl
+from crawler.io_base import CrawlerIo, make_crawler_io
+from crawler.io_fs import IoFs
+from crawler.io_segments import IoSegmentFs
+from crawler.io_sqlite import IoSqlite
+
+
+class _TempDir(object):
+    def __enter__(self):
+        self.path = tempfile.mkdtemp()
+        return self.path
+
+    def __exit__(self, *args):
+        shutil.rmtree(self.path)
+
+
+def check_backend(io):
+    eq_(io.load_str(u'http://host/'), None)
+    eq_(io.load_meta(u'http://host/'), None)
+    io.save_str(u'http://host/', '<html>\xff</html>')
+    io.save_str(u'http://host/\xfc', u'unicode \xfc')
+    io.save_meta(u'http://host/', {'etag': '"1"', 'fetched': 1.5})
+    eq_(io.load_str(u'http://host/'), '<html>\xff</html>')
+    eq_(io.load_str(u'http://host/\xfc'), u'unicode \xfc')
+    eq_(io.load_meta(u'http://host/'), {'etag': '"1"', 'fetched': 1.5})
+    io.save_str(u'http://host/\xfc', 'replaced')
+    eq_(io.load_str(u'http://host/\xfc'), 'replaced')
+    eq_(io.get_redirect(u'http://host/a'), u'http://host/a')
+    io.add_redirect(u'http://host/a', u'http://host/b')
+    eq_(io.get_redirect(u'http://host/a'), u'http://host/b')
+    assert not io.is_error_url(u'http://host/e')
+    io.add_error_url(u'http://host/e')
+    io.add_error_url(u'http://host/e')
+    assert io.is_error_url(u'http://host/e')
+    io.flush()
+    eq_(sorted(io.iter_keys()), [u'http://host/', u'http://host/\xfc'])
+    eq_(list(io.iter_redirects()), [(u'http://host/a', u'http://host/b')])
+    eq_(list(io.iter_error_urls()), [u'http://host/e'])
+
+
+def test_backends_implement_interface():
+    with _TempDir() as path:
+        check_backend(IoFs(os.path.join(path, 'fs')))
+        check_backend(IoSegmentFs(os.path.join(path, 'segments')))
+        check_backend(IoSqlite(os.path.join(path, 'crawler.db')))
+
+
+def _save_pages(args):
+    filename, worker = args
+    io = IoSqlite(filename)
+    for i in xrange(50):
+        io.save_str(u'http://host/%d/%d' % (worker, i), 'page %d' % i)
+        io.add_error_url(u'http://host/error%d' % i)
+
+
+def test_sqlite_concurrent_processes():
+    with _TempDir() as path:
+        filename = os.path.join(path, 'crawler.db')
+        io = IoSqlite(filename)
+        pool = Pool(4)
+        pool.map(_save_pages, [(filename, worker) for worker in xrange(4)])
+        pool.close()
+        pool.join()
+        eq_([io.load_str(u'http://host/%d/49' % worker)
+             for worker in xrange(4)], ['page 49'] * 4)
+        assert io.is_error_url(u'http://host/error49')
+
+
+def test_configured_backend():
+    with _TempDir() as path:
+        os.environ['CRAWLER_PATH'] = path
+        try:
+            eq_(crawl.crawler_io_backend(), 'fs')
+            os.environ['CRAWLER_USE_SEGMENTS'] = 'True'
+            eq_(crawl.crawler_io_backend(), 'segments')
+            os.environ['CRAWLER_IO_BACKEND'] = 'sqlite'
+            eq_(crawl.crawler_io_backend(), 'sqlite')
+            io = make_crawler_io('sqlite')
+            assert isinstance(io, IoSqlite)
+            eq_(io.filename, os.path.join(path, 'crawler.db'))
+        finally:
+            for key in ('CRAWLER_PATH', 'CRAWLER_USE_SEGMENTS',
+                        'CRAWLER_IO_BACKEND'):
+                os.environ.pop(key, None)
+
+
+@raises(ValueError)
+def test_unknown_backend():
+    make_crawler_io('nosuchbackend')
+
+
+class _PartialIo(CrawlerIo):
+    def save_str(self, key, s):
+        pass
+
+
+@raises(TypeError)
+def test_backends_must_implement_interface():
+    _PartialIo()
@@ -0,0 +1,142 @@
+from multiprocessing.pool import ThreadPool
+
+from nose.tools import eq_
+
+from crawler import io_rethinkdb
+from crawler.tests import fake_rethinkdb
+
+
+class _FakeDb(object):
+    """ Run `IoRethinkdb` against the in-process fake client. """
+    def __enter__(self):
+        fake_rethinkdb.reset()
+        self.r = io_rethinkdb.r
+        io_rethinkdb.r = fake_rethinkdb
+        return fake_rethinkdb.databases
+
+    def __exit__(self, *args):
+        io_rethinkdb.r = self.r
+
+
+def test_save_and_load():
+    with _FakeDb():
+        io = io_rethinkdb.IoRethinkdb('localhost', 28015)
+        eq_(io.load_str(u'http://host/'), None)
+        io.save_str(u'http://host/', '<html></html>')
+        io.save_meta(u'http://host/', {'etag': '"1"'})
+        eq_(io.load_str(u'http://host/'), '<html></html>')
+        io.flush()
+        io = io_rethinkdb.IoRethinkdb('localhost', 28015)
+        eq_(io.load_str(u'http://host/'), '<html></html>')
+        eq_(io.load_meta(u'http://host/'), {'etag': '"1"'})
+        io.save_meta(u'http://host/', {'etag': '"2"'})
+        eq_(io.load_meta(u'http://host/'), {'etag': '"2"'})
+
+
+def test_repeated_saves_replace_rows():
+    with _FakeDb() as databases:
+        io = io_rethinkdb.IoRethinkdb('localhost', 28015, batch_size=1)
+        for i in xrange(3):
+            io.save_str(u'http://host/', 'version %d' % i)
+            io.add_error_url(u'http://host/error')
+            io.add_redirect(u'http://host/a', u'http://host/b%d' % i)
+        eq_(len(databases['resmio']['binary']['rows']), 1)
+        eq_(len(databases['resmio']['errors']['rows']), 1)
+        eq_(len(databases['resmio']['redirects']['rows']), 1)
+        eq_(io.load_str(u'http://host/'), 'version 2')
+        eq_(io.get_redirect(u'http://host/a'), u'http://host/b2')
+
+
+def test_writes_are_batched():
+    with _FakeDb():
+        io = io_rethinkdb.IoRethinkdb('localhost', 28015, batch_size=10)
+        queries = io._conn().queries
+        del queries[:]
+        for i in xrange(4):
+            io.save_str(u'http://host/%d' % i, 'page')
+            io.add_redirect(u'http://host/%d' % i, u'http://host/%d/' % i)
+            io.add_error_url(u'http://host/error%d' % i)
+        eq_(queries, ['insert'] * 3)
+        eq_(io.get_redirect(u'http://host/3'), u'http://host/3/')
+        assert io.is_error_url(u'http://host/error3')
+        io.flush()
+        eq_(len(queries), 5)
+
+
+def test_prefetch_answers_lookups():
+    with _FakeDb():
+        io = io_rethinkdb.IoRethinkdb('localhost', 28015, batch_size=1)
+        io.save_str(u'http://host/1', 'page 1')
+        io.add_redirect(u'http://host/2', u'http://other/2')
+        io.add_error_url(u'http://host/3')
+        io = io_rethinkdb.IoRethinkdb('localhost', 28015)
+        urls = [u'http://host/%d' % i for i in xrange(1, 5)]
+        queries = io._conn().queries
+        del queries[:]
+        io.prefetch(urls)
+        eq_(len(queries), 3)
+        eq_([io.load_str(url) for url in urls], ['page 1', None, None, None])
+        eq_([io.get_redirect(url) for url in urls],
+            [urls[0], u'http://other/2', urls[2], urls[3]])
+        eq_([io.is_error_url(url) for url in urls],
+            [False, False, True, False])
+        eq_(len(queries), 3)
+
+
+def test_legacy_rows_are_found():
+    with _FakeDb() as databases:
+        io = io_rethinkdb.IoRethinkdb('localhost', 28015)
+        fake_rethinkdb.table('redirects').insert(
+            {'url1': u'http://host/a', 'url2': u'http://host/b'}).run(io._conn())
+        fake_rethinkdb.table('binary').insert(
+            {'key': u'http://host/', 'value': 'old'}).run(io._conn())
+        eq_(io.get_redirect(u'http://host/a'), u'http://host/b')
+        eq_(io.load_str(u'http://host/'), 'old')
+        io.save_str(u'http://host/', 'new')
+        io.flush()
+        eq_(len(databases['resmio']['binary']['rows']), 2)
+        eq_(io.load_str(u'http://host/'), 'new')
+
+
+def test_iterate_contents():
+    with _FakeDb():
+        io = io_rethinkdb.IoRethinkdb('localhost', 28015)
+        fake_rethinkdb.table('binary').insert(
+            {'key': u'http://host/', 'value': 'legacy'}).run(io._conn())
+        io.save_str(u'http://host/', 'new')
+        io.save_str(u'http://host/b', 'b')
+        io.add_redirect(u'http://host/a', u'http://host/b')
+        io.add_error_url(u'http://host/e')
+        eq_(sorted(io.iter_keys()), [u'http://host/', u'http://host/b'])
+        eq_(list(io.iter_redirects()), [(u'http://host/a', u'http://host/b')])
+        eq_(list(io.iter_error_urls()), [u'http://host/e'])
+
+
+def test_threads_use_own_connections():
+    with _FakeDb():
+        io = io_rethinkdb.IoRethinkdb('localhost', 28015, batch_size=1)
+
+        def save_and_load(i):
+            url = u'http://host/%d' % i
+            io.save_str(url, 'page %d' % i)
+            return io.load_str(url), io.load_str(u'http://host/missing')
+
+        pool = ThreadPool(8)
+        results = pool.map(save_and_load, xrange(40))
+        pool.close()
+        pool.join()
+        eq_(results, [('page %d' % i, None) for i in xrange(40)])
+
+
+def test_prefetched_bodies_are_dropped_after_load():
+    with _FakeDb():
+        io = io_rethinkdb.IoRethinkdb('localhost', 28015, batch_size=1)
+        io.save_str(u'http://host/', 'page')
+        io.save_meta(u'http://host/', {'etag': '"1"'})
+        io = io_rethinkdb.IoRethinkdb('localhost', 28015)
+        io.prefetch([u'http://host/'])
+        eq_(io.load_meta(u'http://host/'), {'etag': '"1"'})
+        eq_(io.load_str(u'http://host/'), 'page')
+        assert 'value' not in io.prefetched.get(u'http://host/')['binary']
+        eq_(io.load_meta(u'http://host/'), {'etag': '"1"'})
+        eq_(io.load_str(u'http://host/'), 'page')
@@ -0,0 +1,106 @@
+import os
+import shutil
+import tempfile
+from multiprocessing import Pool
+
+from nose.tools import eq_
+
+from crawler.io_segments import IoSegmentFs
+
+
+class _Store(object):
+    def __enter__(self):
+        self.tmpdir = tempfile.mkdtemp()
+        return self.tmpdir
+
+    def __exit__(self, *args):
+        shutil.rmtree(self.tmpdir)
+
+
+def segment_files(basepath):
+    return sorted(name for name in os.listdir(os.path.join(basepath,
+                                                           'segments'))
+                  if name.startswith('data-'))
+
+
+def test_save_and_load():
+    with _Store() as path:
+        io = IoSegmentFs(path)
+        eq_(io.load_str(u'http://host/'), None)
+        io.save_str(u'http://host/', '<html>body</html>')
+        io.save_str(u'http://host/\xfc', u'unicode \xfc')
+        io.save_meta(u'http://host/', {'etag': '"1"'})
+        eq_(io.load_str(u'http://host/'), '<html>body</html>')
+        eq_(io.load_str(u'http://host/\xfc'), u'unicode \xfc')
+        eq_(io.load_meta(u'http://host/'), {'etag': '"1"'})
+        eq_(io.load_meta(u'http://host/\xfc'), None)
+        io.save_str(u'http://host/', '<html>new body</html>')
+        eq_(IoSegmentFs(path).load_str(u'http://host/'),
+            '<html>new body</html>')
+
+
+def test_identical_values_are_stored_once():
+    with _Store() as path:
+        io = IoSegmentFs(path)
+        for i in xrange(10):
+            io.save_str(u'http://host/%d' % i, 'same body ' * 100)
+        eq_(len(io.blobs), 1)
+        eq_(io.load_str(u'http://host/7'), 'same body ' * 100)
+
+
+def test_segments_rotate():
+    with _Store() as path:
+        io = IoSegmentFs(path, segment_size=1000)
+        values = [os.urandom(400) for i in xrange(10)]
+        for i, value in enumerate(values):
+            io.save_str(u'http://host/%d' % i, value)
+        eq_(len(segment_files(path)), 4)
+        reader = IoSegmentFs(path)
+        eq_([reader.load_str(u'http://host/%d' % i) for i in xrange(10)],
+            values)
+
+
+def _save_pages(args):
+    path, worker = args
+    io = IoSegmentFs(path)
+    for i in xrange(20):
+        io.save_str(u'http://host/%d/%d' % (worker, i), 'page %d' % i)
+
+
+def test_concurrent_processes_share_store():
+    with _Store() as path:
+        reader = IoSegmentFs(path)
+        eq_(reader.load_str(u'http://host/0/0'), None)
+        pool = Pool(4)
+        pool.map(_save_pages, [(path, worker) for worker in xrange(4)])
+        pool.close()
+        pool.join()
+        eq_([reader.load_str(u'http://host/%d/19' % worker)
+             for worker in xrange(4)], ['page 19'] * 4)
+        eq_(len(reader.keys), 80)
+        eq_(len(reader.blobs), 20)
+
+
+def test_load_sees_values_of_other_writers():
+    with _Store() as path:
+        reader = IoSegmentFs(path)
+        writer = IoSegmentFs(path)
+        writer.save_str(u'http://host/', 'version 1')
+        eq_(reader.load_str(u'http://host/'), 'version 1')
+        writer.save_str(u'http://host/', 'version 2')
+        eq_(reader.load_str(u'http://host/'), 'version 2')
+
+
+def test_torn_index_record_is_dropped():
+    with _Store() as path:
+        io = IoSegmentFs(path)
+        io.save_str(u'http://host/1', 'page 1')
+        # A writer died in the middle of appending an index record
+        with open(io.indexfile, 'ab') as f:
+            f.write('s\x00\x00')
+        io = IoSegmentFs(path)
+        io.save_str(u'http://host/2', 'page 2')
+        reader = IoSegmentFs(path)
+        eq_(reader.load_str(u'http://host/1'), 'page 1')
+        eq_(reader.load_str(u'http://host/2'), 'page 2')
+        eq_(sorted(reader.iter_keys()), [u'http://host/1', u'http://host/2'])
@@ -0,0 +1,165 @@
+import os
+import pstats
+import shutil
+import tempfile
+import threading
+
+from nose.tools import eq_
+
+from crawler import crawl, metrics
+from crawler.batch_extraction import extract_sites, iter_extract_sites
+from crawler.io_fs import IoFs
+from crawler.metrics import Metrics
+from crawler.testing import SiteServer, site_graph
+
+
+class _TempDir(object):
+    def __enter__(self):
+        self.path = tempfile.mkdtemp()
+        return self.path
+
+    def __exit__(self, *args):
+        shutil.rmtree(self.path)
+
+
+def test_counters_and_timers():
+    m = Metrics()
+    m.incr('a')
+    m.incr('a', 2)
+    m.observe('t', 0.5)
+    m.observe('t', 1.5)
+    with m.timer('block'):
+        pass
+    snapshot = m.snapshot()
+    eq_(snapshot['counters'], {'a': 3})
+    eq_(snapshot['timers']['t'],
+        {'count': 2, 'seconds': 2.0, 'max_seconds': 1.5})
+    eq_(snapshot['timers']['block']['count'], 1)
+
+
+def test_concurrent_updates():
+    m = Metrics()
+
+    def work():
+        for i in xrange(1000):
+            m.incr('n')
+            m.observe('t', 0.001)
+    threads = [threading.Thread(target=work) for i in xrange(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    eq_(m.snapshot()['counters']['n'], 8000)
+    eq_(m.snapshot()['timers']['t']['count'], 8000)
+
+
+def test_disabled():
+    m = Metrics(enabled=False)
+    m.incr('a')
+    with m.timer('t'):
+        pass
+    eq_(m.snapshot(), {'counters': {}, 'timers': {}})
+
+
+def test_drain_and_merge():
+    worker = Metrics()
+    worker.incr('a', 2)
+    worker.observe('t', 2.0)
+    m = Metrics()
+    m.incr('a')
+    m.observe('t', 1.0)
+    m.merge(worker.drain())
+    eq_(worker.snapshot(), {'counters': {}, 'timers': {}})
+    eq_(m.snapshot(), {'counters': {'a': 3}, 'timers': {
+        't': {'count': 2, 'seconds': 3.0, 'max_seconds': 2.0}}})
+
+
+def test_prometheus_format():
+    m = Metrics()
+    m.incr('crawl.cache_hits', 4)
+    m.observe('extract.pdf', 0.25)
+    eq_(m.to_prometheus().splitlines(), [
+        '# TYPE crawler_crawl_cache_hits_total counter',
+        'crawler_crawl_cache_hits_total 4',
+        '# TYPE crawler_extract_pdf_seconds summary',
+        'crawler_extract_pdf_seconds_count 1',
+        'crawler_extract_pdf_seconds_sum 0.25',
+        '# TYPE crawler_extract_pdf_seconds_max gauge',
+        'crawler_extract_pdf_seconds_max 0.25'])
+
+
+class _ProcessMetrics(object):
+    """ Replace the process metrics with fresh ones. """
+    def __enter__(self):
+        self.metrics = metrics.metrics
+        metrics.metrics = Metrics()
+        return metrics.metrics
+
+    def __exit__(self, *args):
+        metrics.metrics = self.metrics
+
+
+def test_crawl_is_instrumented():
+    server = SiteServer(site_graph(5, fanout=2))
+    saved_io = crawl.crawler_io
+    with _TempDir() as path:
+        with _ProcessMetrics() as m:
+            server.start()
+            try:
+                crawl.crawler_io = IoFs(path)
+                crawl.crawl_urls([server.url('/')], max_depth=3)
+                crawl.crawl_urls([server.url('/')], max_depth=3)
+            finally:
+                crawl.crawler_io = saved_io
+                server.stop()
+            counters = m.snapshot()['counters']
+            eq_(counters['crawl.pages'], 10)
+            eq_(counters['crawl.cache_misses'], 5)
+            eq_(counters['crawl.cache_hits'], 5)
+            eq_(counters['crawl.bytes_fetched'],
+                sum(len(page) for page in server.pages.values()))
+            assert counters['crawl.filtered_links'] > 0
+            eq_(m.snapshot()['timers']['crawl.download']['count'], 5)
+
+
+def test_worker_metrics_are_merged():
+    htmls = [['<html><body><p>Text %d</p></body></html>' % i] * 3
+             for i in xrange(4)]
+    with _ProcessMetrics() as m:
+        m.incr('extract.docs', 100)
+        extract_sites(htmls, workers=2, chunksize=1)
+        eq_(m.snapshot()['counters']['extract.docs'], 112)
+        eq_(m.snapshot()['timers']['extract.site']['count'], 4)
+
+
+def test_site_profile():
+    with _TempDir() as path:
+        os.environ['PROFILE_SITES'] = 'http://a/, http://b/'
+        os.environ['PROFILE_DIR'] = path
+        try:
+            with metrics.site_profile('http://c/', 'crawl'):
+                pass
+            eq_(os.listdir(path), [])
+            with metrics.site_profile('http://b/', 'crawl'):
+                sorted(range(1000))
+            filenames = os.listdir(path)
+            eq_(len(filenames), 1)
+            assert filenames[0].startswith('crawl-')
+            pstats.Stats(os.path.join(path, filenames[0]))
+        finally:
+            os.environ.pop('PROFILE_SITES')
+            os.environ.pop('PROFILE_DIR')
+
+
+def test_workers_do_not_use_inherited_lock():
+    htmls = [['<p>Text</p>']] * 2
+    with _ProcessMetrics() as m:
+        # A lock held by another thread of the parent while it forks stays
+        # held in the child
+        m.lock.acquire()
+        try:
+            docs = iter_extract_sites(htmls, workers=2)
+        finally:
+            m.lock.release()
+        eq_(list(docs), [['text']] * 2)
+        eq_(m.snapshot()['counters']['extract.docs'], 2)
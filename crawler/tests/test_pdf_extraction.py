@@ -0,0 +1,138 @@
+import threading
+import time
+
+from nose.tools import eq_, raises
+
+from crawler import metrics, text_extraction
+from crawler.testing import make_pdf
+from crawler.text_extraction import (
+    call_limited, extract_pdf, extract_text, extract_text_limited,
+    extract_text_pdf)
+from crawler.timeouts import (
+    IsolatedTimeLimitExceeded, TimeLimitExceeded, call_isolated, time_limit)
+
+PDF = make_pdf(['Speisekarte Pizza', 'Pasta Vino', 'Dolci'])
+
+
+def words(text):
+    return text.split()
+
+
+def test_extract_text_pdf_limits():
+    eq_(words(extract_text_pdf(PDF, max_pages=0)),
+        ['Speisekarte', 'Pizza', 'Pasta', 'Vino', 'Dolci'])
+    eq_(words(extract_text_pdf(PDF, max_pages=2)),
+        ['Speisekarte', 'Pizza', 'Pasta', 'Vino'])
+    eq_(extract_text_pdf(PDF, max_bytes=100), u'')
+    eq_(extract_text_pdf(PDF, max_pages=0, layout=False),
+        u'Speisekarte Pizza\x0cPasta Vino\x0cDolci\x0c')
+    eq_(extract_text(PDF), 'speisekarte pizza pasta vino dolci')
+    eq_(extract_text(PDF, use_pdf=False), '')
+
+
+class _SlowPages(object):
+    """ Make the processing of every PDF page take `delay` seconds. """
+    def __init__(self, delay):
+        self.delay = delay
+
+    def __enter__(self):
+        interpreter = text_extraction.PDFPageInterpreter
+        self.process_page = interpreter.process_page
+        process_page = self.process_page
+        delay = self.delay
+
+        def slow_process_page(self, page):
+            time.sleep(delay)
+            return process_page(self, page)
+        interpreter.process_page = slow_process_page
+
+    def __exit__(self, *args):
+        text_extraction.PDFPageInterpreter.process_page = self.process_page
+
+
+def test_time_budget_returns_partial_text():
+    with _SlowPages(0.1):
+        text = extract_text_pdf(PDF, max_pages=0, time_budget=0.15)
+    eq_(words(text), ['Speisekarte', 'Pizza'])
+
+
+@raises(TimeLimitExceeded)
+def test_time_budget_keeps_outer_limit():
+    with _SlowPages(0.1):
+        with time_limit(0.15):
+            extract_text_pdf(PDF, max_pages=0, time_budget=10)
+
+
+@raises(TimeLimitExceeded)
+def test_disabled_time_budget_keeps_outer_limit():
+    with _SlowPages(0.1):
+        with time_limit(0.15):
+            extract_text_pdf(PDF, max_pages=0, time_budget=0)
+
+
+def test_owns():
+    limit = time_limit(0)
+    with limit:
+        pass
+    assert not limit.owns(TimeLimitExceeded())
+    limit = time_limit(10)
+    with limit:
+        pass
+    assert limit.owns(TimeLimitExceeded())
+
+
+@raises(TimeLimitExceeded)
+def test_extract_pdf_keeps_outer_limit():
+    with _SlowPages(0.1):
+        with time_limit(0.15):
+            extract_pdf(PDF)
+
+
+def test_document_timeout_of_pdf():
+    with _SlowPages(0.1):
+        start = time.time()
+        eq_(extract_text_limited(PDF, doc_timeout=0.15), '')
+    assert time.time() - start < 0.25
+
+
+@raises(TimeLimitExceeded)
+def test_call_limited_keeps_outer_limit():
+    with time_limit(0.1):
+        call_limited(10, time.sleep, 0.5)
+
+
+def test_call_limited_outside_main_thread():
+    saved = metrics.metrics
+    metrics.metrics = metrics.Metrics()
+    try:
+        results = []
+        thread = threading.Thread(target=lambda: results.append(
+            call_limited(0.05, lambda: time.sleep(0.1) or 'text')))
+        thread.start()
+        thread.join()
+        eq_(results, ['text'])
+        eq_(metrics.metrics.snapshot()['counters']['extract.untimed_docs'],
+            1)
+    finally:
+        metrics.metrics = saved
+
+
+def _fail():
+    raise ValueError('broken pdf')
+
+
+def test_call_isolated():
+    eq_(call_isolated(5, extract_text_pdf, PDF, 1),
+        u'Speisekarte Pizza\n\n\x0c')
+    try:
+        call_isolated(5, _fail)
+        assert False
+    except RuntimeError, err:
+        assert 'broken pdf' in str(err)
+    start = time.time()
+    try:
+        call_isolated(0.1, time.sleep, 10)
+        assert False
+    except IsolatedTimeLimitExceeded:
+        pass
+    assert time.time() - start < 1
@@ -0,0 +1,44 @@
+import random
+
+from nose.tools import eq_
+
+from crawler.simhash import (SimHashIndex, hamming_distance, simhash,
+                             tokenize)
+
+WORDS = ['pizza', 'pasta', 'table', 'menu', 'wine', 'dinner', 'lunch',
+         'garden', 'reservation', 'chef', 'kitchen', 'dessert', 'salad',
+         'opening', 'hours', 'street', 'phone', 'booking', 'terrace', 'bar']
+
+
+def random_text(n_words, seed):
+    rng = random.Random(seed)
+    return ' '.join(rng.choice(WORDS) for i in xrange(n_words))
+
+
+def test_tokenize():
+    eq_(tokenize(u'Hello, big World'), [u'hello big', u'big world'])
+    eq_(tokenize(u'Hello'), [u'hello'])
+    eq_(tokenize(u''), [])
+
+
+def test_simhash_near_duplicates():
+    text = random_text(500, 0)
+    changed = text + ' visitor counter 12345'
+    assert hamming_distance(simhash(tokenize(text)),
+                            simhash(tokenize(changed))) <= 3
+    assert hamming_distance(simhash(tokenize(text)),
+                            simhash(tokenize(random_text(500, 1)))) > 3
+
+
+def test_index_finds_fingerprints_within_distance():
+    rng = random.Random(0)
+    index = SimHashIndex(distance=3)
+    stored = [rng.getrandbits(64) for i in xrange(200)]
+    for fingerprint in stored:
+        index.add(fingerprint)
+    for fingerprint in stored[:20]:
+        near = fingerprint
+        for bit in rng.sample(range(64), 3):
+            near ^= 1 << bit
+        eq_(index.find(near), fingerprint)
+    eq_(index.find(stored[0] ^ 0xf), None)
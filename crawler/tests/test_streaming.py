@@ -0,0 +1,44 @@
+from multiprocessing.pool import ThreadPool
+
+from nose.tools import eq_
+
+from crawler.batch_extraction import extract_sites, iter_extract_sites
+from crawler.streaming import bounded_imap, chunks
+from crawler.testing import site_graph
+
+PARAMS = {'title_weight': 2, 'header_weights': [3, 3, 2, 2, 1, 1],
+          'hp_weight': 2}
+
+
+def test_chunks():
+    eq_(list(chunks(xrange(5), 2)), [[0, 1], [2, 3], [4]])
+    eq_(list(chunks([], 2)), [])
+
+
+def test_bounded_imap_limits_items_in_flight():
+    taken = []
+
+    def produce():
+        for i in xrange(100):
+            taken.append(i)
+            yield i
+
+    pool = ThreadPool(4)
+    results = bounded_imap(pool, lambda i: i * i, produce(), 5)
+    eq_([next(results) for i in xrange(3)], [0, 1, 4])
+    eq_(len(taken), 8)
+    eq_(list(results), [i * i for i in xrange(3, 100)])
+    pool.close()
+    pool.join()
+
+
+def test_iter_extract_sites_streams_generators():
+    def sites():
+        for i in xrange(12):
+            yield sorted(site_graph(i + 1).values())
+
+    expected = extract_sites(list(sites()), workers=1, **PARAMS)
+    results = iter_extract_sites(sites(), workers=3, chunksize=2,
+                                 max_pending=2, **PARAMS)
+    eq_(next(results), expected[0])
+    eq_(list(results), expected[1:])
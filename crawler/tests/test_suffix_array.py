@@ -0,0 +1,76 @@
+import random
+from nose.tools import eq_
+
+from crawler.suffix_array import (
+    lcp_array, longest_previous_factor, suffix_array)
+from crawler.text_extraction import remove_repeated_long_strings
+
+
+def naive_lcp(s, sa):
+    lcp = [0] if s else []
+    for a, b in zip(sa, sa[1:]):
+        h = 0
+        while a + h < len(s) and b + h < len(s) and s[a + h] == s[b + h]:
+            h += 1
+        lcp.append(h)
+    return lcp
+
+
+def naive_lpf(s):
+    lpf = []
+    for p in xrange(len(s)):
+        best = 0
+        for q in xrange(p):
+            h = 0
+            while p + h < len(s) and s[q + h] == s[p + h]:
+                h += 1
+            best = max(best, h)
+        lpf.append(best)
+    return lpf
+
+
+def check(s):
+    sa = suffix_array(s)
+    eq_(sa, sorted(xrange(len(s)), key=lambda i: s[i:]))
+    lcp = lcp_array(s, sa)
+    eq_(lcp, naive_lcp(s, sa))
+    lpf, src = longest_previous_factor(sa, lcp)
+    eq_(lpf, naive_lpf(s))
+    for p in xrange(len(s)):
+        if lpf[p]:
+            assert src[p] < p
+            eq_(s[src[p]:src[p] + lpf[p]], s[p:p + lpf[p]])
+
+
+def test_suffix_array():
+    for s in ['', 'a', 'banana', 'GEEKSFORGEEKS', 'AAAAAAAAAA', 'ABABABA',
+              'abcpqrabpqpq', [3, 1, 3, 1, 2]]:
+        check(s)
+    rand = random.Random(0)
+    for i in xrange(300):
+        check(''.join(rand.choice('ab ' if i % 2 else 'abcd')
+                      for j in xrange(rand.randint(0, 40))))
+
+
+def test_suffix_array_of_repetitive_sequences():
+    # Long repeats make SA-IS recurse several levels deep
+    rand = random.Random(0)
+    block = [rand.randint(0, 1000) for i in xrange(50)]
+    for seq in [block * 20 + [7], [5] * 500, 'abaab' * 100,
+                [rand.choice([10 ** 9, -1, 3]) for i in xrange(2000)]]:
+        eq_(suffix_array(seq),
+            sorted(xrange(len(seq)), key=lambda i: seq[i:]))
+
+
+def test_remove_repeated_long_strings():
+    menu = 'home speisekarte reservierung kontakt impressum'
+    text = ' '.join([menu, 'pizza margherita', menu, 'pasta', menu])
+    eq_(remove_repeated_long_strings(text, 20),
+        ' '.join([menu, 'pizza margherita pasta']))
+    eq_(remove_repeated_long_strings(text, 100), text)
+    eq_(remove_repeated_long_strings('', 10), '')
+
+
+def test_remove_periodic_repetition():
+    text = ' '.join(['ab cd ef'] * 10 + ['end'])
+    eq_(remove_repeated_long_strings(text, 10), 'ab cd ef end')
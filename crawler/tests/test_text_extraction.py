@@ -1,8 +1,20 @@
 # -*- coding: utf-8 -*-
+from collections import Counter
+import random
+import re
+import string
+
 from bs4 import BeautifulSoup
+from nltk.stem.porter import PorterStemmer
+from nltk.stem.snowball import GermanStemmer
 from nose.tools import eq_
+from unidecode import unidecode
 
-from crawler.text_extraction import replace_umlaute
+from crawler.text_extraction import (
+    detect_language, extract_text_html, extract_texts, extract_weighted_texts,
+    get_stem_cache, normalize_text, replace_umlaute, sample_text,
+    stem_cache_stats, stem_text)
+from crawler.text_utils import split_camel_case
 
 
 def test_convert_umlaute():
@@ -28,3 +40,116 @@ def test_separate_words_between_tags():
     soup = BeautifulSoup(html)
     text = soup.get_text(separator=' ')
     eq_(text, out)
+
+
+def legacy_normalize_text(text):
+    """ The chain of passes that `extract_text` used before `normalize_text`.
+    """
+    text = re.sub('\s+', ' ', text)
+    for k, v in {u'Ä': 'Ae', u'ä': 'ae', u'Ö': 'Oe', u'ö': 'oe',
+                 u'Ü': 'Ue', u'ü': 'ue'}.iteritems():
+        text = text.replace(k, v)
+    text = unidecode(text)
+    replace_punctuation = string.maketrans(
+        string.punctuation, ' ' * len(string.punctuation))
+    text = text.translate(replace_punctuation)
+    text = re.sub(' +', ' ', text)
+    text = text.strip()
+    text = ' '.join([split_camel_case(word) for word in text.split(' ')])
+    text = ''.join([c for c in text if not c.isdigit()])
+    text = ' '.join([word for word in text.split(' ') if len(word) > 1])
+    text = re.sub(' +', ' ', text)
+    return text
+
+
+GOLDEN = [
+    (u'', ''),
+    (u'  Hello,   World!\n\tNew-York ', 'Hello World New York'),
+    (u'Die süße Hündin läuft über BÄRENHÖHLE', 'Die suesse Huendin laeuft '
+     'ueber BAe RENH Oe HLE'),
+    (u'SpeisekarteOnline iPhone iBlaBla a1B x1Y 1Def Tel: 030/12345',
+     'Speisekarte Online iPhone iBla Bla Def Tel'),
+    (u'Café Crème, 12€ — “Pizza” & Pasta', 'Cafe Creme EUR Pizza Pasta'),
+    (u'ABCDef HTMLParser aB_cD e.f', 'ABC Def HTML Parser aB cD'),
+]
+
+
+def test_normalize_text_golden():
+    for text_in, text_out in GOLDEN:
+        eq_(normalize_text(text_in), text_out)
+        eq_(legacy_normalize_text(text_in), text_out)
+
+
+def test_normalize_text_same_as_legacy():
+    alphabet = (u'abcXYZ019 \t\n.,-_!äÖüßéÅ€\u5317\u2028 ' +
+                string.ascii_letters)
+    rand = random.Random(0)
+    for i in xrange(3000):
+        text = u''.join(rand.choice(alphabet)
+                        for j in xrange(rand.randint(0, 40)))
+        eq_(normalize_text(text), legacy_normalize_text(text))
+
+
+def test_stem_text():
+    doc = 'Restaurants Pizzeria restaurants running Speisekarten'
+    eq_(stem_text(doc, 'en'),
+        ' '.join([PorterStemmer().stem(w) for w in doc.split(' ')]))
+    eq_(stem_text(doc, 'de'),
+        ' '.join([GermanStemmer().stem(w) for w in doc.split(' ')]))
+    eq_(stem_text(doc, 'it'), doc)
+
+
+def test_stem_cache():
+    cache = get_stem_cache('en')
+    cache.clear()
+    stem_text('pizza pizzas pizza', 'en')
+    eq_((cache.hits, cache.misses), (0, 2))
+    stem_text('pizza pizzas pasta', 'en')
+    eq_((cache.hits, cache.misses), (2, 3))
+    eq_(stem_cache_stats()['en']['hit_rate'], 0.4)
+
+
+def test_sample_text():
+    text = ' '.join('word%d' % i for i in xrange(1000))
+    eq_(sample_text(text, None), text)
+    eq_(sample_text('short text', 100), 'short text')
+    sample = sample_text(text, 400)
+    assert len(sample) <= 400
+    assert sample.startswith('word0 word1 ')
+    assert sample.endswith(' word998')
+    assert set(sample.split(' ')) <= set(text.split(' '))
+
+
+def test_detect_language_deterministic():
+    en = ('The restaurant serves fresh pasta and pizza every day, and our '
+          'chef recommends the seasonal menu with local wines. ') * 50
+    de = ('Unser Restaurant bietet jeden Tag frische Pasta und Pizza, und '
+          'der Koch empfiehlt die saisonale Speisekarte. ') * 50
+    eq_(set(detect_language(en) for i in xrange(5)), set(['en']))
+    eq_(set(detect_language(de) for i in xrange(5)), set(['de']))
+    eq_(detect_language(''), None)
+
+
+def test_site_language():
+    htmls = ['<p>Unser Restaurant bietet jeden Tag frische Pasta und Pizza, '
+             'und der Koch empfiehlt die saisonale Speisekarte.</p>',
+             '<p>Pizza Margherita Pizza Salami</p>']
+    docs = extract_texts(htmls, use_stemmer=True, site_lang=True)
+    eq_(docs, [stem_text(normalize_text(extract_text_html(html)), 'de').lower()
+               for html in htmls])
+
+
+def test_weighted_texts_same_counts_as_repeated_texts():
+    htmls = ['<html><head><title>Pizza Haus</title></head><body>'
+             '<h1>Pizza</h1><h2>Pasta Vino</h2><p>Wir backen Pizza</p>'
+             '</body></html>',
+             '<html><head><title>Karte</title></head><body><h1>Vino</h1>'
+             '<h3>Dolci</h3><p>Tiramisu und Panna Cotta</p></body></html>']
+    params = {'title_weight': 3, 'header_weights': [3, 3, 2, 2, 1, 1],
+              'hp_weight': 2}
+    expected = Counter(' '.join(extract_texts(htmls, **params)).split())
+    counts = Counter()
+    for text, weight in extract_weighted_texts(htmls, **params):
+        for term in text.split():
+            counts[term] += weight
+    eq_(counts, expected)
@@ -0,0 +1,118 @@
+import gc
+import os
+import shutil
+import tempfile
+from multiprocessing import Pool
+
+from nose.tools import eq_
+
+from crawler.io_fs import IoFs
+from crawler import url_log
+from crawler.url_log import UrlLog, encode_record
+
+
+class _TempDir(object):
+    def __enter__(self):
+        self.path = tempfile.mkdtemp()
+        return self.path
+
+    def __exit__(self, *args):
+        shutil.rmtree(self.path)
+
+
+def test_buffered_appends():
+    with _TempDir() as path:
+        filename = os.path.join(path, 'log')
+        log = UrlLog(filename, buffer_size=3)
+        reader = UrlLog(filename)
+        log.append((u'http://a/', u'http://b/'))
+        log.append((u'http://\xfc/', u''))
+        eq_(reader.read_new(), [])
+        log.append((u'http://c/',))
+        eq_(reader.read_new(), [(u'http://a/', u'http://b/'),
+                                (u'http://\xfc/', u''), (u'http://c/',)])
+        log.append((u'http://d/',))
+        log.flush()
+        eq_(reader.read_new(), [(u'http://d/',)])
+        eq_(reader.read_new(), [])
+        eq_(len(reader.read_all()), 4)
+        eq_(reader.read_new(), [])
+
+
+def test_partial_record_is_read_later():
+    with _TempDir() as path:
+        filename = os.path.join(path, 'log')
+        record = encode_record((u'http://a/', u'http://b/'))
+        with open(filename, 'ab') as f:
+            f.write(record + record[:5])
+        log = UrlLog(filename)
+        eq_(log.read_new(), [(u'http://a/', u'http://b/')])
+        with open(filename, 'ab') as f:
+            f.write(record[5:])
+        eq_(log.read_new(), [(u'http://a/', u'http://b/')])
+
+
+def test_csv_files_are_migrated():
+    with _TempDir() as path:
+        with open(os.path.join(path, 'redirects.csv'), 'w') as f:
+            f.write('http://a/,http://b/\nhttp://\xc3\xbc/,http://c/\n')
+        with open(os.path.join(path, 'errors.csv'), 'w') as f:
+            f.write('http://e/\n')
+        io = IoFs(path)
+        eq_(io.get_redirect(u'http://\xfc/'), u'http://c/')
+        assert io.is_error_url(u'http://e/')
+        os.remove(os.path.join(path, 'redirects.csv'))
+        os.remove(os.path.join(path, 'errors.csv'))
+        io = IoFs(path)
+        eq_(io.get_redirect(u'http://a/'), u'http://b/')
+        assert io.is_error_url(u'http://e/')
+
+
+def _add_urls(args):
+    path, worker = args
+    io = IoFs(path)
+    for i in xrange(200):
+        io.add_redirect(u'http://%d/%d' % (worker, i), u'http://x/%d' % i)
+        io.add_error_url(u'http://%d/error%d' % (worker, i))
+    io.flush()
+
+
+def test_concurrent_processes_share_path():
+    with _TempDir() as path:
+        io = IoFs(path, refresh_interval=0)
+        assert not io.is_error_url(u'http://0/error0')
+        pool = Pool(4)
+        pool.map(_add_urls, [(path, worker) for worker in xrange(4)])
+        pool.close()
+        pool.join()
+        assert io.is_error_url(u'http://3/error199')
+        eq_(io.get_redirect(u'http://2/150'), u'http://x/150')
+        eq_(len(IoFs(path).redirects_log.read_new()), 800)
+        eq_(len(io.errorurls), 800)
+
+
+def test_logs_are_flushed_at_exit():
+    with _TempDir() as path:
+        filename = os.path.join(path, 'log')
+        log = UrlLog(filename)
+        log.append((u'http://a/',))
+        url_log._flush_logs()
+        eq_(UrlLog(filename).read_new(), [(u'http://a/',)])
+        log.append((u'http://b/',))
+    # The directory is gone
+    url_log._flush_logs()
+    del log
+    gc.collect()
+    assert not [l for l in url_log._logs if l.filename == filename]
+
+
+def test_reads_are_throttled():
+    with _TempDir() as path:
+        io = IoFs(path, refresh_interval=60)
+        writer = IoFs(path)
+        assert not io.is_error_url(u'http://e/')
+        writer.add_error_url(u'http://e/')
+        writer.flush()
+        assert not io.is_error_url(u'http://e/')
+        eq_(list(io.iter_error_urls()), [u'http://e/'])
+        assert io.is_error_url(u'http://e/')
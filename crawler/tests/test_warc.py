@@ -0,0 +1,132 @@
+import gzip
+import os
+import shutil
+import tempfile
+import warnings
+import zlib
+
+from nose.tools import eq_
+
+from crawler import warc
+from crawler.io_fs import IoFs
+from crawler.io_segments import IoSegmentFs
+from crawler.io_sqlite import IoSqlite
+
+
+class _TempDir(object):
+    def __enter__(self):
+        self.path = tempfile.mkdtemp()
+        return self.path
+
+    def __exit__(self, *args):
+        shutil.rmtree(self.path)
+
+
+def _fill(io):
+    io.save_str(u'http://host/', '<html>\xff</html>')
+    io.save_meta(u'http://host/', {'etag': '"1"', 'last_modified': None,
+                                   'fetched': 1500000000.5})
+    io.save_str(u'http://host/\xfc.pdf', '%PDF-1.4\r\n\r\nbinary\0')
+    io.add_redirect(u'http://host/a', u'http://host/\xfc.pdf')
+    io.add_error_url(u'http://host/e')
+
+
+def test_round_trip():
+    with _TempDir() as path:
+        source = IoFs(os.path.join(path, 'fs'))
+        _fill(source)
+        filename = os.path.join(path, 'crawl.warc.gz')
+        eq_(warc.export_warc(source, filename),
+            {'pages': 2, 'redirects': 1, 'errors': 1})
+        for target in (IoSqlite(os.path.join(path, 'crawler.db')),
+                       IoSegmentFs(os.path.join(path, 'segments'))):
+            eq_(warc.import_warc(target, filename),
+                {'pages': 2, 'redirects': 1, 'errors': 1})
+            eq_(target.load_str(u'http://host/'), '<html>\xff</html>')
+            eq_(target.load_meta(u'http://host/'),
+                {'etag': '"1"', 'last_modified': None,
+                 'fetched': 1500000000.5})
+            eq_(target.load_str(u'http://host/\xfc.pdf'),
+                '%PDF-1.4\r\n\r\nbinary\0')
+            eq_(target.get_redirect(u'http://host/a'), u'http://host/\xfc.pdf')
+            assert target.is_error_url(u'http://host/e')
+
+
+def test_records_are_gzip_members():
+    with _TempDir() as path:
+        source = IoFs(os.path.join(path, 'fs'))
+        _fill(source)
+        filename = os.path.join(path, 'crawl.warc.gz')
+        warc.export_warc(source, filename)
+        data = open(filename, 'rb').read()
+        members = 0
+        while data:
+            d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            record = d.decompress(data)
+            assert record.startswith('WARC/1.1\r\n')
+            data = d.unused_data
+            members += 1
+        # warcinfo, 2 pages, redirect, error
+        eq_(members, 5)
+
+
+def test_import_foreign_responses():
+    with _TempDir() as path:
+        filename = os.path.join(path, 'other.warc')
+        with open(filename, 'wb') as f:
+            writer = warc.WarcWriter(f, compress=False)
+            writer.write('request', u'http://host/', 'GET / HTTP/1.1\r\n\r\n')
+            writer.write('response', u'http://host/old',
+                         'HTTP/1.1 301 Moved\r\nLocation: /new\r\n\r\n')
+            writer.write('response', u'http://host/missing',
+                         'HTTP/1.1 404 Not Found\r\n\r\nnot found')
+            writer.write('response', u'http://host/new',
+                         'HTTP/1.1 200 OK\r\nETag: "x"\r\n\r\n<html></html>',
+                         date=1.25)
+            writer.write('resource', u'http://host/menu.pdf', '%PDF-1.4')
+        io = IoSqlite(os.path.join(path, 'crawler.db'))
+        eq_(warc.import_warc(io, filename),
+            {'pages': 2, 'redirects': 1, 'errors': 1})
+        eq_(io.get_redirect(u'http://host/old'), u'http://host/new')
+        assert io.is_error_url(u'http://host/missing')
+        eq_(io.load_str(u'http://host/new'), '<html></html>')
+        eq_(io.load_meta(u'http://host/new'),
+            {'etag': '"x"', 'last_modified': None, 'fetched': 1.25})
+        eq_(io.load_str(u'http://host/menu.pdf'), '%PDF-1.4')
+
+
+def test_read_with_gzip_module():
+    with _TempDir() as path:
+        filename = os.path.join(path, 'crawl.warc.gz')
+        with open(filename, 'wb') as f:
+            writer = warc.WarcWriter(f)
+            writer.write_page(u'http://host/', 'a' * 100000)
+            writer.write_error(u'http://host/e')
+        records = list(warc.iter_records(gzip.open(filename)))
+        eq_([(r.type, r.uri) for r in records],
+            [('response', u'http://host/'), ('metadata', u'http://host/e')])
+
+
+def test_dates():
+    eq_(warc.format_date(1.5), '1970-01-01T00:00:01.500000Z')
+    eq_(warc.parse_date('1970-01-01T00:00:01.500000Z'), 1.5)
+    eq_(warc.parse_date('2017-07-14T02:40:00Z'), 1500000000)
+
+
+def test_export_warns_about_unlisted_keys():
+    with _TempDir() as path:
+        io = IoFs(os.path.join(path, 'fs'))
+        io.save_str(u'http://host/old', '<html>old</html>')
+        io.save_meta(u'http://host/old', {'fetched': 1.0})
+        io.flush()
+        # A cache written before keys.log existed
+        os.remove(os.path.join(path, 'fs', 'keys.log'))
+        io = IoFs(os.path.join(path, 'fs'))
+        io.save_str(u'http://host/new', '<html>new</html>')
+        eq_(io.count_unlisted(), 1)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            counts = warc.export_warc(io, os.path.join(path, 'x.warc.gz'))
+        eq_(counts['pages'], 1)
+        eq_(len(caught), 1)
+        assert '1 cached pages' in str(caught[0].message)
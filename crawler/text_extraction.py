@@ -1,13 +1,13 @@
 # -*- coding: utf-8 -*-
 """ Module containing functionality for extracting text from HTML files. """
 
+import cStringIO
 import re
 import string
 import StringIO
 from unidecode import unidecode
 
-from bs4 import BeautifulSoup
-import langdetect
+from langdetect import DetectorFactory, PROFILES_DIRECTORY
 from nltk.stem.porter import PorterStemmer
 from nltk.stem.snowball import GermanStemmer
 from pdfminer.pdfinterp import PDFResourceManager, PDFPageInterpreter
@@ -15,15 +15,47 @@ from pdfminer.pdfpage import PDFPage
 from pdfminer.converter import TextConverter
 from pdfminer.layout import LAParams
 
+from config import get_config
+from crawler.boilerplate import remove_site_boilerplate
+from crawler.html_parse import parse_html
+from crawler.lru import LRUCache
+from crawler.metrics import incr, timed
+from crawler.suffix_array import (
+    lcp_array, longest_previous_factor, suffix_array)
 from crawler.text_utils import split_camel_case, str2unicode
+from crawler.timeouts import (
+    IsolatedTimeLimitExceeded, TimeLimitExceeded, call_isolated, time_limit)
+
+UMLAUTE = {u'Ä': u'Ae', u'ä': u'ae',
+           u'Ö': u'Oe', u'ö': u'oe',
+           u'Ü': u'Ue', u'ü': u'ue'}
+
+# Tables and patterns used by `normalize_text`, built once
+UMLAUTE_TABLE = dict((ord(k), v) for k, v in UMLAUTE.iteritems())
+PUNCTUATION_TABLE = string.maketrans(
+    string.punctuation, ' ' * len(string.punctuation))
+WHITESPACE_RE = re.compile('\s+')
+SPACES_RE = re.compile(' +')
+NON_ASCII_RE = re.compile(u'[^\x00-\x7f]+')
+# Layout analysis parameters shared by all PDF extractions
+PDF_LAPARAMS = LAParams()
+# A space-separated word with an uppercase letter after its first character,
+# i.e. a word that `split_camel_case` may change
+CAMEL_CASE_RE = re.compile('(?<![^ ])[^ ][^ A-Z]*[A-Z][^ ]*')
+
+# Stemmers of the supported languages, shared by all documents
+STEMMERS = {'en': PorterStemmer(), 'de': GermanStemmer()}
+# Global variable to store the LRU caches of word stems per language
+stem_caches = {}
+# Global variable to store the language detector factory
+detector_factory = None
 
 
 def replace_umlaute(text):
     """ Replace German Umlaute. """
-    rep = {u'Ä': 'Ae', u'ä': 'ae',
-           u'Ö': 'Oe', u'ö': 'oe',
-           u'Ü': 'Ue', u'ü': 'ue'}
-    for k, v in rep.iteritems():
+    if isinstance(text, unicode):
+        return text.translate(UMLAUTE_TABLE)
+    for k, v in UMLAUTE.iteritems():
         text = text.replace(k, v)
     return text
 
@@ -35,9 +67,47 @@ def clean_text(text):
     # Convert German Umlaute
     text = replace_umlaute(text)
     # Convert to ASCII
+    if isinstance(text, unicode):
+        # `unidecode` maps each character independently, so only the runs
+        # of non-ASCII characters need to go through it
+        return str(NON_ASCII_RE.sub(_unidecode_match, text))
     return unidecode(text)
 
 
+def _unidecode_match(match):
+    return unidecode(match.group())
+
+
+def _split_camel_case_match(match):
+    return split_camel_case(match.group())
+
+
+@timed('extract.normalize')
+def normalize_text(text):
+    """ Normalize extracted text: collapse whitespace, transliterate to
+        ASCII, replace punctuation with spaces, split CamelCase words, remove
+        digits and single characters.
+
+        The per-word and per-character steps run as precompiled regular
+        expressions and translation tables instead of Python loops.
+    """
+    # Replace newlines etc.
+    text = WHITESPACE_RE.sub(' ', text)
+    # Replace Umlaute and apply 'unidecode'
+    text = clean_text(text)
+    # Remove punctuation and multiple spaces
+    text = SPACES_RE.sub(' ', text.translate(PUNCTUATION_TABLE)).strip()
+    # Split camel case words
+    text = CAMEL_CASE_RE.sub(_split_camel_case_match, text)
+    # Remove digits
+    if isinstance(text, str):
+        text = text.translate(None, string.digits)
+    else:
+        text = ''.join([c for c in text if not c.isdigit()])
+    # Remove single characters (this also removes multiple spaces)
+    return ' '.join([word for word in text.split(' ') if len(word) > 1])
+
+
 def is_pdf(s):
     """ Check if a binary string is a pdf file based on the magic number. """
     if len(s) < 4:
@@ -45,29 +115,143 @@ def is_pdf(s):
     return s[:4] == '%PDF'
 
 
-def apply_stemmer(doc):
-    """ Apply a word stemmer to the input document. First, language detection is
-        performed and the corresponding stemmer applied (English and German
-        supported).
+def get_stem_cache(lang):
+    """ Return the LRU cache of word stems for a language, with
+        STEMMER_CACHE_SIZE entries.
     """
-    try:
-        lang = langdetect.detect(doc)
-    except Exception:
-        return doc
-    stemmer = None
-    if lang == 'en':
-        stemmer = PorterStemmer()
-    if lang == 'de':
-        stemmer = GermanStemmer()
+    if lang not in stem_caches:
+        stem_caches[lang] = LRUCache(get_config('STEMMER_CACHE_SIZE', int))
+    return stem_caches[lang]
+
+
+def stem_cache_stats():
+    """ Return the size and hit/miss counters of the stem cache of every
+        language.
+    """
+    return dict((lang, cache.stats()) for lang, cache in stem_caches.items())
+
+
+@timed('extract.stem')
+def stem_text(doc, lang):
+    """ Stem every word of a document with the stemmer of `lang`. Each
+        distinct word is stemmed once, and stems are memoized across
+        documents. Documents in unsupported languages are returned as is.
+    """
+    stemmer = STEMMERS.get(lang)
     if stemmer is None:
         return doc
-    return ' '.join([stemmer.stem(w) for w in doc.split(' ')])
+    cache = get_stem_cache(lang)
+    words = doc.split(' ')
+    stems = {}
+    for w in set(words):
+        stem = cache.get(w)
+        if stem is None:
+            stem = stemmer.stem(w)
+            cache.put(w, stem)
+        stems[w] = stem
+    return ' '.join([stems[w] for w in words])
+
+
+def get_detector_factory():
+    """ Return the langdetect factory, with the language profiles loaded
+        once and seeded with LANGDETECT_SEED so that detection is
+        deterministic.
+    """
+    global detector_factory
+    if detector_factory is None:
+        factory = DetectorFactory()
+        factory.load_profile(PROFILES_DIRECTORY)
+        factory.set_seed(get_config('LANGDETECT_SEED', int))
+        detector_factory = factory
+    return detector_factory
+
 
+def sample_text(text, size, windows=4):
+    """ Return at most about `size` characters of `text`, taken from
+        `windows` evenly spaced positions and cut at word boundaries.
+    """
+    if size is None or len(text) <= size:
+        return text
+    width = size // windows
+    step = (len(text) - width) // max(windows - 1, 1)
+    parts = []
+    for i in xrange(windows):
+        part = text[i * step:i * step + width]
+        if i > 0 and ' ' in part:
+            part = part[part.index(' ') + 1:]
+        if ' ' in part:
+            part = part[:part.rindex(' ')]
+        parts.append(part)
+    return ' '.join(parts)
+
+
+@timed('extract.langdetect')
+def detect_language(text):
+    """ Detect the language of a text from a sample of LANGDETECT_SAMPLE_SIZE
+        characters. Return None if no language can be detected.
+    """
+    text = sample_text(text, get_config('LANGDETECT_SAMPLE_SIZE', int))
+    try:
+        detector = get_detector_factory().create()
+        detector.append(text)
+        return detector.detect()
+    except Exception:
+        return None
 
+
+def apply_stemmer(doc, lang=None):
+    """ Apply a word stemmer to the input document. First, language detection is
+        performed and the corresponding stemmer applied (English and German
+        supported). Detection is skipped if the language `lang` is given.
+    """
+    if lang is None:
+        lang = detect_language(doc)
+    return stem_text(doc, lang)
+
+
+@timed('extract.ukkonen')
 def remove_repeated_long_strings(l, minlen=1000):
+    """ Remove repeated sequences of words that are longer than `minlen`
+        characters, keeping their first occurrence.
+
+        All repeats are found at once from the suffix array of the word
+        sequence: for every word, the longest previous factor gives the
+        longest run of words starting there that already occurred earlier.
+        Such runs are dropped in a single left-to-right pass. A run may
+        overlap its earlier occurrence (a periodic repetition), in which
+        case one period is kept.
+    """
+    words = l.split()
+    ids = {}
+    seq = [ids.setdefault(w, len(ids)) for w in words]
+    sa = suffix_array(seq)
+    lpf, src = longest_previous_factor(sa, lcp_array(seq, sa))
+    # offsets[i] is the length of ' w_0 ... w_(i-1)', so a run of words
+    # i..j-1 padded with spaces has length offsets[j] - offsets[i] + 1
+    offsets = [0]
+    for w in words:
+        offsets.append(offsets[-1] + len(w) + 1)
+    kept = []
+    p = 0
+    while p < len(words):
+        run = lpf[p]
+        if run > 0 and offsets[p + run] - offsets[p] + 1 > minlen:
+            p += run
+        else:
+            kept.append(words[p])
+            p += 1
+    return ' '.join(kept)
+
+
+def remove_repeated_long_strings_ukkonen(l, minlen=1000):
     """ Remove duplicated long strings efficiently using the Ukkonen algorithm.
         The function recursively removes repeated strings as long as they are
-        longer than `minlen`.
+        longer than `minlen`. Repeated strings are moved to the end of the
+        text.
+
+        This is the former implementation of `remove_repeated_long_strings`,
+        which needs the `ukkonen` extension and is quadratic in the number of
+        repeated strings. It is kept for comparison.
 
         Note: If the longest string overlaps with its repeated counterpart,
               it is not removed and the algorithm returns.
@@ -89,113 +273,248 @@ def remove_repeated_long_strings(l, minlen=1000):
     return l.strip()
 
 
-def is_visible_elem(elem):
-    """ Return True, if the input html text is visible on the website. """
-    if elem.parent.name in ['style', 'script', '[document]', 'head']:
-        return False
-    elif re.match('<!--.*-->', str(elem.encode('utf-8'))):
-        return False
-    return True
+def extract_text_pdf(s, max_pages=None, max_bytes=None, time_budget=None,
+                     layout=None):
+    """ Extracts text from a PDF.
 
-
-def extract_text_pdf(s):
-    """ Extracts text from a PDF. """
-    fp = StringIO.StringIO()
+        :param max_pages: Maximum number of pages processed (0 for all).
+            Default is the PDF_MAX_PAGES setting.
+        :param max_bytes: PDFs larger than this are skipped and yield an
+            empty text. Default is the PDF_MAX_BYTES setting.
+        :param time_budget: Seconds after which the text of the pages
+            processed so far is returned. Default is the PDF_TIME_BUDGET
+            setting.
+        :param layout: If False, the layout analysis that groups characters
+            into lines and text boxes is skipped, which is faster but may
+            join or split words differently. Default is the PDF_LAYOUT
+            setting.
+    """
+    if max_pages is None:
+        max_pages = get_config('PDF_MAX_PAGES', int)
+    if max_bytes is None:
+        max_bytes = get_config('PDF_MAX_BYTES', int)
+    if time_budget is None:
+        time_budget = get_config('PDF_TIME_BUDGET', float)
+    if layout is None:
+        layout = get_config('PDF_LAYOUT')
+    if max_bytes and len(s) > max_bytes:
+        return u''
+    fp = cStringIO.StringIO(s)
     outfp = StringIO.StringIO()
-    fp.write(s)
-    laparams = LAParams()
-    imagewriter = None
-    pagenos = set()
-    caching = True
-    rsrcmgr = PDFResourceManager(caching=caching)
-    maxpages = 0
-    rotation = 0
-    password = ''
-    device = TextConverter(
-        rsrcmgr, outfp,
-        laparams=laparams, imagewriter=imagewriter)
+    # Fonts are cached per document by object id, so the resource manager
+    # cannot be shared; character maps are cached across documents by
+    # pdfminer itself.
+    rsrcmgr = PDFResourceManager(caching=True)
+    device = TextConverter(rsrcmgr, outfp,
+                           laparams=PDF_LAPARAMS if layout else None)
     interpreter = PDFPageInterpreter(rsrcmgr, device)
-    for page in PDFPage.get_pages(fp, pagenos,
-                                  maxpages=maxpages, password=password,
-                                  caching=caching, check_extractable=True):
-        page.rotate = (page.rotate+rotation) % 360
-        interpreter.process_page(page)
-    fp.close()
+    limit = time_limit(time_budget)
+    try:
+        with limit:
+            for page in PDFPage.get_pages(fp, set(), maxpages=max_pages,
+                                          caching=True,
+                                          check_extractable=True):
+                interpreter.process_page(page)
+    except TimeLimitExceeded, err:
+        if not limit.owns(err):
+            raise
     return str2unicode(outfp.getvalue())
 
 
+@timed('extract.pdf')
+def extract_pdf(s, use_pdf=True):
+    """ Return the normalized text of a PDF, or an empty text if `use_pdf`
+        is False or the extraction fails. If PDF_ISOLATED is set, the text
+        is extracted in a child process that is killed after
+        PDF_ISOLATED_TIMEOUT seconds, so that a pathological PDF cannot
+        stall the caller. A `time_limit` of the caller that runs out is not
+        treated as a failure but raised.
+    """
+    if not use_pdf:
+        return ''
+    try:
+        if get_config('PDF_ISOLATED'):
+            text = call_isolated(get_config('PDF_ISOLATED_TIMEOUT', float),
+                                 extract_text_pdf, s)
+        else:
+            text = extract_text_pdf(s)
+    except (Exception, IsolatedTimeLimitExceeded):
+        incr('extract.pdf_failures')
+        return ''
+    return normalize_text(text)
+
+
+@timed('extract.html')
 def extract_text_html(html, title_weight=None, header_weights=None):
-    """ Extracts text from an HTML. """
-    soup = BeautifulSoup(html)
-    # Extract visible text from soup
-    texts = soup.findAll(text=True)
-    text = ' '.join(filter(is_visible_elem, texts))
+    """ Extracts text from an HTML. The page is parsed by `parse_html`. """
+    page = parse_html(html)
+    text = page.text
     # Add more weight to the title
     if title_weight:
-        if soup.title is not None and soup.title.string is not None:
-            text = text + ' ' + ' '.join(
-                [soup.title.string] * (title_weight-1))
+        if page.title is not None:
+            text = text + ' ' + ' '.join([page.title] * (title_weight-1))
     # Add more weight to the headers
     if header_weights:
         for i in xrange(6):
             text = text + ' ' + ' '.join(
-                [' '.join([elem.getText() for elem in soup.findAll(
-                    'h' + str(i+1))])] * header_weights[i])
+                [' '.join(page.headers[i])] * header_weights[i])
     return text
 
 
-def extract_text(doc, title_weight=None, header_weights=None, use_pdf=True,
-                 use_stemmer=False, ukkonen_len=0):
-    """ Extracts cleaned text from an HTML or PDF. """
+def extract_normalized_text(doc, title_weight=None, header_weights=None,
+                            use_pdf=True):
+    """ Extract the normalized text from an HTML or PDF, i.e. the text
+        before stemming, repetition removal and lowercasing.
+    """
     if is_pdf(doc):
-        if use_pdf:
-            try:
-                text = extract_text_pdf(doc)
-            except:
-                # TODO: Nice error handling
-                return ''
-        else:
-            return ''
-    else:
-        text = extract_text_html(
-            str2unicode(doc),
-            title_weight=title_weight,
-            header_weights=header_weights)
-    # Replace newlines etc.
-    text = re.sub('\s+', ' ', text)
-    # Replace Umlaute and apply 'unidecode'
-    text = clean_text(text)
-    # Remove punctuation
-    replace_punctuation = string.maketrans(
-        string.punctuation, ' ' * len(string.punctuation))
-    text = text.translate(replace_punctuation)
-    # Remove multiple spaces
-    text = re.sub(' +', ' ', text)
-    # Strip
-    text = text.strip()
-    # Split camel case words
-    text = ' '.join([split_camel_case(word) for word in text.split(' ')])
-    # Remove digits
-    text = ''.join([c for c in text if not c.isdigit()])
-    # Remove single characters
-    text = ' '.join([word for word in text.split(' ') if len(word) > 1])
-    # Remove multiple spaces
-    text = re.sub(' +', ' ', text)
+        return extract_pdf(doc, use_pdf)
+    text = extract_text_html(
+        str2unicode(doc),
+        title_weight=title_weight,
+        header_weights=header_weights)
+    return normalize_text(text)
+
+
+def extract_weighted_segments(doc, title_weight=None, header_weights=None,
+                              use_pdf=True):
+    """ Like `extract_normalized_text`, but instead of repeating the title
+        and the headers according to their weights, return a list of
+        `(text, weight)` pairs: the page text with weight 1, followed by the
+        title and the texts of each header level with their weights.
+    """
+    if is_pdf(doc):
+        return [(extract_normalized_text(doc, use_pdf=use_pdf), 1)]
+    page = parse_html(str2unicode(doc))
+    segments = [(page.text, 1)]
+    if title_weight and title_weight > 1 and page.title is not None:
+        segments.append((page.title, title_weight - 1))
+    if header_weights:
+        for i in xrange(6):
+            if header_weights[i] and page.headers[i]:
+                segments.append((' '.join(page.headers[i]), header_weights[i]))
+    return [(normalize_text(text), weight) for text, weight in segments]
+
+
+def finish_text(text, use_stemmer=False, ukkonen_len=0, lang=None):
+    """ Stem a normalized text, remove long repeated strings and lowercase
+        it. The language used for stemming is detected if `lang` is None.
+    """
     # Stem
     if use_stemmer:
-        text = apply_stemmer(text)
+        text = apply_stemmer(text, lang)
     # Remove long repeated strings
     if ukkonen_len:
         text = remove_repeated_long_strings(text, ukkonen_len)
     return text.lower()
 
 
+def extract_text(doc, title_weight=None, header_weights=None, use_pdf=True,
+                 use_stemmer=False, ukkonen_len=0, lang=None):
+    """ Extracts cleaned text from an HTML or PDF. """
+    text = extract_normalized_text(doc, title_weight, header_weights, use_pdf)
+    return finish_text(text, use_stemmer, ukkonen_len, lang)
+
+
+def call_limited(doc_timeout, func, *args, **kwargs):
+    """ Call `func`, but return an empty text if it takes longer than
+        `doc_timeout` seconds. The time limit of an enclosing `time_limit`
+        block is raised, not swallowed.
+
+        Time limits only work in the main thread (see
+        `crawler.timeouts.time_limit`). Elsewhere `doc_timeout` is ignored
+        and the call is counted in the `extract.untimed_docs` counter.
+    """
+    limit = time_limit(doc_timeout)
+    try:
+        with limit:
+            if doc_timeout and not limit.active:
+                incr('extract.untimed_docs')
+            return func(*args, **kwargs)
+    except TimeLimitExceeded, err:
+        if not limit.owns(err):
+            raise
+        incr('extract.timeouts')
+        return ''
+
+
+def extract_text_limited(doc, doc_timeout=None, **params):
+    """ Call `extract_text`, but return an empty text if it takes longer
+        than `doc_timeout` seconds.
+    """
+    return call_limited(doc_timeout, extract_text, doc, **params)
+
+
 def extract_texts(htmls, title_weight=None, header_weights=None, use_pdf=True,
-                  use_stemmer=False, ukkonen_len=0, hp_weight=1):
-    """ Extract cleaned text from a list of HTMLs. """
-    docs = [extract_text(
-            html, title_weight, header_weights, use_pdf, use_stemmer,
-            ukkonen_len) for html in htmls]
+                  use_stemmer=False, ukkonen_len=0, hp_weight=1,
+                  doc_timeout=None, site_lang=False, template_fraction=None):
+    """ Extract cleaned text from a list of HTMLs. Documents that take
+        longer than `doc_timeout` seconds yield an empty text. If
+        `site_lang` is True, the language used for stemming is detected once
+        for all documents instead of once per document. If
+        `template_fraction` is given, text blocks that appear on at least
+        this fraction of the pages are removed (see
+        `boilerplate.remove_site_boilerplate`).
+    """
+    if use_stemmer and site_lang:
+        texts = [call_limited(
+                 doc_timeout, extract_normalized_text, html, title_weight,
+                 header_weights, use_pdf) for html in htmls]
+        lang = detect_language(' '.join(texts))
+        docs = [call_limited(
+                doc_timeout, finish_text, text, lang is not None,
+                ukkonen_len, lang) for text in texts]
+    else:
+        docs = [extract_text_limited(
+                html, doc_timeout, title_weight=title_weight,
+                header_weights=header_weights, use_pdf=use_pdf,
+                use_stemmer=use_stemmer, ukkonen_len=ukkonen_len)
+                for html in htmls]
+    if template_fraction:
+        docs = remove_site_boilerplate(docs, template_fraction)
     if docs and hp_weight > 1:
         docs.extend([docs[0]] * (hp_weight - 1))
     return docs
+
+
+def extract_weighted_texts(htmls, title_weight=None, header_weights=None,
+                           use_pdf=True, use_stemmer=False, ukkonen_len=0,
+                           hp_weight=1, doc_timeout=None, site_lang=False,
+                           template_fraction=None):
+    """ Alternative to `extract_texts` that applies the title, header and
+        homepage weights as multipliers instead of repeating text. Return a
+        list of `(text, weight)` pairs, one per distinct weight and sorted
+        by weight, such that counting the terms of every text `weight` times
+        gives the term counts of the documents returned by `extract_texts`.
+
+        Unlike in `extract_texts`, the language of a page is detected from
+        its text without the weighted copies, and the removal of repeated
+        strings and of boilerplate only sees the page texts.
+    """
+    pages = [call_limited(doc_timeout, extract_weighted_segments, html,
+                          title_weight, header_weights, use_pdf) or []
+             for html in htmls]
+    if use_stemmer and site_lang:
+        langs = [detect_language(' '.join(
+            segments[0][0] for segments in pages if segments))] * len(pages)
+    elif use_stemmer:
+        langs = [detect_language(segments[0][0]) if segments else None
+                 for segments in pages]
+    else:
+        langs = [None] * len(pages)
+    pages = [[(call_limited(doc_timeout, finish_text, text,
+                            lang is not None, ukkonen_len, lang), weight)
+              for text, weight in segments]
+             for segments, lang in zip(pages, langs)]
+    if template_fraction:
+        bodies = remove_site_boilerplate(
+            [segments[0][0] if segments else '' for segments in pages],
+            template_fraction)
+        pages = [[(body, 1)] + segments[1:] if segments else []
+                 for body, segments in zip(bodies, pages)]
+    texts = {}
+    for i, segments in enumerate(pages):
+        factor = hp_weight if i == 0 and hp_weight > 1 else 1
+        for text, weight in segments:
+            if text:
+                texts.setdefault(weight * factor, []).append(text)
+    return [(' '.join(texts[weight]), weight) for weight in sorted(texts)]
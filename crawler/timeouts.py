@@ -0,0 +1,134 @@
+""" Wall-clock time limits for CPU-bound work, based on SIGALRM.
+
+    Usage example:
+
+        >>> try:
+        ...     with time_limit(5):
+        ...         text = extract_text(doc)
+        ... except TimeLimitExceeded:
+        ...     text = ''
+
+    The limit interrupts Python code only and is a no-op outside the main
+    thread, where signals cannot be handled. `call_isolated` runs a function
+    in a forked child process instead, which is killed when its time is over.
+"""
+from cPickle import dumps, loads, HIGHEST_PROTOCOL
+import os
+import select
+import signal
+import threading
+import time
+
+
+class TimeLimitExceeded(BaseException):
+    """ Raised inside a `time_limit` block when its time is over. Derives
+        from BaseException so that `except Exception` clauses in the
+        interrupted code do not swallow it.
+    """
+    pass
+
+
+class IsolatedTimeLimitExceeded(TimeLimitExceeded):
+    """ Raised by `call_isolated` when the child process ran out of time.
+    """
+    pass
+
+
+def _raise_time_limit_exceeded(signum, frame):
+    raise TimeLimitExceeded()
+
+
+class time_limit(object):
+    """ Context manager that raises `TimeLimitExceeded` if its block runs
+        longer than `seconds`. None or 0 means no limit. Limits can be
+        nested; an inner limit never extends an outer one.
+    """
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.active = False
+        self.clipped = False
+
+    def __enter__(self):
+        # `active` and `clipped` describe the last use of the limit and are
+        # kept after the block, so that `owns` can be called on the
+        # exception it raised
+        self.active = False
+        self.clipped = False
+        if not self.seconds or not isinstance(threading.current_thread(),
+                                              threading._MainThread):
+            return self
+        self.active = True
+        self.start = time.time()
+        self.old_handler = signal.signal(
+            signal.SIGALRM, _raise_time_limit_exceeded)
+        self.old_delay = signal.setitimer(signal.ITIMER_REAL, self.seconds)[0]
+        if self.old_delay and self.old_delay < self.seconds:
+            signal.setitimer(signal.ITIMER_REAL, self.old_delay)
+            self.clipped = True
+        return self
+
+    def owns(self, exc):
+        """ Check if the `TimeLimitExceeded` exception `exc`, raised in the
+            block, was raised by this limit and not by an enclosing one that
+            ends earlier. An inactive limit (no time set, or outside the
+            main thread) owns no exception.
+        """
+        return (self.active and not self.clipped and
+                isinstance(exc, TimeLimitExceeded))
+
+    def __exit__(self, *args):
+        if not self.active:
+            return False
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, self.old_handler)
+        if self.old_delay:
+            remaining = self.old_delay - (time.time() - self.start)
+            signal.setitimer(signal.ITIMER_REAL, max(remaining, 1e-6))
+        return False
+
+
+def call_isolated(seconds, func, *args):
+    """ Call `func(*args)` in a forked child process and return its result,
+        which must be picklable. If the call takes longer than `seconds`
+        (None means no limit), the child is killed and
+        `IsolatedTimeLimitExceeded` is raised. An exception raised by `func` is raised again as a
+        `RuntimeError`. Unlike `time_limit`, this also stops code that does
+        not return to the interpreter, and it works in any thread.
+    """
+    r, w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(r)
+        try:
+            try:
+                data = dumps((True, func(*args)), HIGHEST_PROTOCOL)
+            except BaseException, err:
+                data = dumps((False, repr(err)), HIGHEST_PROTOCOL)
+            while data:
+                data = data[os.write(w, data):]
+        finally:
+            os._exit(0)
+    os.close(w)
+    deadline = time.time() + seconds if seconds else None
+    chunks = []
+    done = False
+    try:
+        while not done:
+            timeout = (max(0, deadline - time.time())
+                       if deadline is not None else None)
+            if not select.select([r], [], [], timeout)[0]:
+                raise IsolatedTimeLimitExceeded()
+            chunk = os.read(r, 65536)
+            chunks.append(chunk)
+            done = not chunk
+    finally:
+        os.close(r)
+        if not done:
+            os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    if len(chunks) == 1:
+        raise RuntimeError('Isolated call died without a result')
+    ok, result = loads(''.join(chunks))
+    if not ok:
+        raise RuntimeError(result)
+    return result
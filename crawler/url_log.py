@@ -0,0 +1,169 @@
+""" Append-only log of URL records (e.g. redirects or error URLs) that can be
+    shared by several processes.
+
+    Every record is a tuple of unicode strings, stored as a 4-byte length
+    followed by the NUL-separated UTF-8 fields. Appends are buffered in
+    memory and written in batches under an exclusive lock of the file, so
+    records of concurrent writers never interleave. Readers do not lock:
+    they consume the complete records past their last read position and
+    leave a partially written record for the next read.
+
+    Usage example:
+
+        >>> log = UrlLog('redirects.log')
+        >>> log.append((url1, url2))
+        >>> log.flush()
+        >>> for url1, url2 in log.read_new():
+        ...     print url1, url2
+
+"""
+import atexit
+import errno
+import fcntl
+import os
+import struct
+import threading
+import time
+import weakref
+
+LENGTH = struct.Struct('>I')
+
+# Logs whose buffers are written when the process exits
+_logs = weakref.WeakSet()
+
+
+def _flush_logs():
+    """ Flush all live logs, except those whose directory was removed. """
+    for log in list(_logs):
+        try:
+            log.flush()
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+
+atexit.register(_flush_logs)
+
+
+def encode_record(fields):
+    data = '\0'.join(f.encode('utf8') for f in fields)
+    return LENGTH.pack(len(data)) + data
+
+
+class UrlLog(object):
+    """ Buffered, lock-protected append-only record log. """
+    def __init__(self, filename, buffer_size=64, fsync_interval=1.0,
+                 refresh_interval=0):
+        """ :param filename: Path of the log file.
+            :param buffer_size: Number of appended records that triggers a
+                write to the file.
+            :param fsync_interval: Minimum number of seconds between two
+                fsyncs of the file. Writes in between are only flushed to
+                the operating system.
+            :param refresh_interval: Minimum number of seconds between two
+                reads of the file by `read_new` that are not forced.
+        """
+        self.filename = filename
+        self.buffer_size = buffer_size
+        self.fsync_interval = fsync_interval
+        self.refresh_interval = refresh_interval
+        self.buffer = []
+        self.pos = 0
+        self.last_fsync = 0
+        self.last_read = 0
+        self.lock = threading.Lock()
+        _logs.add(self)
+
+    def append(self, fields):
+        """ Buffer a record given as a tuple of unicode strings. """
+        with self.lock:
+            self.buffer.append(encode_record(fields))
+            if len(self.buffer) >= self.buffer_size:
+                self._write()
+
+    def flush(self):
+        """ Write the buffered records to the file. """
+        with self.lock:
+            self._write()
+
+    def _write(self):
+        if not self.buffer:
+            return
+        with open(self.filename, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.write(''.join(self.buffer))
+                f.flush()
+                if time.time() - self.last_fsync >= self.fsync_interval:
+                    os.fsync(f.fileno())
+                    self.last_fsync = time.time()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+        self.buffer = []
+
+    def migrate(self, records):
+        """ Write `records` (an iterable of tuples) to the log if it is still
+            empty, e.g. to convert an older file format. The check and the
+            write happen under the file lock, so only one of several
+            concurrent processes migrates.
+        """
+        with self.lock:
+            with open(self.filename, 'ab') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    if os.fstat(f.fileno()).st_size == 0:
+                        f.write(''.join(encode_record(r) for r in records))
+                        os.fsync(f.fileno())
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def size(self):
+        """ Return the size of the log file in bytes. """
+        try:
+            return os.stat(self.filename).st_size
+        except OSError:
+            return 0
+
+    def _read(self, start):
+        """ Return the complete records from the file position `start` on
+            and the number of bytes they take.
+        """
+        if self.size() <= start:
+            return [], 0
+        with open(self.filename, 'rb') as f:
+            f.seek(start)
+            data = f.read()
+        records = []
+        pos = 0
+        while pos + LENGTH.size <= len(data):
+            length, = LENGTH.unpack_from(data, pos)
+            end = pos + LENGTH.size + length
+            if end > len(data):
+                break
+            records.append(tuple(
+                field.decode('utf8') for field in
+                data[pos + LENGTH.size:end].split('\0')))
+            pos = end
+        return records, pos
+
+    def read_new(self, force=False):
+        """ Return the records written to the file since the last call. If
+            the last read was less than `refresh_interval` seconds ago, the
+            file is not checked and no records are returned, unless `force`
+            is True.
+        """
+        with self.lock:
+            now = time.time()
+            if not force and now - self.last_read < self.refresh_interval:
+                return []
+            self.last_read = now
+            records, length = self._read(self.pos)
+            self.pos += length
+            return records
+
+    def read_all(self):
+        """ Return all records written to the file, without changing the
+            position of `read_new`.
+        """
+        with self.lock:
+            return self._read(0)[0]
@@ -0,0 +1,312 @@
+""" Export and import of the crawler page cache as WARC files, so that a
+    crawl can be shipped to other machines and replayed there without
+    fetching any page again.
+
+    Every cached page becomes a `response` record. The record holds an HTTP
+    response with the page as body and the cached validators (ETag,
+    Last-Modified) as headers, and its WARC-Date is the fetch time of the
+    page. Redirects and error URLs become `metadata` records with the fields
+    `crawler-redirect` and `crawler-error`. By default every record is
+    compressed as its own gzip member (`.warc.gz`), so that the file can be
+    read sequentially or split at record boundaries.
+
+    `import_warc` reads files written by `export_warc` as well as other
+    WARC files: `response` records with a 2xx status and `resource` records
+    are cached, 3xx responses are recorded as redirects and 4xx/5xx
+    responses as error URLs. Bodies are cached as stored, i.e. no transfer
+    or content encoding is undone.
+
+    Usage example:
+
+        >>> export_warc(crawl.get_crawler_io(), 'crawl.warc.gz')
+        >>> import_warc(IoSqlite('crawler.db'), 'crawl.warc.gz')
+
+    or with the configured backend:
+
+        python -m crawler.warc export crawl.warc.gz
+        python -m crawler.warc import crawl.warc.gz
+
+"""
+import argparse
+import base64
+import calendar
+import gzip
+import hashlib
+import time
+import uuid
+import warnings
+from cStringIO import StringIO
+from urlparse import urljoin
+
+WARC_VERSION = 'WARC/1.1'
+
+
+class WarcRecord(object):
+    """ A WARC record: its type, target URI, date (seconds since the
+        epoch), header fields (a dictionary with lowercase names) and
+        content block.
+    """
+    def __init__(self, warc_type, uri, date, headers, block):
+        self.type = warc_type
+        self.uri = uri
+        self.date = date
+        self.headers = headers
+        self.block = block
+
+
+def format_date(seconds):
+    """ Format seconds since the epoch as a WARC-Date (UTC, microseconds). """
+    fraction = int(round((seconds % 1) * 1e6))
+    if fraction == 1000000:
+        seconds, fraction = seconds + 1, 0
+    return '%s.%06dZ' % (time.strftime('%Y-%m-%dT%H:%M:%S',
+                                       time.gmtime(int(seconds))), fraction)
+
+
+def parse_date(s):
+    """ Parse a WARC-Date into seconds since the epoch. """
+    s = s.rstrip('Z')
+    fraction = 0.0
+    if '.' in s:
+        s, digits = s.split('.', 1)
+        fraction = float('0.' + digits)
+    return calendar.timegm(time.strptime(s, '%Y-%m-%dT%H:%M:%S')) + fraction
+
+
+def parse_fields(data):
+    """ Parse `name: value` lines into a dictionary with lowercase names. """
+    fields = {}
+    for line in data.split('\n'):
+        if ':' in line:
+            name, value = line.split(':', 1)
+            fields[name.strip().lower()] = value.strip()
+    return fields
+
+
+def parse_http_response(block):
+    """ Return the status code, headers (lowercase names) and body of the
+        HTTP response in `block`.
+    """
+    head, sep, body = block.partition('\r\n\r\n')
+    if not sep:
+        head, sep, body = block.partition('\n\n')
+    status_line, _, header_lines = head.partition('\n')
+    parts = status_line.split(None, 2)
+    status = int(parts[1]) if len(parts) > 1 and parts[1].isdigit() else 0
+    return status, parse_fields(header_lines), body
+
+
+def _utf8(s):
+    return s.encode('utf8') if isinstance(s, unicode) else s
+
+
+class WarcWriter(object):
+    """ Write WARC records to a file object. """
+    def __init__(self, f, compress=True):
+        """ :param f: File object opened for binary writing.
+            :param compress: If True, every record is written as its own gzip
+                member.
+        """
+        self.f = f
+        self.compress = compress
+
+    def write(self, warc_type, uri, block, date=None, content_type=None,
+              fields=None):
+        """ Write a record and return its size in bytes. """
+        headers = [('WARC-Type', warc_type),
+                   ('WARC-Record-ID', '<urn:uuid:%s>' % uuid.uuid4()),
+                   ('WARC-Date', format_date(
+                       date if date is not None else time.time()))]
+        if uri is not None:
+            headers.append(('WARC-Target-URI', _utf8(uri)))
+        if content_type is not None:
+            headers.append(('Content-Type', content_type))
+        headers.extend(fields or [])
+        headers.append(('Content-Length', str(len(block))))
+        data = ''.join(
+            [WARC_VERSION, '\r\n'] +
+            ['%s: %s\r\n' % (name, value) for name, value in headers] +
+            ['\r\n', block, '\r\n\r\n'])
+        if self.compress:
+            buf = StringIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as member:
+                member.write(data)
+            data = buf.getvalue()
+        self.f.write(data)
+        return len(data)
+
+    def write_info(self):
+        self.write('warcinfo', None,
+                   'software: crawler.warc\r\n'
+                   'format: WARC File Format 1.1\r\n',
+                   content_type='application/warc-fields')
+
+    def write_page(self, url, value, meta=None):
+        """ Write a cached page as a `response` record with a 200 status. """
+        body = _utf8(value)
+        meta = meta or {}
+        http = ['HTTP/1.1 200 OK', 'Content-Length: %d' % len(body)]
+        if meta.get('etag'):
+            http.append('ETag: %s' % meta['etag'])
+        if meta.get('last_modified'):
+            http.append('Last-Modified: %s' % meta['last_modified'])
+        digest = base64.b32encode(hashlib.sha1(body).digest())
+        return self.write(
+            'response', url, '\r\n'.join(http) + '\r\n\r\n' + body,
+            date=meta.get('fetched'),
+            content_type='application/http; msgtype=response',
+            fields=[('WARC-Payload-Digest', 'sha1:' + digest)])
+
+    def write_redirect(self, url1, url2):
+        return self.write('metadata', url1,
+                          'crawler-redirect: %s\r\n' % _utf8(url2),
+                          content_type='application/warc-fields')
+
+    def write_error(self, url):
+        return self.write('metadata', url, 'crawler-error: true\r\n',
+                          content_type='application/warc-fields')
+
+
+def iter_records(f):
+    """ Iterate over the `WarcRecord`s of a file object of an uncompressed
+        WARC file or of a gzip stream, which may have one member per record.
+    """
+    while True:
+        line = f.readline()
+        while line in ('\r\n', '\n'):
+            line = f.readline()
+        if not line:
+            return
+        if not line.startswith('WARC/'):
+            raise ValueError('Invalid WARC record header %r' % line[:40])
+        headers = {}
+        line = f.readline()
+        while line.rstrip('\r\n'):
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+            line = f.readline()
+        length = int(headers['content-length'])
+        block = f.read(length)
+        if len(block) < length:
+            raise ValueError('Truncated WARC record')
+        uri = headers.get('warc-target-uri')
+        if uri is not None:
+            uri = uri.strip('<>').decode('utf8')
+        date = headers.get('warc-date')
+        yield WarcRecord(headers.get('warc-type'), uri,
+                         parse_date(date) if date else None, headers, block)
+
+
+def open_warc(filename):
+    """ Open a WARC file for reading, decompressing it if it is gzipped. """
+    with open(filename, 'rb') as f:
+        magic = f.read(2)
+    if magic == '\x1f\x8b':
+        return gzip.open(filename, 'rb')
+    return open(filename, 'rb')
+
+
+def export_warc(crawler_io, filename, compress=True):
+    """ Write the cached pages, redirects and error URLs of a crawler I/O
+        backend to the WARC file `filename`. Pages are read one at a time.
+        Pages of an `IoFs` cache whose keys are not listed (see
+        `IoFs.count_unlisted`) cannot be exported; a warning tells how many
+        were left out.
+
+        :return: A dictionary with the number of exported pages, redirects
+            and errors.
+    """
+    counts = {'pages': 0, 'redirects': 0, 'errors': 0}
+    crawler_io.flush()
+    with open(filename, 'wb') as f:
+        writer = WarcWriter(f, compress)
+        writer.write_info()
+        for key in crawler_io.iter_keys():
+            value = crawler_io.load_str(key)
+            if value is None:
+                continue
+            writer.write_page(key, value, crawler_io.load_meta(key))
+            counts['pages'] += 1
+        for url1, url2 in crawler_io.iter_redirects():
+            writer.write_redirect(url1, url2)
+            counts['redirects'] += 1
+        for url in crawler_io.iter_error_urls():
+            writer.write_error(url)
+            counts['errors'] += 1
+    unlisted = getattr(crawler_io, 'count_unlisted', lambda: 0)()
+    if unlisted:
+        warnings.warn('%d cached pages were saved before their keys were '
+                      'logged and are not exported' % unlisted)
+    return counts
+
+
+def import_warc(crawler_io, filename):
+    """ Load the records of the WARC file `filename` into a crawler I/O
+        backend (see the module documentation).
+
+        :return: A dictionary with the number of imported pages, redirects
+            and errors.
+    """
+    counts = {'pages': 0, 'redirects': 0, 'errors': 0}
+    f = open_warc(filename)
+    try:
+        for record in iter_records(f):
+            if record.uri is None:
+                continue
+            if record.type == 'metadata':
+                fields = parse_fields(record.block)
+                if 'crawler-redirect' in fields:
+                    crawler_io.add_redirect(
+                        record.uri, fields['crawler-redirect'].decode('utf8'))
+                    counts['redirects'] += 1
+                if fields.get('crawler-error') == 'true':
+                    crawler_io.add_error_url(record.uri)
+                    counts['errors'] += 1
+                continue
+            if record.type == 'resource':
+                status, headers, body = 200, {}, record.block
+            elif record.type == 'response':
+                status, headers, body = parse_http_response(record.block)
+            else:
+                continue
+            if 200 <= status < 300:
+                crawler_io.save_str(record.uri, body)
+                crawler_io.save_meta(record.uri, {
+                    'etag': headers.get('etag'),
+                    'last_modified': headers.get('last-modified'),
+                    'fetched': record.date})
+                counts['pages'] += 1
+            elif 300 <= status < 400 and headers.get('location'):
+                crawler_io.add_redirect(record.uri, urljoin(
+                    record.uri, headers['location'].decode('utf8')))
+                counts['redirects'] += 1
+            elif status >= 400:
+                crawler_io.add_error_url(record.uri)
+                counts['errors'] += 1
+    finally:
+        f.close()
+        crawler_io.flush()
+    return counts
+
+
+def main():
+    from crawler.crawl import get_crawler_io
+    parser = argparse.ArgumentParser(
+        description='Export or import the crawler cache of the configured '
+                    'backend as a WARC file.')
+    parser.add_argument('command', choices=['export', 'import'])
+    parser.add_argument('filename')
+    parser.add_argument('--uncompressed', action='store_true',
+                        help='write an uncompressed WARC file')
+    args = parser.parse_args()
+    if args.command == 'export':
+        counts = export_warc(get_crawler_io(), args.filename,
+                             not args.uncompressed)
+    else:
+        counts = import_warc(get_crawler_io(), args.filename)
+    print '%(pages)d pages, %(redirects)d redirects, %(errors)d errors' % \
+        counts
+
+
+if __name__ == '__main__':
+    main()